@@ -1,6 +1,12 @@
-from typing import Generic, TypeVar, Type, Optional, List, Any
-from sqlmodel import Session, select
+import json
+import base64
+from datetime import datetime
+from typing import Generic, TypeVar, Type, Optional, List, Any, Tuple
+from sqlmodel import Session, select, func
 from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import tuple_, literal
+from sqlalchemy.dialects import postgresql, sqlite
 from uuid import UUID
 
 ModelType = TypeVar("ModelType", bound=SQLModel)
@@ -8,6 +14,72 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=SQLModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=SQLModel)
 
 
+# ==================== PAGINACIÓN POR CURSOR (KEYSET) ====================
+def encode_cursor(value: Any, id: UUID) -> str:
+    """Cursor opaco con el valor de orden y el id del último registro de la página"""
+    if isinstance(value, datetime):
+        payload = {"t": "dt", "v": value.isoformat(), "id": str(id)}
+    else:
+        payload = {"v": value, "id": str(id)}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, UUID]:
+    """Leer un cursor generado por encode_cursor (ValueError si es inválido)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = payload["v"]
+        if payload.get("t") == "dt":
+            value = datetime.fromisoformat(value)
+        return value, UUID(payload["id"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Cursor inválido") from exc
+
+
+def apply_keyset(
+    statement,
+    *,
+    sort_column,
+    id_column,
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = False
+):
+    """
+    Ordenar por (columna, id) y continuar después del cursor, todo en SQL
+    
+    Pide limit + 1 filas para saber si hay página siguiente (ver keyset_page).
+    """
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        # Literales con el tipo de cada columna (p. ej. UUID en SQLite)
+        after = tuple_(literal(value, sort_column.type), literal(last_id, id_column.type))
+        if descending:
+            statement = statement.where(tuple_(sort_column, id_column) < after)
+        else:
+            statement = statement.where(tuple_(sort_column, id_column) > after)
+    if descending:
+        statement = statement.order_by(sort_column.desc(), id_column.desc())
+    else:
+        statement = statement.order_by(sort_column.asc(), id_column.asc())
+    return statement.limit(limit + 1)
+
+
+def keyset_page(rows: List[Any], *, limit: int, sort_attr: str) -> Tuple[List[Any], Optional[str]]:
+    """Recortar la fila extra y armar el cursor de la página siguiente"""
+    if len(rows) <= limit:
+        return list(rows), None
+    page = list(rows[:limit])
+    last = page[-1]
+    return page, encode_cursor(getattr(last, sort_attr), last.id)
+
+
+# ==================== UPSERT ====================
+def dialect_insert(db: Session):
+    """insert() con soporte ON CONFLICT del motor en uso"""
+    return sqlite.insert if db.get_bind().dialect.name == "sqlite" else postgresql.insert
+
+
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
         """
@@ -33,8 +105,8 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         statement = select(self.model).offset(skip).limit(limit)
         return db.exec(statement).all()
 
-    def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
-        """Crear un nuevo registro"""
+    def _build(self, obj_in: CreateSchemaType) -> ModelType:
+        """Construir la instancia del modelo a partir del esquema de entrada"""
         # Soporta tanto Pydantic (model_dump) como SQLModel (dict)
         if hasattr(obj_in, 'model_dump'):
             obj_in_data = obj_in.model_dump()
@@ -42,7 +114,24 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             obj_in_data = obj_in.dict()
         else:
             obj_in_data = dict(obj_in)
-        db_obj = self.model(**obj_in_data)
+        return self.model(**obj_in_data)
+
+    def _apply_update(self, db_obj: ModelType, obj_in: UpdateSchemaType | dict[str, Any]) -> ModelType:
+        """Copiar los campos enviados sobre el registro existente"""
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        elif hasattr(obj_in, 'model_dump'):
+            update_data = obj_in.model_dump(exclude_unset=True)
+        else:
+            update_data = obj_in.dict(exclude_unset=True)
+
+        for field, value in update_data.items():
+            setattr(db_obj, field, value)
+        return db_obj
+
+    def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
+        """Crear un nuevo registro"""
+        db_obj = self._build(obj_in)
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
@@ -56,14 +145,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj_in: UpdateSchemaType | dict[str, Any]
     ) -> ModelType:
         """Actualizar un registro existente"""
-        if isinstance(obj_in, dict):
-            update_data = obj_in
-        else:
-            update_data = obj_in.model_dump(exclude_unset=True)
-        
-        for field, value in update_data.items():
-            setattr(db_obj, field, value)
-        
+        self._apply_update(db_obj, obj_in)
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
@@ -78,5 +160,57 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
     def count(self, db: Session) -> int:
         """Contar total de registros"""
-        statement = select(self.model)
-        return len(db.exec(statement).all())
\ No newline at end of file
+        statement = select(func.count()).select_from(self.model)
+        return db.exec(statement).one()
+
+    # ==================== VERSIONES ASÍNCRONAS ====================
+    async def get_async(self, db: AsyncSession, id: UUID) -> Optional[ModelType]:
+        """Obtener un registro por ID (sesión asíncrona)"""
+        return await db.get(self.model, id)
+
+    async def get_multi_async(
+        self,
+        db: AsyncSession,
+        *,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[ModelType]:
+        """Obtener múltiples registros con paginación (sesión asíncrona)"""
+        statement = select(self.model).offset(skip).limit(limit)
+        result = await db.exec(statement)
+        return result.all()
+
+    async def create_async(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
+        """Crear un nuevo registro (sesión asíncrona)"""
+        db_obj = self._build(obj_in)
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update_async(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: ModelType,
+        obj_in: UpdateSchemaType | dict[str, Any]
+    ) -> ModelType:
+        """Actualizar un registro existente (sesión asíncrona)"""
+        self._apply_update(db_obj, obj_in)
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def delete_async(self, db: AsyncSession, *, id: UUID) -> ModelType:
+        """Eliminar un registro (sesión asíncrona)"""
+        obj = await db.get(self.model, id)
+        await db.delete(obj)
+        await db.commit()
+        return obj
+
+    async def count_async(self, db: AsyncSession) -> int:
+        """Contar total de registros (sesión asíncrona)"""
+        statement = select(func.count()).select_from(self.model)
+        result = await db.exec(statement)
+        return result.one()
\ No newline at end of file
@@ -2,8 +2,9 @@
 CRUD para módulos de Caja y Clientes
 Archivo: backend/app/crud/crud_cash_customers.py
 """
-from typing import Optional, List
-from sqlmodel import Session, select
+from typing import Optional, List, Tuple
+from sqlmodel import Session, select, func
+from sqlalchemy import case, or_, delete, insert, update, literal
 from uuid import UUID
 from datetime import datetime
 
@@ -11,9 +12,9 @@ from app.models.models import (
     CashRegister, CashRegisterSession, PaymentMethod, CashTransaction,
     SalePayment, CashCount, CashCountDetail, Customer, CustomerPreference,
     LoyaltyTransaction, CustomerNotification, SessionStatus, TransactionType,
-    LoyaltyTransactionType
+    LoyaltyTransactionType, CustomerStats, Sale, SaleStatus
 )
-from .base_crud import CRUDBase
+from .base_crud import CRUDBase, dialect_insert
 
 
 # ==================== CAJA ====================
@@ -236,6 +237,128 @@ class CRUDCustomer(CRUDBase[Customer, Customer, Customer]):
         return db.exec(statement).all()
 
 
+# Orden disponible para el ranking de clientes (columna de customer_stats)
+CUSTOMER_STATS_SORTS = {
+    "total_spent": CustomerStats.total_spent,
+    "order_count": CustomerStats.order_count,
+    "average_ticket": CustomerStats.average_ticket,
+    "last_purchase": CustomerStats.last_purchase_at,
+}
+
+
+class CRUDCustomerStats(CRUDBase[CustomerStats, CustomerStats, CustomerStats]):
+    def apply_sales(self, db: Session, *, sales: List[Sale], sign: int = 1) -> None:
+        """
+        Sumar (sign=1) o restar (sign=-1) ventas en las estadísticas de sus clientes
+
+        Corre dentro de la transacción de la venta o la cancelación con un
+        INSERT ... ON CONFLICT DO UPDATE por lote. Al restar, la última compra
+        se recalcula sin las ventas retiradas.
+        """
+        totals: dict[UUID, list] = {}
+        for sale in sales:
+            if not sale.customer_id:
+                continue
+            entry = totals.setdefault(sale.customer_id, [0, 0.0, sale.sale_date])
+            entry[0] += sign
+            entry[1] += sign * sale.total_amount
+            entry[2] = max(entry[2], sale.sale_date)
+        if not totals:
+            return
+
+        now = datetime.utcnow()
+        records = [
+            {
+                "customer_id": customer_id,
+                "order_count": count,
+                "total_spent": spent,
+                "average_ticket": spent / count if count > 0 else 0.0,
+                "last_purchase_at": last if sign > 0 else None,
+                "updated_at": now
+            }
+            for customer_id, (count, spent, last) in sorted(totals.items())
+        ]
+        table = CustomerStats.__table__
+        statement = dialect_insert(db)(table)
+        excluded = statement.excluded
+        count = table.c.order_count + excluded.order_count
+        spent = table.c.total_spent + excluded.total_spent
+        set_ = {
+            "order_count": count,
+            "total_spent": spent,
+            "average_ticket": case((count > 0, spent / count), else_=0.0),
+            "updated_at": excluded.updated_at,
+        }
+        if sign > 0:
+            set_["last_purchase_at"] = case(
+                (
+                    or_(table.c.last_purchase_at.is_(None), excluded.last_purchase_at > table.c.last_purchase_at),
+                    excluded.last_purchase_at
+                ),
+                else_=table.c.last_purchase_at
+            )
+        db.execute(statement.on_conflict_do_update(index_elements=["customer_id"], set_=set_), records)
+
+        if sign < 0:
+            last_purchase = select(func.max(Sale.sale_date)).where(
+                Sale.customer_id == CustomerStats.customer_id,
+                Sale.status == SaleStatus.completada,
+                Sale.id.notin_([sale.id for sale in sales])
+            ).scalar_subquery()
+            db.execute(
+                update(CustomerStats)
+                .where(CustomerStats.customer_id.in_(list(totals)))
+                .values(last_purchase_at=last_purchase)
+                .execution_options(synchronize_session=False)
+            )
+
+    def get_top(
+        self,
+        db: Session,
+        *,
+        sort: str = "total_spent",
+        limit: int = 10,
+        active_only: bool = True
+    ) -> List[Tuple[Customer, Optional[CustomerStats]]]:
+        """
+        Clientes ordenados en SQL con sus estadísticas, en una consulta
+
+        `sort` es una llave de CUSTOMER_STATS_SORTS (solo clientes con compras,
+        recorre el índice de la columna) o loyalty_points.
+        """
+        if sort == "loyalty_points":
+            statement = (
+                select(Customer, CustomerStats)
+                .outerjoin(CustomerStats, CustomerStats.customer_id == Customer.id)
+                .order_by(Customer.loyalty_points.desc(), Customer.id)
+            )
+        else:
+            statement = (
+                select(Customer, CustomerStats)
+                .join(CustomerStats, CustomerStats.customer_id == Customer.id)
+                .where(CustomerStats.order_count > 0)
+                .order_by(CUSTOMER_STATS_SORTS[sort].desc(), Customer.id)
+            )
+        if active_only:
+            statement = statement.where(Customer.is_active == True)
+        return db.exec(statement.limit(limit)).all()
+
+    def rebuild(self, db: Session) -> int:
+        """Recalcular todas las estadísticas desde sales con un INSERT ... SELECT (sin commit)"""
+        db.execute(delete(CustomerStats))
+        spent = func.sum(Sale.total_amount)
+        count = func.count(Sale.id)
+        return db.execute(insert(CustomerStats).from_select(
+            ["customer_id", "order_count", "total_spent", "average_ticket", "last_purchase_at", "updated_at"],
+            select(
+                Sale.customer_id, count, spent, spent / count, func.max(Sale.sale_date),
+                literal(datetime.utcnow())
+            )
+            .where(Sale.customer_id.isnot(None), Sale.status == SaleStatus.completada)
+            .group_by(Sale.customer_id)
+        )).rowcount
+
+
 class CRUDCustomerPreference(CRUDBase[CustomerPreference, CustomerPreference, CustomerPreference]):
     def get_by_customer(self, db: Session, *, customer_id: UUID) -> List[CustomerPreference]:
         """Obtener preferencias de un cliente"""
@@ -307,6 +430,7 @@ cash_count_detail = CRUDCashCountDetail(CashCountDetail)
 
 # Instancias globales - CLIENTES
 customer = CRUDCustomer(Customer)
+customer_stats = CRUDCustomerStats(CustomerStats)
 customer_preference = CRUDCustomerPreference(CustomerPreference)
 loyalty_transaction = CRUDLoyaltyTransaction(LoyaltyTransaction)
 customer_notification = CRUDCustomerNotification(CustomerNotification)
\ No newline at end of file
@@ -0,0 +1,711 @@
+"""
+Métricas del dashboard con caché en memoria.
+
+Cada entrada vive `DASHBOARD_CACHE_TTL` segundos y declara las tablas de las
+que depende; el commit de una sesión que escribió en alguna de ellas (ventas,
+inventario, clientes, catálogo) la descarta. Peticiones simultáneas de la
+misma llave esperan el cálculo en curso en vez de repetirlo.
+
+Las ventas, movimientos de inventario y productos nuevos se publican al
+confirmarse en un hub en memoria que los empuja a los dashboards conectados
+por Server-Sent Events, filtrados por rol.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from typing import Any, Callable, Iterable, Optional
+from uuid import UUID
+
+from sqlalchemy import event, case
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select, func
+
+from app.models.models import (
+    Product, User, Supplier, Customer, Sale, InventoryMovement, CashRegisterSession,
+    CashTransaction, PurchaseOrder, ProductReceptionDetail, SalesHourlyRollup
+)
+from app.models.enums import SessionStatus, OrderStatus
+from .products_crud import product
+from .sale_crud import sales_rollup
+
+
+# Cota de desactualización; también cubre escrituras hechas en otros workers
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+
+# Espera máxima de una petición por el cálculo que ya hace otra
+DASHBOARD_CACHE_WAIT = float(os.getenv("DASHBOARD_CACHE_WAIT", "30"))
+
+# Tablas que invalidan cada bloque del dashboard
+METRICS_TABLES = (
+    "sales_rollup_daily", "products", "product_stock", "users", "suppliers", "customers"
+)
+SALES_SUMMARY_TABLES = ("sales_rollup_daily", "sales_rollup_hourly", "product_sales_rollup", "products")
+CASHIER_TABLES = (
+    "sales_rollup_daily", "sales_rollup_hourly", "sales", "cash_register_sessions", "cash_transactions"
+)
+WAREHOUSE_TABLES = (
+    "products", "product_stock", "purchase_orders", "product_reception_details", "suppliers"
+)
+ACCOUNTANT_TABLES = ("sales_rollup_daily", "sales_rollup_hourly", "sales", "cash_register_sessions", "users")
+
+# Órdenes de compra que todavía esperan recepción
+PENDING_ORDER_STATUSES = (OrderStatus.pendiente, OrderStatus.enviado)
+
+# Eventos pendientes de entrega por suscriptor; al llenarse se pide recargar
+DASHBOARD_STREAM_QUEUE = int(os.getenv("DASHBOARD_STREAM_QUEUE", "500"))
+
+# Segundos entre comentarios de keep-alive del stream
+DASHBOARD_STREAM_HEARTBEAT = 15
+
+# Roles (normalizados como en RoleChecker) que reciben cada tipo de evento
+DASHBOARD_EVENT_ROLES = {
+    "venta": {"ADMINISTRADOR", "CAJERO", "CONTADOR"},
+    "movimiento": {"ADMINISTRADOR", "INVENTARIO", "CONTADOR"},
+    "producto": {"ADMINISTRADOR", "INVENTARIO", "CAJERO"},
+}
+
+# Roles que solo reciben sus propios eventos cuando el evento tiene usuario
+# (el cajero ve sus ventas, pero todos los productos nuevos)
+OWN_EVENTS_ONLY = {"CAJERO"}
+
+# Llaves de session.info con lo escrito en la transacción en curso
+_TOUCHED_TABLES = "dashboard_touched_tables"
+_PENDING_EVENTS = "dashboard_pending_events"
+
+
+class _Flight:
+    """Cálculo en curso de una llave, compartido con quienes la piden a la vez"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.value: Any = None
+
+
+class MetricsCache:
+    """
+    Caché con TTL, invalidación por tabla y coalescencia de cálculos
+
+    Cada tabla tiene una versión que sube al invalidarla; un cálculo que empezó
+    antes de la invalidación entrega su resultado a quienes lo esperaban pero
+    no lo guarda.
+    """
+
+    def __init__(self, ttl: float, wait_timeout: float):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._entries: dict[str, tuple[float, Any, frozenset]] = {}
+        self._flights: dict[str, _Flight] = {}
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: str, tables: Iterable[str], compute: Callable[[], Any]) -> Any:
+        """Valor vigente de la llave, o calcularlo una sola vez entre peticiones simultáneas"""
+        tables = frozenset(tables)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                    return entry[1]
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    versions = self._snapshot(tables)
+
+            if not leader:
+                flight.done.wait(self.wait_timeout)
+                if flight.ok:
+                    return flight.value
+                # El cálculo falló o tardó demasiado: reintentar
+                continue
+
+            try:
+                value = compute()
+                flight.value, flight.ok = value, True
+                return value
+            finally:
+                with self._lock:
+                    if flight.ok and self._snapshot(tables) == versions:
+                        self._entries[key] = (time.monotonic(), flight.value, tables)
+                    self._flights.pop(key, None)
+                flight.done.set()
+
+    def invalidate_tables(self, tables: Iterable[str]) -> None:
+        """Descartar las entradas que dependen de alguna de las tablas"""
+        tables = set(tables)
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            stale = [key for key, (_, _, depends) in self._entries.items() if depends & tables]
+            for key in stale:
+                del self._entries[key]
+
+    def invalidate(self) -> None:
+        """Descartar todo lo guardado"""
+        with self._lock:
+            for table in self._versions:
+                self._versions[table] += 1
+            self._entries.clear()
+
+    def _snapshot(self, tables: frozenset) -> tuple:
+        return tuple(self._versions.get(table, 0) for table in sorted(tables))
+
+
+dashboard_cache = MetricsCache(DASHBOARD_CACHE_TTL, DASHBOARD_CACHE_WAIT)
+
+
+# ==================== EVENTOS EN VIVO ====================
+
+class DashboardSubscriber:
+    """Conexión de un dashboard: cola en su event loop, rol y usuario"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, role: str, user_id: str):
+        self.loop = loop
+        self.role = role
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=DASHBOARD_STREAM_QUEUE)
+        self.lagged = False
+
+    def accepts(self, activity: dict) -> bool:
+        if self.role not in DASHBOARD_EVENT_ROLES.get(activity["tipo"], ()):
+            return False
+        owner = activity.get("user_id")
+        return self.role not in OWN_EVENTS_ONLY or owner is None or owner == self.user_id
+
+
+class DashboardEventHub:
+    """
+    Pub/sub en memoria (por worker) para los dashboards conectados
+
+    `publish` se llama desde el commit, en cualquier hilo; la entrega pasa al
+    event loop de cada suscriptor. Un suscriptor lento que llena su cola pierde
+    eventos y recibe un aviso de recarga en su lugar.
+    """
+
+    def __init__(self):
+        self._subscribers: set[DashboardSubscriber] = set()
+        self._lock = threading.Lock()
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, role: str, user_id: str) -> DashboardSubscriber:
+        """Registrar una conexión (llamar desde el event loop que la atiende)"""
+        subscriber = DashboardSubscriber(asyncio.get_running_loop(), role, user_id)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: DashboardSubscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, events: list[dict]) -> None:
+        """Entregar eventos ya confirmados a los suscriptores que los aceptan"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            accepted = [activity for activity in events if subscriber.accepts(activity)]
+            if accepted:
+                try:
+                    subscriber.loop.call_soon_threadsafe(self._deliver, subscriber, accepted)
+                except RuntimeError:
+                    # El event loop del suscriptor ya se cerró
+                    self.unsubscribe(subscriber)
+
+    @staticmethod
+    def _deliver(subscriber: DashboardSubscriber, events: list[dict]) -> None:
+        for activity in events:
+            try:
+                subscriber.queue.put_nowait(activity)
+            except asyncio.QueueFull:
+                subscriber.lagged = True
+                return
+
+
+dashboard_events = DashboardEventHub()
+
+
+def activity_event(obj: Any) -> Optional[dict]:
+    """Evento del dashboard para un registro nuevo (venta, movimiento o producto)"""
+    if isinstance(obj, Sale):
+        return {
+            "tipo": "venta",
+            "user_id": str(obj.cashier_id),
+            "title": "Venta completada",
+            "description": f"Total: ${obj.total_amount:.2f}",
+            "type": "venta",
+            "timestamp": obj.sale_date.isoformat(),
+            "data": {
+                "id": str(obj.id),
+                "sale_number": obj.sale_number,
+                "total_amount": obj.total_amount,
+                "cash_register_id": str(obj.cash_register_id),
+            },
+        }
+    if isinstance(obj, InventoryMovement):
+        movement_type = getattr(obj.movement_type, "value", obj.movement_type)
+        return {
+            "tipo": "movimiento",
+            "user_id": str(obj.user_id),
+            "title": "Movimiento de inventario",
+            "description": f"{movement_type}: {obj.quantity} unidades",
+            "type": "inventario",
+            "timestamp": obj.created_at.isoformat(),
+            "data": {
+                "product_id": str(obj.product_id),
+                "movement_type": movement_type,
+                "quantity": obj.quantity,
+                "new_stock": obj.new_stock,
+                "reference_document": obj.reference_document,
+            },
+        }
+    if isinstance(obj, Product):
+        return {
+            "tipo": "producto",
+            "user_id": None,
+            "title": "Nuevo producto agregado",
+            "description": obj.name,
+            "type": "producto",
+            "timestamp": obj.created_at.isoformat(),
+            "data": {"id": str(obj.id), "sku": obj.sku, "name": obj.name},
+        }
+    return None
+
+
+async def stream_events(role: str, user_id: str):
+    """
+    Mensajes SSE para un dashboard hasta que el cliente se desconecta
+
+    No consulta la base: espera en su cola y envía un keep-alive si no hay
+    eventos. Tras perder eventos envía `recargar` para que el cliente pida de
+    nuevo las métricas.
+    """
+    subscriber = dashboard_events.subscribe(role, user_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                activity = await asyncio.wait_for(subscriber.queue.get(), DASHBOARD_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if subscriber.lagged:
+                subscriber.lagged = False
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                yield "event: recargar\ndata: {}\n\n"
+                continue
+            payload = {key: value for key, value in activity.items() if key not in ("tipo", "user_id")}
+            yield f"event: {activity['tipo']}\ndata: {json.dumps(payload)}\n\n"
+    finally:
+        dashboard_events.unsubscribe(subscriber)
+
+
+# ==================== INVALIDACIÓN POR ESCRITURA ====================
+# Se registran las tablas escritas (flush del ORM e INSERT/UPDATE/DELETE
+# ejecutados con session.execute) y se invalidan al confirmar la transacción.
+# Otros cachés (reportes) reciben las mismas tablas con on_tables_committed.
+
+_commit_listeners: list[Callable[[set[str]], None]] = []
+
+
+def on_tables_committed(callback: Callable[[set[str]], None]) -> None:
+    """Llamar `callback(tablas)` después de cada commit que escribió en alguna tabla"""
+    _commit_listeners.append(callback)
+
+
+def _touch(session, tables: Iterable[str]) -> None:
+    session.info.setdefault(_TOUCHED_TABLES, set()).update(tables)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_flush(session, flush_context):
+    _touch(session, {
+        obj.__table__.name
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if hasattr(obj, "__table__")
+    })
+    queue_activity(session, session.new)
+
+
+def queue_activity(session, objects: Iterable[Any]) -> None:
+    """
+    Encolar eventos de registros nuevos para publicarlos con el commit
+
+    El flush del ORM lo hace solo; llamarlo para filas escritas con
+    sentencias de Core (p. ej. el upsert de la importación de productos).
+    """
+    # Sin dashboards conectados no se arma ningún evento
+    if dashboard_events.has_subscribers():
+        events = [activity for activity in map(activity_event, objects) if activity]
+        if events:
+            session.info.setdefault(_PENDING_EVENTS, []).extend(events)
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _track_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _touch(orm_execute_state.session, {table.name})
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_on_commit(session):
+    touched = session.info.pop(_TOUCHED_TABLES, None)
+    if touched:
+        dashboard_cache.invalidate_tables(touched)
+        for callback in _commit_listeners:
+            callback(touched)
+    events = session.info.pop(_PENDING_EVENTS, None)
+    if events:
+        dashboard_events.publish(events)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_TOUCHED_TABLES, None)
+    session.info.pop(_PENDING_EVENTS, None)
+
+
+# ==================== MÉTRICAS ====================
+
+def compute_metrics(db: Session) -> dict:
+    """Métricas principales: ventas de hoy, conteos del catálogo y stock bajo"""
+    # Ventas de hoy: una fila del rollup diario por caja y cajero
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    ventas_hoy = sales_rollup.totals(db, start=today_start)["total_amount"]
+
+    # Conteos en una sola consulta
+    total_productos, total_usuarios, total_proveedores, total_clientes = db.exec(select(
+        select(func.count(Product.id)).scalar_subquery(),
+        select(func.count(User.id)).where(User.is_active == True).scalar_subquery(),
+        select(func.count(Supplier.id)).where(Supplier.is_active == True).scalar_subquery(),
+        select(func.count(Customer.id)).where(Customer.is_active == True).scalar_subquery(),
+    )).one()
+
+    # Stock bajo: indicador is_low de product_stock, misma consulta que las alertas
+    stock_bajo = product.count_low_stock(db)
+
+    return {
+        "ventas_hoy": float(ventas_hoy),
+        "total_productos": total_productos or 0,
+        "total_usuarios": total_usuarios or 0,
+        "total_proveedores": total_proveedores or 0,
+        "total_clientes": total_clientes or 0,
+        "stock_bajo": stock_bajo
+    }
+
+
+def get_metrics(db: Session) -> dict:
+    """Métricas del dashboard desde el caché"""
+    return dashboard_cache.get_or_compute("metrics", METRICS_TABLES, lambda: compute_metrics(db))
+
+
+def compute_sales_summary(db: Session, days: int) -> dict:
+    """Resumen de ventas de los últimos `days` días desde los rollups"""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+
+    # Días completos desde el rollup diario, el resto del primer día desde el horario
+    totals = sales_rollup.totals(db, start=start_date)
+    total_sales = totals["total_amount"]
+    count_sales = totals["sales_count"]
+
+    # Promedio de venta
+    avg_sale = float(total_sales) / count_sales if count_sales > 0 else 0.0
+
+    # Productos más vendidos del periodo (días completos)
+    top = sales_rollup.top_products(db, start_date=start_date.date(), limit=5)
+    names = dict(db.exec(
+        select(Product.id, Product.name).where(Product.id.in_([pid for pid, _, _ in top]))
+    ).all()) if top else {}
+
+    return {
+        "period_days": days,
+        "total_sales": float(total_sales),
+        "count_sales": count_sales,
+        "average_sale": avg_sale,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "sales_by_day": {
+            day: {"count": values["sales_count"], "total": values["total_amount"]}
+            for day, values in totals["by_day"].items()
+        },
+        "top_products": [
+            {"product_id": str(pid), "name": names.get(pid), "quantity": quantity, "total": total}
+            for pid, quantity, total in top
+        ]
+    }
+
+
+def get_sales_summary(db: Session, days: int) -> dict:
+    """Resumen de ventas desde el caché (una entrada por cantidad de días)"""
+    return dashboard_cache.get_or_compute(
+        f"sales-summary:{days}", SALES_SUMMARY_TABLES, lambda: compute_sales_summary(db, days)
+    )
+
+
+# ==================== DASHBOARDS POR ROL ====================
+
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def compute_cashier_dashboard(db: Session, user_id: UUID) -> dict:
+    """
+    Sesión de caja abierta del cajero con sus totales y ventas por hora de hoy
+
+    Las ventas de la sesión salen de los rollups (solo los minutos de los
+    extremos se leen de sales) y las horas de hoy de sales_rollup_hourly.
+    """
+    now = datetime.utcnow()
+    today = now.date()
+
+    sesion = None
+    open_session = db.exec(
+        select(CashRegisterSession).where(
+            CashRegisterSession.user_id == user_id,
+            CashRegisterSession.status == SessionStatus.abierta
+        )
+    ).first()
+    if open_session:
+        transactions = {
+            getattr(kind, "value", kind): {"count": count, "total": float(total or 0)}
+            for kind, count, total in db.exec(
+                select(CashTransaction.transaction_type, func.count(CashTransaction.id), func.sum(CashTransaction.amount))
+                .where(CashTransaction.session_id == open_session.id)
+                .group_by(CashTransaction.transaction_type)
+            ).all()
+        }
+        # Mismo cálculo que el cierre de caja
+        expected = open_session.opening_amount + sum(
+            values["total"] for kind, values in transactions.items() if kind in ("ingreso", "venta")
+        ) - transactions.get("egreso", {}).get("total", 0.0)
+        totals = sales_rollup.totals(db, start=open_session.opening_date, cashier_id=user_id)
+        sesion = {
+            "id": str(open_session.id),
+            "cash_register_id": str(open_session.cash_register_id),
+            "opening_date": open_session.opening_date.isoformat(),
+            "opening_amount": open_session.opening_amount,
+            "ventas_count": totals["sales_count"],
+            "ventas_total": float(totals["total_amount"]),
+            "descuentos": float(totals["discount_amount"]),
+            "impuestos": float(totals["tax_amount"]),
+            "ticket_promedio": float(totals["total_amount"]) / totals["sales_count"] if totals["sales_count"] else 0.0,
+            "transacciones": transactions,
+            "monto_esperado": expected,
+        }
+
+    by_hour = {
+        hour: (count or 0, float(total or 0))
+        for hour, count, total in db.exec(
+            select(SalesHourlyRollup.hour, func.sum(SalesHourlyRollup.sales_count), func.sum(SalesHourlyRollup.total_amount))
+            .where(SalesHourlyRollup.business_date == today, SalesHourlyRollup.cashier_id == user_id)
+            .group_by(SalesHourlyRollup.hour)
+        ).all()
+    }
+
+    return {
+        "fecha": today.isoformat(),
+        "sesion": sesion,
+        "ventas_hoy": {
+            "count": sum(count for count, _ in by_hour.values()),
+            "total": sum(total for _, total in by_hour.values()),
+        },
+        "ventas_por_hora": [
+            {"hour": hour, "count": by_hour.get(hour, (0, 0.0))[0], "total": by_hour.get(hour, (0, 0.0))[1]}
+            for hour in range(now.hour + 1)
+        ],
+    }
+
+
+def compute_warehouse_dashboard(db: Session, *, days: int, limit: int) -> dict:
+    """Stock bajo, órdenes de compra por recibir y lotes que vencen en `days` días"""
+    now = datetime.utcnow()
+    horizon = now + timedelta(days=days)
+    expiring = (
+        ProductReceptionDetail.expiration_date >= now,
+        ProductReceptionDetail.expiration_date <= horizon,
+    )
+
+    pending_count, expiring_count = db.exec(select(
+        select(func.count(PurchaseOrder.id)).where(PurchaseOrder.status.in_(PENDING_ORDER_STATUSES)).scalar_subquery(),
+        select(func.count(ProductReceptionDetail.id)).where(*expiring).scalar_subquery(),
+    )).one()
+
+    low_stock = product.get_low_stock(db, limit=limit)
+
+    orders = db.exec(
+        select(PurchaseOrder, Supplier.business_name)
+        .join(Supplier, Supplier.id == PurchaseOrder.supplier_id)
+        .where(PurchaseOrder.status.in_(PENDING_ORDER_STATUSES))
+        .order_by(PurchaseOrder.expected_delivery_date.is_(None), PurchaseOrder.expected_delivery_date, PurchaseOrder.order_date)
+        .limit(limit)
+    ).all()
+
+    lots = db.exec(
+        select(ProductReceptionDetail, Product.name, Product.sku)
+        .join(Product, Product.id == ProductReceptionDetail.product_id)
+        .where(*expiring)
+        .order_by(ProductReceptionDetail.expiration_date)
+        .limit(limit)
+    ).all()
+
+    return {
+        "stock_bajo": {
+            "total": product.count_low_stock(db),
+            "productos": [
+                {
+                    "id": str(item.id),
+                    "sku": item.sku,
+                    "name": item.name,
+                    "quantity": quantity,
+                    "stock_min": item.stock_min,
+                }
+                for item, quantity in low_stock
+            ],
+        },
+        "recepciones_pendientes": {
+            "total": pending_count or 0,
+            "ordenes": [
+                {
+                    "id": str(order.id),
+                    "order_number": order.order_number,
+                    "supplier": supplier_name,
+                    "status": getattr(order.status, "value", order.status),
+                    "order_date": order.order_date.isoformat(),
+                    "expected_delivery_date": order.expected_delivery_date.isoformat() if order.expected_delivery_date else None,
+                    "total_amount": order.total_amount,
+                }
+                for order, supplier_name in orders
+            ],
+        },
+        "lotes_por_vencer": {
+            "dias": days,
+            "total": expiring_count or 0,
+            "lotes": [
+                {
+                    "product_id": str(lot.product_id),
+                    "name": name,
+                    "sku": sku,
+                    "lot_number": lot.lot_number,
+                    "expiration_date": lot.expiration_date.isoformat(),
+                    "quantity_received": lot.quantity_received,
+                }
+                for lot, name, sku in lots
+            ],
+        },
+    }
+
+
+def compute_accountant_dashboard(db: Session, *, start: datetime, end: Optional[datetime], limit: int) -> dict:
+    """Ingresos e impuestos del periodo desde los rollups y diferencias de las cajas cerradas en él"""
+    totals = sales_rollup.totals(db, start=start, end=end)
+
+    closed = [
+        CashRegisterSession.status == SessionStatus.cerrada,
+        CashRegisterSession.closing_date >= start,
+    ]
+    if end:
+        closed.append(CashRegisterSession.closing_date <= end)
+    difference = CashRegisterSession.difference
+    sessions, with_difference, net, shortage, surplus = db.exec(
+        select(
+            func.count(CashRegisterSession.id),
+            func.count(case((difference != 0, CashRegisterSession.id))),
+            func.sum(difference),
+            func.sum(case((difference < 0, difference), else_=0)),
+            func.sum(case((difference > 0, difference), else_=0)),
+        ).where(*closed)
+    ).one()
+
+    largest = db.exec(
+        select(CashRegisterSession, User.first_name, User.last_name)
+        .join(User, User.id == CashRegisterSession.user_id)
+        .where(*closed, difference != 0)
+        .order_by(func.abs(difference).desc())
+        .limit(limit)
+    ).all()
+
+    return {
+        "fecha_inicio": start.isoformat(),
+        "fecha_fin": end.isoformat() if end else None,
+        "ingresos": {
+            "ventas": totals["sales_count"],
+            "subtotal": float(totals["subtotal"]),
+            "descuentos": float(totals["discount_amount"]),
+            "impuestos": float(totals["tax_amount"]),
+            "total": float(totals["total_amount"]),
+            "neto_sin_impuestos": float(totals["total_amount"]) - float(totals["tax_amount"]),
+            "por_dia": {
+                day: {"count": values["sales_count"], "total": values["total_amount"]}
+                for day, values in totals["by_day"].items()
+            },
+        },
+        "diferencias_caja": {
+            "sesiones_cerradas": sessions or 0,
+            "sesiones_con_diferencia": with_difference or 0,
+            "diferencia_neta": float(net or 0),
+            "faltantes": float(shortage or 0),
+            "sobrantes": float(surplus or 0),
+            "mayores": [
+                {
+                    "session_id": str(cash_session.id),
+                    "cash_register_id": str(cash_session.cash_register_id),
+                    "cajero": f"{first_name} {last_name}",
+                    "closing_date": cash_session.closing_date.isoformat(),
+                    "expected_closing_amount": cash_session.expected_closing_amount,
+                    "actual_closing_amount": cash_session.actual_closing_amount,
+                    "difference": cash_session.difference,
+                }
+                for cash_session, first_name, last_name in largest
+            ],
+        },
+    }
+
+
+def get_cashier_dashboard(db: Session, user_id: UUID) -> dict:
+    """Dashboard del cajero desde el caché (una entrada por cajero)"""
+    return dashboard_cache.get_or_compute(
+        f"cajero:{user_id}", CASHIER_TABLES, lambda: compute_cashier_dashboard(db, user_id)
+    )
+
+
+def get_warehouse_dashboard(db: Session, *, days: int = 30, limit: int = 10) -> dict:
+    """Dashboard de almacén desde el caché"""
+    return dashboard_cache.get_or_compute(
+        f"almacen:{days}:{limit}", WAREHOUSE_TABLES,
+        lambda: compute_warehouse_dashboard(db, days=days, limit=limit)
+    )
+
+
+def get_accountant_dashboard(
+    db: Session,
+    *,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 10
+) -> dict:
+    """
+    Dashboard del contador desde el caché; sin `start` toma el mes en curso
+
+    ValueError si el periodo es inválido.
+    """
+    start, end = _utc_naive(start), _utc_naive(end)
+    if start is None:
+        start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if end and end < start:
+        raise ValueError("La fecha de inicio debe ser anterior a la fecha de fin")
+    return dashboard_cache.get_or_compute(
+        f"contador:{start.isoformat()}:{end.isoformat() if end else ''}:{limit}", ACCOUNTANT_TABLES,
+        lambda: compute_accountant_dashboard(db, start=start, end=end, limit=limit)
+    )
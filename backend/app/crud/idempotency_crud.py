@@ -0,0 +1,123 @@
+"""
+Registro de Idempotency-Key: guarda la respuesta de una operación de escritura
+para devolverla tal cual cuando el cliente reintenta la misma solicitud.
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from uuid import UUID
+
+from sqlmodel import Session, select
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models.models import IdempotencyKey
+from .base_crud import CRUDBase
+
+
+class CRUDIdempotencyKey(CRUDBase[IdempotencyKey, IdempotencyKey, IdempotencyKey]):
+    def get_by_key(self, db: Session, *, user_id: UUID, key: str) -> Optional[IdempotencyKey]:
+        """Obtener el registro de una llave del usuario"""
+        return db.get(IdempotencyKey, (user_id, key))
+
+    def claim(
+        self,
+        db: Session,
+        *,
+        user_id: UUID,
+        key: str,
+        endpoint: str,
+        request_hash: str,
+        ttl_seconds: int,
+        lease_seconds: Optional[int] = None
+    ) -> Tuple[IdempotencyKey, bool]:
+        """
+        Reservar la llave antes de ejecutar la operación (sin commit: lo hace el llamador)
+        
+        Una llave vencida, o en proceso desde hace más de `lease_seconds` (el
+        intento que la tomó murió sin confirmar), se toma con un único UPDATE
+        condicional: si dos reintentos la encuentran abandonada a la vez, solo
+        uno la actualiza y el otro la ve en proceso.
+        
+        Returns:
+            (registro, creado). Si otro intento ya la reservó se devuelve el
+            registro existente con creado=False.
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        record = IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            endpoint=endpoint,
+            request_hash=request_hash,
+            created_at=now,
+            expires_at=expires_at
+        )
+        db.add(record)
+        try:
+            db.flush()
+            return record, True
+        except IntegrityError:
+            db.rollback()
+
+        stale = IdempotencyKey.expires_at <= now
+        if lease_seconds is not None:
+            stale = or_(stale, and_(
+                IdempotencyKey.status != "completado",
+                IdempotencyKey.created_at <= now - timedelta(seconds=lease_seconds)
+            ))
+        result = db.exec(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, stale)
+            .values(
+                endpoint=endpoint,
+                request_hash=request_hash,
+                status="en_proceso",
+                response_code=None,
+                response_body=None,
+                created_at=now,
+                expires_at=expires_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+        existing = self.get_by_key(db, user_id=user_id, key=key)
+        if existing is not None:
+            # Lo que haya en el mapa de identidad es anterior al UPDATE
+            db.refresh(existing)
+        return existing, bool(result.rowcount)
+
+    def stage(self, db: Session, *, record: IdempotencyKey, status_code: int, body) -> None:
+        """Marcar la llave completada con su respuesta, sin commit (va con la operación)"""
+        record.status = "completado"
+        record.response_code = status_code
+        record.response_body = json.dumps(body)
+        db.add(record)
+
+    def complete(self, db: Session, *, record: IdempotencyKey, status_code: int, body) -> None:
+        """Guardar la respuesta de la operación ya confirmada"""
+        self.stage(db, record=record, status_code=status_code, body=body)
+        db.commit()
+
+    def release(self, db: Session, *, user_id: UUID, key: str) -> None:
+        """Liberar la llave cuando la operación falló, para permitir reintentos"""
+        db.rollback()
+        db.exec(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    def purge_expired(self, db: Session) -> int:
+        """Eliminar en una sola sentencia las llaves vencidas"""
+        result = db.exec(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.expires_at < datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+
+# Instancia global
+idempotency_key = CRUDIdempotencyKey(IdempotencyKey)
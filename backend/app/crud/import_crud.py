@@ -0,0 +1,274 @@
+"""
+Importación masiva de productos desde CSV o XLSX (upsert por SKU).
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from typing import Iterable, Iterator, Any
+from uuid import uuid4
+
+from sqlmodel import Session, select
+
+from app.models.models import Product, Category, Brand, Supplier
+from .base_crud import CRUDBase, dialect_insert
+from .numbering_crud import document_counter
+from .products_crud import build_search_text, product_lookup_cache
+from .inventario_crud import product_stock
+from .dashboard_crud import dashboard_events, queue_activity
+
+
+# Filas por lote (un INSERT ... ON CONFLICT ejecutado en bloque y un commit)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Errores de fila que se devuelven en el detalle (el conteo siempre es total)
+IMPORT_MAX_ERRORS = 1000
+
+# Columnas del archivo que se copian al producto, con su conversión
+IMPORT_COLUMNS = {
+    "name": str,
+    "barcode": str,
+    "description": str,
+    "unit_of_measure": str,
+    "sale_price": float,
+    "cost_price": float,
+    "tax_rate": float,
+    "stock_min": float,
+    "stock_max": float,
+    "weight": float,
+    "requires_lot_control": bool,
+    "requires_expiration_date": bool,
+    "is_active": bool,
+}
+
+# Columnas que se resuelven por nombre: columna del archivo -> (campo, modelo, atributo)
+IMPORT_LOOKUPS = {
+    "category": ("category_id", Category, "name"),
+    "brand": ("brand_id", Brand, "name"),
+    "supplier": ("main_supplier_id", Supplier, "business_name"),
+}
+
+# Obligatorias solo para productos nuevos; los existentes aceptan archivos parciales
+# (por ejemplo una lista de precios con sku, cost_price y sale_price)
+REQUIRED_FOR_NEW = ("name", "cost_price", "sale_price")
+
+_TRUE_VALUES = {"1", "true", "si", "sí", "s", "yes", "y", "x"}
+_FALSE_VALUES = {"0", "false", "no", "n"}
+
+
+def _parse(value: Any, kind: type) -> Any:
+    if kind is float:
+        if isinstance(value, (int, float)):
+            return float(value)
+        return float(str(value).strip().replace(",", "."))
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in _TRUE_VALUES:
+            return True
+        if text in _FALSE_VALUES:
+            return False
+        raise ValueError(f"valor booleano no reconocido '{value}'")
+    return str(value).strip()
+
+
+def iter_csv_rows(stream) -> Iterator[dict]:
+    """Filas de un CSV binario (UTF-8, separador ',' o ';') sin cargarlo completo"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    first_line = text.readline()
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+    header = next(csv.reader([first_line], delimiter=delimiter), [])
+    reader = csv.DictReader(text, fieldnames=[h.strip().lower() for h in header], delimiter=delimiter)
+    for row in reader:
+        yield row
+
+
+def iter_xlsx_rows(stream) -> Iterator[dict]:
+    """Filas de la primera hoja de un XLSX (modo read_only de openpyxl)"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(h).strip().lower() if h is not None else "" for h in next(rows, ())]
+        for values in rows:
+            if values and any(v is not None for v in values):
+                yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_product_rows(stream, filename: str) -> Iterator[dict]:
+    """Elegir el lector según la extensión del archivo"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return iter_csv_rows(stream)
+    if name.endswith(".xlsx"):
+        return iter_xlsx_rows(stream)
+    raise ValueError("Formato no soportado, use .csv o .xlsx")
+
+
+class CRUDProductImport(CRUDBase[Product, Product, Product]):
+    def import_rows(
+        self,
+        db: Session,
+        *,
+        rows: Iterable[dict],
+        batch_size: int = IMPORT_BATCH_SIZE
+    ) -> dict:
+        """
+        Crear o actualizar productos por SKU desde filas de un archivo
+
+        Categoría, marca y proveedor se indican por nombre (category, brand,
+        supplier) y se resuelven con una consulta por tabla. Cada lote es un
+        INSERT ... ON CONFLICT (sku) con una sola versión del catálogo y un
+        commit. Las filas con error se informan y no detienen la importación.
+        """
+        lookups = {
+            column: {
+                str(key).strip().lower(): id_
+                for id_, key in db.exec(select(model.id, getattr(model, attr))).all()
+                if key
+            }
+            for column, (_, model, attr) in IMPORT_LOOKUPS.items()
+        }
+        summary = {"total": 0, "created": 0, "updated": 0, "error_count": 0, "errors": []}
+        seen: set[str] = set()
+        batch: list[tuple[int, dict]] = []
+
+        for line, raw in enumerate(rows, start=2):
+            summary["total"] += 1
+            try:
+                values = self._row_values(raw, lookups)
+                if values["sku"] in seen:
+                    raise ValueError(f"SKU '{values['sku']}' repetido en el archivo")
+                seen.add(values["sku"])
+            except ValueError as e:
+                self._add_error(summary, line, raw, str(e))
+                continue
+            batch.append((line, values))
+            if len(batch) >= batch_size:
+                self._flush(db, batch, summary)
+                batch = []
+
+        if batch:
+            self._flush(db, batch, summary)
+        summary["errors"].sort(key=lambda error: error["row"])
+        if summary["created"] or summary["updated"]:
+            product_lookup_cache.invalidate()
+        return summary
+
+    def _row_values(self, raw: dict, lookups: dict) -> dict:
+        """Convertir una fila del archivo en campos del producto (ValueError si es inválida)"""
+        sku = str(raw.get("sku") or "").strip()
+        if not sku:
+            raise ValueError("Falta el SKU")
+        values: dict[str, Any] = {"sku": sku}
+        for column, kind in IMPORT_COLUMNS.items():
+            value = raw.get(column)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+            try:
+                values[column] = _parse(value, kind)
+            except ValueError:
+                raise ValueError(f"Valor inválido en '{column}': {value}")
+        for column, (field, _, _) in IMPORT_LOOKUPS.items():
+            value = raw.get(column)
+            if value is None or not str(value).strip():
+                continue
+            found = lookups[column].get(str(value).strip().lower())
+            if found is None:
+                raise ValueError(f"No existe {column} '{value}'")
+            values[field] = found
+        return values
+
+    def _flush(self, db: Session, batch: list[tuple[int, dict]], summary: dict) -> None:
+        """Escribir un lote con INSERT ... ON CONFLICT (sku) DO UPDATE y un solo commit"""
+        existing = {
+            sku: (name, barcode)
+            for sku, name, barcode in db.exec(
+                select(Product.sku, Product.name, Product.barcode)
+                .where(Product.sku.in_([values["sku"] for _, values in batch]))
+            ).all()
+        }
+
+        to_write = []
+        created = 0
+        for line, values in batch:
+            current = existing.get(values["sku"])
+            if current is None:
+                missing = [field for field in REQUIRED_FOR_NEW if field not in values]
+                if missing:
+                    self._add_error(summary, line, values, f"Producto nuevo sin: {', '.join(missing)}")
+                    continue
+                created += 1
+            to_write.append((values, current))
+        if not to_write:
+            return
+
+        version = document_counter.next_catalog_version(db)
+        now = datetime.utcnow()
+        # Una celda vacía conserva el valor actual: las filas se agrupan por
+        # columnas informadas y cada grupo actualiza solo las suyas
+        groups: dict[frozenset, list] = {}
+        for values, current in to_write:
+            name = values.get("name", current[0] if current else None)
+            barcode = values.get("barcode", current[1] if current else None)
+            record = {**_INSERT_DEFAULTS, **values}
+            # La fila propuesta debe cumplir NOT NULL aunque termine en UPDATE
+            record.update(
+                id=uuid4(),
+                name=name,
+                search_text=build_search_text(name, values["sku"], barcode),
+                catalog_version=version,
+                created_at=now,
+                updated_at=now,
+            )
+            groups.setdefault(frozenset(values), []).append(record)
+
+        insert = dialect_insert(db)
+        for columns, records in groups.items():
+            # executemany: la sentencia se compila una vez (psycopg2 la envía con execute_values)
+            statement = insert(Product)
+            update_columns = (columns - {"sku"}) | {"search_text", "catalog_version", "updated_at"}
+            statement = statement.on_conflict_do_update(
+                index_elements=[Product.sku],
+                set_={column: statement.excluded[column] for column in update_columns}
+            )
+            db.execute(statement, records)
+        # Saldo para los productos nuevos y umbral de stock bajo al día
+        batch_skus = Product.sku.in_([values["sku"] for values, _ in to_write])
+        product_stock.ensure_rows(db, where=batch_skus)
+        if any("stock_min" in values for values, current in to_write if current):
+            product_stock.sync_thresholds(db, where=batch_skus)
+        # El upsert no pasa por el flush del ORM: los productos nuevos se
+        # avisan a los dashboards conectados aquí
+        new_skus = [values["sku"] for values, current in to_write if current is None]
+        if new_skus and dashboard_events.has_subscribers():
+            queue_activity(db, db.exec(select(Product).where(Product.sku.in_(new_skus))).all())
+        db.commit()
+
+        summary["created"] += created
+        summary["updated"] += len(to_write) - created
+
+    def _add_error(self, summary: dict, line: int, raw: dict, message: str) -> None:
+        summary["error_count"] += 1
+        if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+            summary["errors"].append({
+                "row": line,
+                "sku": str((raw or {}).get("sku") or "").strip() or None,
+                "error": message
+            })
+
+
+# Valores por defecto de las columnas que el archivo no trae (productos nuevos)
+_INSERT_DEFAULTS = {
+    name: field.default
+    for name, field in Product.__fields__.items()
+    if name not in ("id", "created_at", "updated_at") and field.default_factory is None
+}
+
+
+# Instancia global
+product_import = CRUDProductImport(Product)
@@ -1,13 +1,25 @@
 from typing import Optional, List
-from sqlmodel import Session, select
+from sqlmodel import Session, select, func
+from sqlalchemy import case, delete, update, insert, literal
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from app.models.models import (
     Inventory, Location, InventoryMovement, ProductReception,
-    ProductReceptionDetail, ProductLabel, MovementType
+    ProductReceptionDetail, ProductLabel, MovementType, StockReservation, ProductStock, Product
 )
 from .base_crud import CRUDBase
+from .numbering_crud import document_counter
+
+
+def _amount_by_id(amounts: dict[UUID, float]):
+    """CASE inventory.id WHEN ... THEN cantidad: un solo UPDATE para varias filas"""
+    return case(
+        *[(Inventory.id == inventory_id, amount) for inventory_id, amount in amounts.items()],
+        else_=0
+    )
 
 
 class CRUDInventory(CRUDBase[Inventory, Inventory, Inventory]):
@@ -52,11 +64,13 @@ class CRUDInventory(CRUDBase[Inventory, Inventory, Inventory]):
         )
         
         if inventory:
+            delta = quantity - inventory.quantity
             inventory.quantity = quantity
             inventory.last_updated = datetime.utcnow()
             inventory.updated_by = user_id
             db.add(inventory)
         else:
+            delta = quantity
             inventory = Inventory(
                 product_id=product_id,
                 location_id=location_id,
@@ -65,14 +79,389 @@ class CRUDInventory(CRUDBase[Inventory, Inventory, Inventory]):
             )
             db.add(inventory)
         
+        product_stock.apply_deltas(db, deltas={product_id: delta})
         db.commit()
         db.refresh(inventory)
         return inventory
     
+    def get_primary_rows(self, db: Session, *, product_ids: List[UUID]) -> dict[UUID, Inventory]:
+        """Fila de inventario de la que se descuenta cada producto (la primera por id)"""
+        statement = select(Inventory).where(
+            Inventory.product_id.in_(product_ids)
+        ).order_by(Inventory.product_id, Inventory.id)
+        rows: dict[UUID, Inventory] = {}
+        for row in db.exec(statement).all():
+            rows.setdefault(row.product_id, row)
+        return rows
+    
+    def decrement_stock_atomic(
+        self,
+        db: Session,
+        *,
+        decrements: dict[UUID, float],
+        user_id: UUID
+    ) -> bool:
+        """
+        Descontar stock de varias filas con un único UPDATE condicional
+        
+        `decrements` mapea inventory_id -> cantidad. Cada fila solo se descuenta
+        si su disponible (quantity - reserved_quantity) alcanza; no se toma
+        ningún bloqueo previo. Retorna False si alguna fila no alcanzó: el
+        llamador debe hacer rollback porque las demás sí se descontaron.
+        No hace commit.
+        """
+        amount = _amount_by_id(decrements)
+        result = db.exec(
+            update(Inventory)
+            .where(
+                Inventory.id.in_(list(decrements)),
+                Inventory.quantity - Inventory.reserved_quantity >= amount
+            )
+            .values(
+                quantity=Inventory.quantity - amount,
+                last_updated=datetime.utcnow(),
+                updated_by=user_id
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == len(decrements)
+    
+    def set_quantity_atomic(
+        self,
+        db: Session,
+        *,
+        product_id: UUID,
+        quantity: float,
+        user_id: UUID
+    ) -> tuple[Inventory, float]:
+        """
+        Fijar la cantidad de la fila principal del producto (ver get_primary_rows)
+        
+        El UPDATE va condicionado a la cantidad leída: si una venta descontó
+        entre la lectura y la escritura no afecta filas, se relee y se reintenta,
+        así el ajuste nunca pisa un descuento y la diferencia que se registra
+        es la real. Crea la fila si el producto no tiene inventario.
+        Retorna (fila, cantidad anterior). No hace commit.
+        """
+        while True:
+            row = self.get_primary_rows(db, product_ids=[product_id]).get(product_id)
+            if row is None:
+                row = Inventory(
+                    product_id=product_id,
+                    quantity=quantity,
+                    last_updated=datetime.utcnow(),
+                    updated_by=user_id
+                )
+                db.add(row)
+                db.flush()
+                return row, 0
+            previous = row.quantity
+            result = db.exec(
+                update(Inventory)
+                .where(Inventory.id == row.id, Inventory.quantity == previous)
+                .values(quantity=quantity, last_updated=datetime.utcnow(), updated_by=user_id)
+                .execution_options(synchronize_session=False)
+            )
+            # La fila del mapa de identidad quedó vieja en ambos casos
+            db.expire(row)
+            if result.rowcount:
+                return row, previous
+    
     def get_total_stock_by_product(self, db: Session, *, product_id: UUID) -> float:
         """Obtener stock total de un producto (todas las ubicaciones)"""
-        inventories = self.get_by_product(db, product_id=product_id)
-        return sum(inv.quantity for inv in inventories)
+        return product_stock.get_map(db, product_ids=[product_id]).get(product_id, 0)
+
+
+class CRUDProductStock(CRUDBase[ProductStock, ProductStock, ProductStock]):
+    def get_map(self, db: Session, *, product_ids: List[UUID]) -> dict[UUID, float]:
+        """Saldo de stock de varios productos por clave primaria"""
+        if not product_ids:
+            return {}
+        return dict(db.exec(
+            select(ProductStock.product_id, ProductStock.quantity)
+            .where(ProductStock.product_id.in_(product_ids))
+        ).all())
+    
+    async def get_map_async(self, db: AsyncSession, *, product_ids: List[UUID]) -> dict[UUID, float]:
+        """Versión asíncrona de get_map"""
+        if not product_ids:
+            return {}
+        return dict((await db.exec(
+            select(ProductStock.product_id, ProductStock.quantity)
+            .where(ProductStock.product_id.in_(product_ids))
+        )).all())
+    
+    def apply_deltas(self, db: Session, *, deltas: dict[UUID, float]) -> None:
+        """
+        Sumar `deltas` (product_id -> cambio de cantidad) a los saldos
+        
+        Debe llamarse en la misma transacción que modifica el inventario.
+        Un solo UPDATE para todos los productos; los que aún no tienen saldo
+        se crean con la suma de su inventario. Los saldos tocados toman la
+        versión de la transacción (ver _version_stamp). No hace commit.
+        """
+        deltas = {pid: delta for pid, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        amount = case(
+            *[(ProductStock.product_id == pid, delta) for pid, delta in deltas.items()],
+            else_=0
+        )
+        result = db.exec(
+            update(ProductStock)
+            .where(ProductStock.product_id.in_(list(deltas)))
+            .values(
+                quantity=ProductStock.quantity + amount,
+                is_low=ProductStock.quantity + amount <= ProductStock.stock_min,
+                stock_version=self._version_stamp(db),
+                updated_at=datetime.utcnow()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(deltas):
+            # Ya incluye el cambio en curso: se calcula desde el inventario
+            db.flush()
+            self.ensure_rows(db, where=Product.id.in_(list(deltas)))
+    
+    def _version_stamp(self, db: Session):
+        """
+        Versión de los saldos escritos en la transacción en curso
+        
+        En Postgres es el id de la transacción: no toma ningún bloqueo, así
+        las ventas y ajustes no se esperan entre sí (el contador del catálogo
+        serializaría todo el checkout). SQLite ya serializa las escrituras y
+        usa el contador del catálogo.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            return func.txid_current()
+        return literal(document_counter.next_catalog_version(db))
+    
+    def current_version(self, db: Session) -> int:
+        """
+        Versión hasta la que los saldos están completos
+        
+        Con ids de transacción, una menor que el xmin de la instantánea ya
+        terminó: ninguna transacción en curso confirmará después un saldo con
+        versión menor o igual a la devuelta.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            return db.execute(select(func.txid_snapshot_xmin(func.txid_current_snapshot()) - 1)).scalar()
+        return document_counter.current_catalog_version(db)
+    
+    def ensure_rows(self, db: Session, *, where=None) -> None:
+        """
+        Crear los saldos que falten (suma del inventario, umbral del producto)
+        
+        `where` es una condición sobre Product (None = todo el catálogo).
+        Un solo INSERT ... SELECT. No hace commit.
+        """
+        total = (
+            select(func.coalesce(func.sum(Inventory.quantity), 0))
+            .where(Inventory.product_id == Product.id)
+            .scalar_subquery()
+        )
+        source = select(
+            Product.id, total, Product.stock_min, total <= Product.stock_min,
+            self._version_stamp(db), literal(datetime.utcnow())
+        ).where(~select(ProductStock.product_id).where(ProductStock.product_id == Product.id).exists())
+        if where is not None:
+            source = source.where(where)
+        columns = ["product_id", "quantity", "stock_min", "is_low", "stock_version", "updated_at"]
+        try:
+            with db.begin_nested():
+                db.exec(insert(ProductStock).from_select(columns, source))
+        except IntegrityError:
+            # Otra transacción creó alguno primero: recalcular los existentes y crear el resto
+            recount = update(ProductStock).values(
+                quantity=select(func.coalesce(func.sum(Inventory.quantity), 0))
+                .where(Inventory.product_id == ProductStock.product_id)
+                .scalar_subquery(),
+                stock_version=self._version_stamp(db),
+                updated_at=datetime.utcnow()
+            )
+            if where is not None:
+                recount = recount.where(ProductStock.product_id.in_(select(Product.id).where(where)))
+            db.exec(recount.execution_options(synchronize_session=False))
+            self.sync_thresholds(db, where=where)
+            db.exec(insert(ProductStock).from_select(columns, source))
+    
+    def sync_thresholds(self, db: Session, *, where=None) -> None:
+        """
+        Copiar stock_min de los productos a sus saldos y recalcular is_low
+        
+        Llamar cuando cambia products.stock_min. `where` es una condición sobre
+        Product (None = todo el catálogo). No hace commit.
+        """
+        stock_min = (
+            select(Product.stock_min)
+            .where(Product.id == ProductStock.product_id)
+            .scalar_subquery()
+        )
+        statement = update(ProductStock).values(
+            stock_min=stock_min,
+            is_low=ProductStock.quantity <= stock_min
+        )
+        if where is not None:
+            statement = statement.where(ProductStock.product_id.in_(select(Product.id).where(where)))
+        db.exec(statement.execution_options(synchronize_session=False))
+    
+    def get_changes(self, db: Session, *, since: int, until: int, limit: Optional[int]) -> List[ProductStock]:
+        """Saldos con versión en (since, until], en orden de versión (hasta `limit` + 1 filas, o todas con limit=None)"""
+        statement = (
+            select(ProductStock)
+            .where(ProductStock.stock_version > since, ProductStock.stock_version <= until)
+            .order_by(ProductStock.stock_version, ProductStock.product_id)
+        )
+        if limit is not None:
+            statement = statement.limit(limit + 1)
+        return db.exec(statement).all()
+    
+    def rebuild(self, db: Session) -> int:
+        """Recalcular todos los saldos desde el inventario (uno por producto)"""
+        db.exec(delete(ProductStock).execution_options(synchronize_session=False))
+        self.ensure_rows(db)
+        db.commit()
+        return db.exec(select(func.count()).select_from(ProductStock)).one()
+
+
+class CRUDStockReservation(CRUDBase[StockReservation, StockReservation, StockReservation]):
+    def get_by_cart(
+        self,
+        db: Session,
+        *,
+        cart_id: str,
+        user_id: UUID,
+        for_update: bool = False
+    ) -> List[StockReservation]:
+        """
+        Obtener los apartados de un carrito
+        
+        El `cart_id` lo genera el POS, así que solo identifica al carrito junto
+        con el usuario que apartó: otro usuario nunca ve ni consume sus apartados.
+        """
+        statement = select(StockReservation).where(
+            StockReservation.cart_id == cart_id,
+            StockReservation.user_id == user_id
+        )
+        if for_update:
+            statement = statement.with_for_update()
+        return db.exec(statement).all()
+    
+    def hold(
+        self,
+        db: Session,
+        *,
+        cart_id: str,
+        product_id: UUID,
+        quantity: float,
+        user_id: UUID,
+        ttl_seconds: int
+    ) -> Optional[StockReservation]:
+        """
+        Apartar `quantity` unidades de un producto para un carrito
+        
+        Si el carrito del usuario ya tenía un apartado del producto se ajusta a
+        la nueva cantidad y se renueva su vencimiento. El incremento es un UPDATE
+        condicional sobre reserved_quantity, así que dos cajas no pueden
+        apartar el mismo stock. Retorna None si no hay disponible suficiente.
+        """
+        existing = db.exec(
+            select(StockReservation).where(
+                StockReservation.cart_id == cart_id,
+                StockReservation.user_id == user_id,
+                StockReservation.product_id == product_id
+            ).with_for_update()
+        ).first()
+        
+        if existing:
+            inventory_id = existing.inventory_id
+            delta = quantity - existing.quantity
+        else:
+            row = inventory.get_primary_rows(db, product_ids=[product_id]).get(product_id)
+            if not row:
+                return None
+            inventory_id = row.id
+            delta = quantity
+        
+        conditions = [Inventory.id == inventory_id]
+        if delta > 0:
+            conditions.append(Inventory.quantity - Inventory.reserved_quantity >= delta)
+        result = db.exec(
+            update(Inventory)
+            .where(*conditions)
+            .values(reserved_quantity=Inventory.reserved_quantity + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            return None
+        
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        if existing:
+            existing.quantity = quantity
+            existing.expires_at = expires_at
+            reservation = existing
+        else:
+            reservation = StockReservation(
+                cart_id=cart_id,
+                product_id=product_id,
+                inventory_id=inventory_id,
+                quantity=quantity,
+                user_id=user_id,
+                expires_at=expires_at
+            )
+        db.add(reservation)
+        db.commit()
+        db.refresh(reservation)
+        return reservation
+    
+    def release_holds(self, db: Session, *, holds: List[StockReservation]) -> int:
+        """Devolver al disponible lo apartado y borrar los apartados (no hace commit)"""
+        if not holds:
+            return 0
+        released: dict[UUID, float] = {}
+        for hold in holds:
+            released[hold.inventory_id] = released.get(hold.inventory_id, 0) + hold.quantity
+        db.exec(
+            update(Inventory)
+            .where(Inventory.id.in_(list(released)))
+            .values(reserved_quantity=Inventory.reserved_quantity - _amount_by_id(released))
+            .execution_options(synchronize_session=False)
+        )
+        db.exec(
+            delete(StockReservation)
+            .where(StockReservation.id.in_([hold.id for hold in holds]))
+            .execution_options(synchronize_session=False)
+        )
+        return len(holds)
+    
+    def release_cart(self, db: Session, *, cart_id: str, user_id: UUID) -> int:
+        """Liberar todos los apartados de un carrito del usuario"""
+        holds = self.get_by_cart(db, cart_id=cart_id, user_id=user_id, for_update=True)
+        released = self.release_holds(db, holds=holds)
+        db.commit()
+        return released
+    
+    def purge_expired(
+        self,
+        db: Session,
+        *,
+        product_ids: Optional[List[UUID]] = None,
+        limit: int = 500
+    ) -> int:
+        """
+        Liberar apartados vencidos (los que otra transacción tiene tomados se saltan)
+        
+        Con `product_ids` solo los de esos productos: el checkout y la
+        sincronización offline lo llaman antes de dar un producto por agotado.
+        """
+        statement = select(StockReservation).where(StockReservation.expires_at < datetime.utcnow())
+        if product_ids is not None:
+            statement = statement.where(StockReservation.product_id.in_(product_ids))
+        holds = db.exec(statement.limit(limit).with_for_update(skip_locked=True)).all()
+        released = self.release_holds(db, holds=holds)
+        db.commit()
+        return released
 
 
 class CRUDLocation(CRUDBase[Location, Location, Location]):
@@ -163,6 +552,13 @@ class CRUDInventoryMovement(CRUDBase[InventoryMovement, InventoryMovement, Inven
 
 
 class CRUDProductReception(CRUDBase[ProductReception, ProductReception, ProductReception]):
+    def create(self, db: Session, *, obj_in: ProductReception) -> ProductReception:
+        """Crear recepción con número correlativo"""
+        from .numbering_crud import document_counter
+        return document_counter.create_numbered(
+            db, crud=self, obj_in=obj_in, field="reception_number", kind="reception"
+        )
+    
     def get_by_reception_number(
         self, 
         db: Session, 
@@ -248,6 +644,8 @@ class CRUDProductLabel(CRUDBase[ProductLabel, ProductLabel, ProductLabel]):
 
 # Instancias globales
 inventory = CRUDInventory(Inventory)
+product_stock = CRUDProductStock(ProductStock)
+stock_reservation = CRUDStockReservation(StockReservation)
 location = CRUDLocation(Location)
 inventory_movement = CRUDInventoryMovement(InventoryMovement)
 product_reception = CRUDProductReception(ProductReception)
@@ -0,0 +1,246 @@
+"""
+Numeración de documentos (ventas, órdenes de compra, recepciones, notas de
+crédito y facturas) con contadores por prefijo y día.
+"""
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Session, select, func
+from sqlalchemy import event, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as OrmSession
+
+from app.models.models import (
+    DocumentCounter, Sale, PurchaseOrder, ProductReception, CreditNote, Invoice
+)
+from .base_crud import CRUDBase, dialect_insert
+
+
+# Tamaño del bloque que cada worker reserva de una vez para las series sin
+# requisito fiscal de continuidad
+NUMBERING_BLOCK_SIZE = int(os.getenv("NUMBERING_BLOCK_SIZE", "20"))
+
+# gap_free: el contador avanza de a uno dentro de la transacción del documento.
+# El resto toma números de bloques en memoria del worker (ver _take_from_block).
+DOCUMENT_SERIES = {
+    "sale": {"prefix": "V", "width": 5, "column": Sale.sale_number, "gap_free": False},
+    "purchase_order": {"prefix": "PO", "width": 4, "column": PurchaseOrder.order_number, "gap_free": False},
+    "reception": {"prefix": "REC", "width": 4, "column": ProductReception.reception_number, "gap_free": False},
+    "credit_note": {"prefix": "NC", "width": 4, "column": CreditNote.note_number, "gap_free": True},
+    "invoice": {"prefix": "F", "width": 6, "column": Invoice.invoice_number, "gap_free": True},
+}
+
+# Clave en session.info con lo que la transacción en curso tomó de los bloques
+_PENDING_NUMBERS = "numbering_pending"
+
+# Contador sin período que versiona los cambios del catálogo (ver next_catalog_version)
+CATALOG_VERSION_KEY = ("CATALOGO", "-")
+
+
+class _PendingNumbers:
+    """Números tomados, bloques reservados y contadores creados por una transacción"""
+
+    def __init__(self):
+        self.taken: list[tuple[tuple[str, str], int]] = []
+        self.blocks: dict[tuple[str, str], deque] = {}
+        self.counters: set[tuple[str, str]] = set()
+
+
+class CRUDDocumentCounter(CRUDBase[DocumentCounter, DocumentCounter, DocumentCounter]):
+    def __init__(self, model):
+        super().__init__(model)
+        self._blocks: dict[tuple[str, str], deque] = {}
+        self._known: set[tuple[str, str]] = set()
+        # Nunca se mantiene tomado durante I/O: en el event loop varias
+        # peticiones comparten el mismo hilo
+        self._lock = threading.Lock()
+
+    def next_number(self, db: Session, *, kind: str, when: Optional[datetime] = None) -> str:
+        """
+        Obtener el siguiente número de documento de una serie
+        
+        Todo ocurre en la transacción de `db`, sin pedir otra conexión al pool.
+        Conviene llamarlo después de las escrituras que pueden fallar (p. ej. el
+        descuento de stock): si la transacción no se confirma el número vuelve
+        al worker, pero mientras tanto otra petición puede tomar el siguiente.
+        
+        Args:
+            kind: sale, purchase_order, reception, credit_note o invoice
+            when: Fecha del documento (define el día del contador)
+        """
+        series = DOCUMENT_SERIES[kind]
+        period = (when or datetime.utcnow()).strftime("%Y%m%d")
+
+        if series["gap_free"]:
+            value = self._advance_series(db, series, period, 1)
+        else:
+            value = self._take_from_block(db, series, period)
+
+        return f"{series['prefix']}-{period}-{value:0{series['width']}d}"
+
+    def _pending(self, db: Session) -> _PendingNumbers:
+        return db.info.setdefault(_PENDING_NUMBERS, {}).setdefault(self, _PendingNumbers())
+
+    def _take_from_block(self, db: Session, series: dict, period: str) -> int:
+        """
+        Tomar un número del bloque del worker; reservar otro bloque si se agotó
+        
+        El bloque se reserva dentro de la transacción del documento y pasa al
+        worker recién con el commit; si la transacción no se confirma, el
+        avance del contador se deshace y los números tomados vuelven al worker.
+        Así una venta rechazada o reintentada no deja huecos. Las series con
+        bloques sí aceptan huecos en dos casos: los números que un worker tenía
+        en memoria al reiniciarse se pierden, y entre workers la numeración no
+        sigue el orden de las ventas.
+        """
+        key = (series["prefix"], period)
+        # Con la transacción ya iniciada su rollback o cierre devuelve el número
+        db.connection()
+        pending = self._pending(db)
+        value = self._pop(key)
+        if value is not None:
+            pending.taken.append((key, value))
+            return value
+
+        value = self._pop_from(pending.blocks, key)
+        if value is None:
+            # La fila del contador queda bloqueada hasta el commit: otra
+            # reserva del mismo día espera, pero ninguna recibe el mismo bloque
+            last = self._advance_series(db, series, period, NUMBERING_BLOCK_SIZE)
+            pending.blocks.setdefault(key, deque()).append([last - NUMBERING_BLOCK_SIZE + 1, last])
+            value = self._pop_from(pending.blocks, key)
+        return value
+
+    def _pop(self, key: tuple[str, str]) -> Optional[int]:
+        with self._lock:
+            return self._pop_from(self._blocks, key)
+
+    @staticmethod
+    def _pop_from(blocks: dict[tuple[str, str], deque], key: tuple[str, str]) -> Optional[int]:
+        ranges = blocks.get(key)
+        while ranges:
+            current = ranges[0]
+            if current[0] <= current[1]:
+                value = current[0]
+                current[0] += 1
+                return value
+            ranges.popleft()
+        return None
+
+    def _publish(self, pending: _PendingNumbers) -> None:
+        """Commit: los bloques reservados por la transacción pasan al worker"""
+        with self._lock:
+            self._known.update(pending.counters)
+            for key, ranges in pending.blocks.items():
+                self._blocks.setdefault(key, deque()).extend(r for r in ranges if r[0] <= r[1])
+                # Los bloques de días anteriores ya no se usarán
+                prefix, period = key
+                for old_key in [k for k in self._blocks if k[0] == prefix and k[1] < period]:
+                    del self._blocks[old_key]
+
+    def _give_back(self, pending: _PendingNumbers) -> None:
+        """Sin commit: los números tomados vuelven al frente del bloque del worker"""
+        with self._lock:
+            for key, value in reversed(pending.taken):
+                self._blocks.setdefault(key, deque()).appendleft([value, value])
+
+    def _advance(self, executor, prefix: str, period: str, amount: int) -> int:
+        """Incrementar el contador y devolver su nuevo último valor (la fila queda bloqueada)"""
+        where = (DocumentCounter.prefix == prefix, DocumentCounter.period == period)
+        executor.execute(
+            update(DocumentCounter)
+            .where(*where)
+            .values(last_value=DocumentCounter.last_value + amount)
+            .execution_options(synchronize_session=False)
+        )
+        return executor.execute(
+            select(DocumentCounter.last_value).where(*where)
+        ).scalar_one()
+
+    def _advance_series(self, db: Session, series: dict, period: str, amount: int) -> int:
+        """Avanzar el contador del día de una serie, creándolo si todavía no existe"""
+        key = (series["prefix"], period)
+        if key not in self._known:
+            # Una única lectura por serie y día: respeta números emitidos antes del contador
+            column = series["column"]
+            last_issued = db.execute(
+                select(func.max(column)).where(column.like(f"{series['prefix']}-{period}-%"))
+            ).scalar()
+            start = int(last_issued.rsplit("-", 1)[1]) if last_issued else 0
+            # Si otro worker lo creó al mismo tiempo, se usa el suyo
+            statement = dialect_insert(db)(DocumentCounter).values(
+                prefix=series["prefix"], period=period, last_value=start
+            )
+            db.execute(statement.on_conflict_do_nothing(index_elements=["prefix", "period"]))
+            # Se da por conocido recién con el commit: un rollback deshace el INSERT
+            self._pending(db).counters.add(key)
+        return self._advance(db, series["prefix"], period, amount)
+
+    def next_catalog_version(self, db: Session) -> int:
+        """
+        Avanzar la versión del catálogo dentro de la transacción en curso
+        
+        La fila del contador queda bloqueada hasta el commit, así las versiones
+        se confirman en orden: un cliente que ya leyó hasta N nunca verá
+        aparecer después un cambio con versión menor o igual a N. No hace commit.
+        """
+        prefix, period = CATALOG_VERSION_KEY
+        result = db.execute(
+            update(DocumentCounter)
+            .where(DocumentCounter.prefix == prefix, DocumentCounter.period == period)
+            .values(last_value=DocumentCounter.last_value + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            return self.current_catalog_version(db)
+        try:
+            with db.begin_nested():
+                db.execute(insert(DocumentCounter).values(prefix=prefix, period=period, last_value=1))
+            return 1
+        except IntegrityError:
+            # Otra transacción creó el contador primero
+            return self._advance(db, prefix, period, 1)
+
+    def current_catalog_version(self, db: Session) -> int:
+        """Última versión confirmada del catálogo (0 si nunca cambió)"""
+        prefix, period = CATALOG_VERSION_KEY
+        value = db.execute(
+            select(DocumentCounter.last_value).where(
+                DocumentCounter.prefix == prefix, DocumentCounter.period == period
+            )
+        ).scalar()
+        return value or 0
+
+    def create_numbered(self, db: Session, *, crud: CRUDBase, obj_in, field: str, kind: str):
+        """Crear un documento asignándole número cuando no viene informado"""
+        db_obj = crud._build(obj_in)
+        if not getattr(db_obj, field, None):
+            setattr(db_obj, field, self.next_number(db, kind=kind))
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish_on_commit(session):
+    # El RELEASE de un savepoint también dispara after_commit
+    if session.in_nested_transaction():
+        return
+    for counter, pending in session.info.pop(_PENDING_NUMBERS, {}).items():
+        counter._publish(pending)
+
+
+@event.listens_for(OrmSession, "after_transaction_end")
+def _give_back_on_rollback(session, transaction):
+    # Transacción principal terminada sin commit (rollback o sesión cerrada)
+    if transaction.parent is None:
+        for counter, pending in session.info.pop(_PENDING_NUMBERS, {}).items():
+            counter._give_back(pending)
+
+
+# Instancia global
+document_counter = CRUDDocumentCounter(DocumentCounter)
@@ -1,60 +1,462 @@
-from typing import Optional, List
+import os
+import re
+import time
+import unicodedata
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, List, Tuple, Any
 from sqlmodel import Session, select
+from sqlalchemy import case, and_, or_, update, delete, insert, literal, func, cast, Numeric
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
 from uuid import UUID
 
 from app.models.models import (
-    Product, Category, Brand, ProductPresentation
+    Product, Category, CategoryClosure, Brand, ProductPresentation, ProductStock
 )
-from .base_crud import CRUDBase
+from .base_crud import CRUDBase, apply_keyset, keyset_page
+from .numbering_crud import document_counter
+from .inventario_crud import product_stock
+
+
+# Índice en memoria para el escáner de la caja (por worker)
+PRODUCT_LOOKUP_CACHE_SIZE = int(os.getenv("PRODUCT_LOOKUP_CACHE_SIZE", "5000"))
+# Cota de desactualización frente a cambios hechos en otros workers
+PRODUCT_LOOKUP_CACHE_TTL = float(os.getenv("PRODUCT_LOOKUP_CACHE_TTL", "60"))
+
+
+class ProductLookupCache:
+    """
+    Caché LRU código de barras / SKU -> producto ya serializado
+    
+    Cada escritura del catálogo sube `version` y vacía el caché; una lectura
+    que empezó antes de la invalidación no guarda su resultado.
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self._entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Valor vigente de la llave o None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: str, value: Any, version: int) -> None:
+        """Guardar un valor leído con la versión `version` (se descarta si ya cambió)"""
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self) -> None:
+        """Descartar todo lo guardado (producto o presentación modificados)"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+
+product_lookup_cache = ProductLookupCache(PRODUCT_LOOKUP_CACHE_SIZE, PRODUCT_LOOKUP_CACHE_TTL)
+
+
+_NON_SEARCHABLE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_search(text: Optional[str]) -> str:
+    """Minúsculas, sin tildes ni signos: 'Café Molido' -> 'cafe molido'"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    ascii_text = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+    return _NON_SEARCHABLE.sub(" ", ascii_text).strip()
+
+
+def build_search_text(name: Optional[str], sku: Optional[str], barcode: Optional[str]) -> str:
+    """Texto de búsqueda del producto; el nombre va primero para rankear por prefijo"""
+    return " ".join(part for part in (
+        normalize_search(name), normalize_search(sku), normalize_search(barcode)
+    ) if part)
+
+
+def _with_relations(statement):
+    """Precargar categoría, marca y proveedor con una query por relación (sin N+1)"""
+    return statement.options(
+        selectinload(Product.category),
+        selectinload(Product.brand),
+        selectinload(Product.supplier)
+    )
 
 
 class CRUDProduct(CRUDBase[Product, Product, Product]):
     def get_by_sku(self, db: Session, *, sku: str) -> Optional[Product]:
         """Obtener producto por SKU"""
-        statement = select(Product).where(Product.sku == sku)
+        statement = _with_relations(select(Product).where(Product.sku == sku))
         return db.exec(statement).first()
     
     def get_by_barcode(self, db: Session, *, barcode: str) -> Optional[Product]:
         """Obtener producto por código de barras"""
-        statement = select(Product).where(Product.barcode == barcode)
+        statement = _with_relations(select(Product).where(Product.barcode == barcode))
+        return db.exec(statement).first()
+    
+    def get_by_any_barcode(
+        self,
+        db: Session,
+        *,
+        barcode: str
+    ) -> Tuple[Optional[Product], Optional[ProductPresentation]]:
+        """Resolver un código de barras del producto o de una de sus presentaciones"""
+        found = self.get_by_barcode(db, barcode=barcode)
+        if found:
+            return found, None
+        presentation = product_presentation.get_by_barcode(db, barcode=barcode)
+        if not presentation:
+            return None, None
+        return self.get_with_relations(db, id=presentation.product_id), presentation
+    
+    def get_with_relations(self, db: Session, *, id: UUID) -> Optional[Product]:
+        """Obtener producto con categoría, marca y proveedor precargados"""
+        statement = _with_relations(select(Product).where(Product.id == id))
         return db.exec(statement).first()
     
     def search_by_name(self, db: Session, *, name: str) -> List[Product]:
         """Buscar productos por nombre (parcial)"""
-        statement = select(Product).where(Product.name.contains(name))
+        return self.search(db, query=name)
+    
+    def search(
+        self,
+        db: Session,
+        *,
+        query: str,
+        limit: int = 50,
+        active_only: bool = False
+    ) -> List[Product]:
+        """
+        Buscar por nombre, SKU o código de barras, sin distinguir tildes ni mayúsculas
+        
+        Cada palabra de la búsqueda debe aparecer en `search_text` (en PostgreSQL
+        lo atiende el índice de trigramas, ver migrate_product_search.py). Orden:
+        SKU/código exacto, nombre que empieza con la búsqueda, palabra del nombre
+        que empieza con ella y el resto; a igual rango, por nombre.
+        """
+        normalized = normalize_search(query)
+        if not normalized:
+            return []
+        tokens = normalized.split()
+        
+        statement = select(Product).where(
+            and_(*[Product.search_text.like(f"%{token}%") for token in tokens])
+        )
+        if active_only:
+            statement = statement.where(Product.is_active == True)
+        
+        rank = case(
+            (or_(Product.sku == query.strip(), Product.barcode == query.strip()), 0),
+            (Product.search_text.like(f"{normalized}%"), 1),
+            (Product.search_text.like(f"% {normalized}%"), 2),
+            else_=3
+        )
+        statement = _with_relations(statement.order_by(rank, Product.name, Product.id).limit(limit))
         return db.exec(statement).all()
     
-    def get_by_category(self, db: Session, *, category_id: UUID) -> List[Product]:
-        """Obtener productos por categoría"""
-        statement = select(Product).where(Product.category_id == category_id)
+    def refresh_search_text(self, db: Session, *, batch_size: int = 1000) -> int:
+        """Recalcular search_text de todo el catálogo (migración / reparación)"""
+        total = 0
+        last_id = None
+        while True:
+            statement = select(Product).order_by(Product.id).limit(batch_size)
+            if last_id is not None:
+                statement = statement.where(Product.id > last_id)
+            batch = db.exec(statement).all()
+            if not batch:
+                break
+            for item in batch:
+                item.search_text = build_search_text(item.name, item.sku, item.barcode)
+                db.add(item)
+            db.commit()
+            total += len(batch)
+            last_id = batch[-1].id
+        return total
+    
+    def get_by_category(
+        self,
+        db: Session,
+        *,
+        category_id: UUID,
+        include_subcategories: bool = True
+    ) -> List[Product]:
+        """Obtener productos por categoría (por defecto también los de sus subcategorías)"""
+        if include_subcategories:
+            condition = Product.category_id.in_(category.subtree_ids(category_id))
+        else:
+            condition = Product.category_id == category_id
+        statement = _with_relations(select(Product).where(condition))
         return db.exec(statement).all()
     
     def get_by_supplier(self, db: Session, *, supplier_id: UUID) -> List[Product]:
         """Obtener productos por proveedor"""
-        statement = select(Product).where(Product.main_supplier_id == supplier_id)
+        statement = _with_relations(select(Product).where(Product.main_supplier_id == supplier_id))
         return db.exec(statement).all()
     
-    def get_low_stock(self, db: Session) -> List[Product]:
-        """Obtener productos con stock bajo (menos que stock_min)"""
-        statement = select(Product).where(Product.stock_min > 0)
-        products = db.exec(statement).all()
-        # Filtrar productos donde stock actual < stock_min
-        # Nota: necesitarás calcular el stock actual desde la tabla inventory
-        return products
+    def _low_stock(self, statement, *, category_id: Optional[UUID], threshold: Optional[float]):
+        """
+        Condición de stock bajo compartida por alertas y dashboard
+        
+        Sin `threshold` usa el indicador is_low de product_stock (saldo <= stock_min,
+        mantenido en cada escritura); con `threshold` compara el saldo contra ese
+        valor para todos los productos.
+        """
+        statement = statement.join(ProductStock, ProductStock.product_id == Product.id).where(
+            Product.is_active == True
+        )
+        if threshold is None:
+            statement = statement.where(ProductStock.is_low == True)
+        else:
+            statement = statement.where(ProductStock.quantity <= threshold)
+        if category_id:
+            statement = statement.where(Product.category_id.in_(category.subtree_ids(category_id)))
+        return statement
+    
+    def get_low_stock(
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        category_id: Optional[UUID] = None,
+        threshold: Optional[float] = None
+    ) -> List[Tuple[Product, float]]:
+        """
+        Productos activos con stock bajo y su saldo, los más críticos primero
+        
+        Orden: mayor faltante respecto de stock_min (o menor saldo si se pasa
+        `threshold`) y luego nombre.
+        """
+        statement = self._low_stock(
+            select(Product, ProductStock.quantity), category_id=category_id, threshold=threshold
+        )
+        urgency = ProductStock.quantity - ProductStock.stock_min if threshold is None else ProductStock.quantity
+        statement = statement.order_by(urgency, Product.name, Product.id).offset(skip).limit(limit)
+        return db.exec(_with_relations(statement)).all()
+    
+    def count_low_stock(
+        self,
+        db: Session,
+        *,
+        category_id: Optional[UUID] = None,
+        threshold: Optional[float] = None
+    ) -> int:
+        """Cantidad de productos activos con stock bajo"""
+        statement = self._low_stock(
+            select(func.count()).select_from(Product), category_id=category_id, threshold=threshold
+        )
+        return db.exec(statement).one()
     
     def get_active_products(self, db: Session) -> List[Product]:
         """Obtener productos activos"""
         statement = select(Product).where(Product.is_active == True)
         return db.exec(statement).all()
     
+    async def get_catalog_page_async(
+        self,
+        db: AsyncSession,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        active_only: bool = True,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Product], Optional[str]]:
+        """
+        Obtener una página del catálogo (orden por nombre) con categoría, marca y proveedor precargados
+        
+        Con `cursor` la página continúa después del último producto visto
+        (keyset) y `skip` se ignora. Retorna (productos, cursor siguiente).
+        """
+        statement = _with_relations(select(Product))
+        if active_only:
+            statement = statement.where(Product.is_active == True)
+        statement = apply_keyset(
+            statement, sort_column=Product.name, id_column=Product.id, cursor=cursor, limit=limit
+        )
+        if not cursor and skip:
+            statement = statement.offset(skip)
+        result = await db.exec(statement)
+        return keyset_page(result.all(), limit=limit, sort_attr="name")
+    
+    def create(self, db: Session, *, obj_in: Product) -> Product:
+        """Crear producto (con su texto de búsqueda) e invalidar el índice del escáner"""
+        db_obj = self._build(obj_in)
+        db_obj.search_text = build_search_text(db_obj.name, db_obj.sku, db_obj.barcode)
+        db_obj.catalog_version = document_counter.next_catalog_version(db)
+        db.add(db_obj)
+        db.flush()
+        product_stock.ensure_rows(db, where=Product.id == db_obj.id)
+        db.commit()
+        db.refresh(db_obj)
+        product_lookup_cache.invalidate()
+        return db_obj
+    
+    def update(self, db: Session, *, db_obj: Product, obj_in) -> Product:
+        """Actualizar producto (y su texto de búsqueda) e invalidar el índice del escáner"""
+        self._apply_update(db_obj, obj_in)
+        db_obj.search_text = build_search_text(db_obj.name, db_obj.sku, db_obj.barcode)
+        db_obj.catalog_version = document_counter.next_catalog_version(db)
+        db_obj.updated_at = datetime.utcnow()
+        db.add(db_obj)
+        db.flush()
+        product_stock.sync_thresholds(db, where=Product.id == db_obj.id)
+        db.commit()
+        db.refresh(db_obj)
+        product_lookup_cache.invalidate()
+        return db_obj
+    
     def deactivate(self, db: Session, *, id: UUID) -> Product:
         """Desactivar producto"""
         product = self.get(db, id)
         product.is_active = False
+        product.catalog_version = document_counter.next_catalog_version(db)
+        product.updated_at = datetime.utcnow()
         db.add(product)
         db.commit()
         db.refresh(product)
+        product_lookup_cache.invalidate()
         return product
+    
+    def touch(self, db: Session, *, product_ids: List[UUID]) -> int:
+        """
+        Marcar productos como cambiados con una sola versión del catálogo
+        
+        Para cambios que no pasan por update (presentaciones, cambios masivos).
+        No hace commit. Retorna la versión asignada.
+        """
+        version = document_counter.next_catalog_version(db)
+        if product_ids:
+            db.exec(
+                update(Product)
+                .where(Product.id.in_(product_ids))
+                .values(catalog_version=version, updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+        return version
+    
+    def bulk_update(
+        self,
+        db: Session,
+        *,
+        rules: List[dict] = (),
+        prices: List[dict] = (),
+        attributes: List[dict] = ()
+    ) -> dict:
+        """
+        Cambios masivos de precios y atributos en una sola transacción
+        
+        - rules: {field, percentage, round_to, category_id, brand_id, supplier_id,
+          all_products}; un UPDATE por regla (field * (1 + percentage / 100))
+        - prices: {product_id, sale_price, cost_price}; un UPDATE con CASE por campo
+        - attributes: {values, category_id, brand_id, supplier_id, all_products};
+          un UPDATE por cambio
+        
+        Todo queda con una única versión del catálogo. Si algún product_id de
+        `prices` no existe se lanza LookupError sin modificar nada.
+        """
+        rule_filters = [self._bulk_filters(rule) for rule in rules]
+        attribute_filters = [self._bulk_filters(change) for change in attributes]
+        prices = list(prices)
+        price_ids = [item["product_id"] for item in prices]
+        if price_ids:
+            found = set(db.exec(select(Product.id).where(Product.id.in_(price_ids))).all())
+            missing = [pid for pid in price_ids if pid not in found]
+            if missing:
+                raise LookupError(missing)
+        
+        version = document_counter.next_catalog_version(db)
+        stamp = {"catalog_version": version, "updated_at": datetime.utcnow()}
+        summary = {"version": version, "rules": [], "prices": 0, "attributes": []}
+        
+        for rule, filters in zip(rules, rule_filters):
+            column = getattr(Product, rule["field"])
+            value = column * (1 + rule["percentage"] / 100)
+            step = rule.get("round_to")
+            if step:
+                value = func.round(cast(value / step, Numeric)) * step
+            # round(numeric, int): PostgreSQL no redondea double precision a decimales
+            value = func.round(cast(value, Numeric), 2)
+            result = db.exec(
+                update(Product)
+                .where(*filters)
+                .values({rule["field"]: value, **stamp})
+                .execution_options(synchronize_session=False)
+            )
+            summary["rules"].append(result.rowcount)
+        
+        for field in ("sale_price", "cost_price"):
+            changes = {item["product_id"]: item[field] for item in prices if item.get(field) is not None}
+            if not changes:
+                continue
+            db.exec(
+                update(Product)
+                .where(Product.id.in_(list(changes)))
+                .values({
+                    field: case(*[(Product.id == pid, price) for pid, price in changes.items()]),
+                    **stamp
+                })
+                .execution_options(synchronize_session=False)
+            )
+        summary["prices"] = len(set(price_ids))
+        
+        for change, filters in zip(attributes, attribute_filters):
+            result = db.exec(
+                update(Product)
+                .where(*filters)
+                .values({**change["values"], **stamp})
+                .execution_options(synchronize_session=False)
+            )
+            summary["attributes"].append(result.rowcount)
+            if "stock_min" in change["values"]:
+                product_stock.sync_thresholds(db, where=and_(*filters) if filters else None)
+        
+        db.commit()
+        product_lookup_cache.invalidate()
+        return summary
+    
+    def _bulk_filters(self, selector: dict) -> list:
+        """Condiciones de una regla masiva (categoría con sus subcategorías, marca y/o proveedor)"""
+        filters = []
+        if selector.get("category_id"):
+            filters.append(Product.category_id.in_(category.subtree_ids(selector["category_id"])))
+        if selector.get("brand_id"):
+            filters.append(Product.brand_id == selector["brand_id"])
+        if selector.get("supplier_id"):
+            filters.append(Product.main_supplier_id == selector["supplier_id"])
+        if not filters and not selector.get("all_products"):
+            # Nunca se toca todo el catálogo sin pedirlo explícitamente
+            raise ValueError("La regla necesita category_id, brand_id, supplier_id o all_products")
+        return filters
+    
+    def get_changes(self, db: Session, *, since: int, until: int, limit: Optional[int]) -> List[Product]:
+        """Productos con versión en (since, until], en orden de versión (hasta `limit` + 1 filas, o todas con limit=None)"""
+        statement = (
+            select(Product)
+            .where(Product.catalog_version > since, Product.catalog_version <= until)
+            .order_by(Product.catalog_version, Product.id)
+        )
+        if limit is not None:
+            statement = statement.limit(limit + 1)
+        return db.exec(_with_relations(statement)).all()
 
 
 class CRUDCategory(CRUDBase[Category, Category, Category]):
@@ -68,10 +470,139 @@ class CRUDCategory(CRUDBase[Category, Category, Category]):
         statement = select(Category).where(Category.parent_category_id == None)
         return db.exec(statement).all()
     
-    def get_subcategories(self, db: Session, *, parent_id: UUID) -> List[Category]:
-        """Obtener subcategorías de una categoría"""
-        statement = select(Category).where(Category.parent_category_id == parent_id)
+    def get_subcategories(self, db: Session, *, parent_id: UUID, recursive: bool = False) -> List[Category]:
+        """Obtener subcategorías de una categoría (con recursive, todo el subárbol)"""
+        if not recursive:
+            statement = select(Category).where(Category.parent_category_id == parent_id)
+            return db.exec(statement).all()
+        statement = (
+            select(Category)
+            .join(CategoryClosure, CategoryClosure.descendant_id == Category.id)
+            .where(CategoryClosure.ancestor_id == parent_id, CategoryClosure.depth > 0)
+            .order_by(CategoryClosure.depth, Category.name)
+        )
+        return db.exec(statement).all()
+    
+    def get_path(self, db: Session, *, category_id: UUID) -> List[Category]:
+        """Camino desde la raíz hasta la categoría (inclusive) en una consulta"""
+        statement = (
+            select(Category)
+            .join(CategoryClosure, CategoryClosure.ancestor_id == Category.id)
+            .where(CategoryClosure.descendant_id == category_id)
+            .order_by(CategoryClosure.depth.desc())
+        )
         return db.exec(statement).all()
+    
+    def subtree_ids(self, category_id: UUID):
+        """Subconsulta con los ids de la categoría y todas sus descendientes"""
+        return select(CategoryClosure.descendant_id).where(CategoryClosure.ancestor_id == category_id)
+    
+    def create(self, db: Session, *, obj_in: Category) -> Category:
+        """Crear categoría y sus filas en la clausura"""
+        db_obj = self._build(obj_in)
+        if db_obj.parent_category_id and not self.get(db, db_obj.parent_category_id):
+            raise ValueError("Categoria padre no encontrada")
+        db.add(db_obj)
+        db.flush()
+        self._link(db, node_id=db_obj.id, parent_id=db_obj.parent_category_id)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+    
+    def update(self, db: Session, *, db_obj: Category, obj_in) -> Category:
+        """Actualizar categoría; si cambia de padre se mueve su subárbol en la clausura"""
+        previous_parent = db_obj.parent_category_id
+        self._apply_update(db_obj, obj_in)
+        new_parent = db_obj.parent_category_id
+        if new_parent != previous_parent:
+            if new_parent and db.exec(
+                select(CategoryClosure.descendant_id).where(
+                    CategoryClosure.ancestor_id == db_obj.id,
+                    CategoryClosure.descendant_id == new_parent
+                )
+            ).first():
+                db.rollback()
+                raise ValueError("Una categoria no puede moverse dentro de su propio subarbol")
+            self._move(db, node_id=db_obj.id, parent_id=new_parent)
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+    
+    def delete(self, db: Session, *, id: UUID) -> Category:
+        """Eliminar categoría (sin subcategorías) y sus filas en la clausura"""
+        has_children = db.exec(
+            select(CategoryClosure.descendant_id)
+            .where(CategoryClosure.ancestor_id == id, CategoryClosure.depth > 0)
+            .limit(1)
+        ).first()
+        if has_children is not None:
+            raise ValueError("La categoría tiene subcategorías; muévalas o elimínelas primero")
+        db.exec(
+            delete(CategoryClosure)
+            .where(CategoryClosure.descendant_id == id)
+            .execution_options(synchronize_session=False)
+        )
+        return super().delete(db, id=id)
+    
+    def _link(self, db: Session, *, node_id: UUID, parent_id: Optional[UUID]) -> None:
+        """Clausura de una hoja nueva: ella misma y los ancestros de su padre"""
+        db.exec(insert(CategoryClosure).values(ancestor_id=node_id, descendant_id=node_id, depth=0))
+        if parent_id:
+            db.exec(insert(CategoryClosure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(
+                    CategoryClosure.ancestor_id, literal(node_id, CategoryClosure.descendant_id.type),
+                    CategoryClosure.depth + 1
+                ).where(CategoryClosure.descendant_id == parent_id)
+            ))
+    
+    def _move(self, db: Session, *, node_id: UUID, parent_id: Optional[UUID]) -> None:
+        """Desenganchar el subárbol de sus ancestros anteriores y colgarlo del nuevo padre"""
+        subtree = [
+            (descendant_id, depth)
+            for descendant_id, depth in db.exec(
+                select(CategoryClosure.descendant_id, CategoryClosure.depth)
+                .where(CategoryClosure.ancestor_id == node_id)
+            ).all()
+        ]
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        db.exec(
+            delete(CategoryClosure)
+            .where(
+                CategoryClosure.descendant_id.in_(subtree_ids),
+                CategoryClosure.ancestor_id.notin_(subtree_ids)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if not parent_id:
+            return
+        ancestors = db.exec(
+            select(CategoryClosure.ancestor_id, CategoryClosure.depth)
+            .where(CategoryClosure.descendant_id == parent_id)
+        ).all()
+        rows = [
+            {"ancestor_id": ancestor_id, "descendant_id": descendant_id, "depth": up + down + 1}
+            for ancestor_id, up in ancestors
+            for descendant_id, down in subtree
+        ]
+        if rows:
+            db.execute(insert(CategoryClosure), rows)
+    
+    def rebuild_closure(self, db: Session) -> int:
+        """Reconstruir la clausura desde parent_category_id (migración / reparación). No hace commit."""
+        parents = dict(db.exec(select(Category.id, Category.parent_category_id)).all())
+        rows = []
+        for node_id in parents:
+            current, depth, seen = node_id, 0, set()
+            while current is not None and current not in seen:
+                seen.add(current)
+                rows.append({"ancestor_id": current, "descendant_id": node_id, "depth": depth})
+                current, depth = parents.get(current), depth + 1
+        db.exec(delete(CategoryClosure).execution_options(synchronize_session=False))
+        if rows:
+            db.execute(insert(CategoryClosure), rows)
+        return len(rows)
 
 
 class CRUDBrand(CRUDBase[Brand, Brand, Brand]):
@@ -82,6 +613,35 @@ class CRUDBrand(CRUDBase[Brand, Brand, Brand]):
 
 
 class CRUDProductPresentation(CRUDBase[ProductPresentation, ProductPresentation, ProductPresentation]):
+    def create(self, db: Session, *, obj_in: ProductPresentation) -> ProductPresentation:
+        """Crear presentación (nueva versión de su producto) e invalidar el índice del escáner"""
+        db_obj = self._build(obj_in)
+        product.touch(db, product_ids=[db_obj.product_id])
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        product_lookup_cache.invalidate()
+        return db_obj
+    
+    def update(self, db: Session, *, db_obj: ProductPresentation, obj_in) -> ProductPresentation:
+        """Actualizar presentación (nueva versión de su producto) e invalidar el índice del escáner"""
+        self._apply_update(db_obj, obj_in)
+        product.touch(db, product_ids=[db_obj.product_id])
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        product_lookup_cache.invalidate()
+        return db_obj
+    
+    def delete(self, db: Session, *, id: UUID) -> ProductPresentation:
+        """Eliminar presentación (nueva versión de su producto) e invalidar el índice del escáner"""
+        db_obj = self.get(db, id)
+        product.touch(db, product_ids=[db_obj.product_id])
+        db.delete(db_obj)
+        db.commit()
+        product_lookup_cache.invalidate()
+        return db_obj
+    
     def get_by_product(self, db: Session, *, product_id: UUID) -> List[ProductPresentation]:
         """Obtener presentaciones de un producto"""
         statement = select(ProductPresentation).where(
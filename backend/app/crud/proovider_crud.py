@@ -115,6 +115,13 @@ class CRUDPurchaseOrderDetail(CRUDBase[PurchaseOrderDetail, PurchaseOrderDetail,
 
 
 class CRUDCreditNote(CRUDBase[CreditNote, CreditNote, CreditNote]):
+    def create(self, db: Session, *, obj_in: CreditNote) -> CreditNote:
+        """Crear nota de crédito con número correlativo"""
+        from .numbering_crud import document_counter
+        return document_counter.create_numbered(
+            db, crud=self, obj_in=obj_in, field="note_number", kind="credit_note"
+        )
+    
     def get_by_note_number(self, db: Session, *, note_number: str) -> Optional[CreditNote]:
         """Obtener nota de crédito por número"""
         statement = select(CreditNote).where(CreditNote.note_number == note_number)
@@ -0,0 +1,780 @@
+"""
+Reportes de ventas, inventario, caja y clientes: exportación y jobs.
+
+Las exportaciones (CSV, XLSX, PDF) leen las filas por bloques con un cursor
+del servidor y las escriben a medida que llegan; XLSX y PDF se generan en un
+pool de procesos para no ocupar los workers de la API. Los resúmenes pueden
+pedirse como job en segundo plano con el resultado guardado en disco.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Optional, Iterator, Any
+from uuid import UUID, uuid4
+
+from sqlmodel import Session, select, func
+
+from app.db.database import engine
+from app.models.models import (
+    Sale, SaleDetail, Product, Category, Customer, User, CashRegister,
+    CashRegisterSession, ProductStock, CustomerStats
+)
+from app.models.enums import SaleStatus
+from .products_crud import category
+from .sale_crud import sales_rollup, SALES_ROLLUP_MEASURES
+from .dashboard_crud import on_tables_committed
+
+
+# Filas leídas por bloque del cursor y escritas por bloque en el CSV
+REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", "1000"))
+
+# Procesos para generar XLSX/PDF; 0 los genera en un hilo del proceso de la API
+REPORT_RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", "2"))
+
+# Filas por página del PDF (horizontal, carta)
+PDF_ROWS_PER_PAGE = 45
+
+REPORT_TITLES = {
+    "ventas": "Reporte de ventas",
+    "inventario": "Reporte de inventario",
+    "caja": "Reporte de caja",
+    "clientes": "Reporte de clientes",
+}
+
+REPORT_HEADERS = {
+    "ventas": [
+        "Número", "Fecha", "Estado", "Documento cliente", "Cliente", "Cajero",
+        "Subtotal", "Descuento", "Impuesto", "Total"
+    ],
+    "inventario": [
+        "SKU", "Producto", "Categoría", "Cantidad", "Stock mínimo", "Stock máximo",
+        "Precio costo", "Valor total", "Estado"
+    ],
+    "caja": [
+        "Caja", "Cajero", "Apertura", "Cierre", "Monto apertura", "Cierre esperado",
+        "Cierre real", "Diferencia", "Estado"
+    ],
+    "clientes": [
+        "Documento", "Nombre", "Email", "Teléfono", "Segmento", "Puntos fidelidad",
+        "Total compras", "Total gastado", "Ticket promedio", "Última compra"
+    ],
+}
+
+
+def _parse_date(value: Optional[str], field: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Fecha inválida en {field}: {value}")
+    # Las fechas se guardan en UTC sin zona
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_uuid(value: Optional[str], field: str) -> Optional[UUID]:
+    if not value:
+        return None
+    try:
+        return UUID(value)
+    except ValueError:
+        raise ValueError(f"Identificador inválido en {field}: {value}")
+
+
+def _parse_filtro(filtro: dict) -> dict:
+    """Fechas y UUIDs de FiltroReporte ya convertidos (ValueError si alguno es inválido)"""
+    return {
+        "start": _parse_date(filtro.get("fecha_inicio"), "fecha_inicio"),
+        "end": _parse_date(filtro.get("fecha_fin"), "fecha_fin"),
+        "category_id": _parse_uuid(filtro.get("categoria_id"), "categoria_id"),
+        "product_id": _parse_uuid(filtro.get("producto_id"), "producto_id"),
+        "customer_id": _parse_uuid(filtro.get("cliente_id"), "cliente_id"),
+        "user_id": _parse_uuid(filtro.get("usuario_id"), "usuario_id"),
+    }
+
+
+def _sale_conditions(parsed: dict) -> list:
+    """Condiciones sobre Sale para los filtros del reporte de ventas"""
+    conditions = []
+    if parsed["start"]:
+        conditions.append(Sale.sale_date >= parsed["start"])
+    if parsed["end"]:
+        conditions.append(Sale.sale_date <= parsed["end"])
+    if parsed["customer_id"]:
+        conditions.append(Sale.customer_id == parsed["customer_id"])
+    if parsed["user_id"]:
+        conditions.append(Sale.cashier_id == parsed["user_id"])
+    if parsed["product_id"] or parsed["category_id"]:
+        # Ventas con al menos un ítem del producto o de la categoría (y subcategorías)
+        details = select(SaleDetail.sale_id)
+        if parsed["product_id"]:
+            details = details.where(SaleDetail.product_id == parsed["product_id"])
+        if parsed["category_id"]:
+            details = details.join(Product, SaleDetail.product_id == Product.id).where(
+                Product.category_id.in_(category.subtree_ids(parsed["category_id"]))
+            )
+        conditions.append(Sale.id.in_(details))
+    return conditions
+
+
+def _session_conditions(parsed: dict) -> list:
+    """Condiciones sobre CashRegisterSession para el reporte de caja"""
+    conditions = []
+    if parsed["start"]:
+        conditions.append(CashRegisterSession.opening_date >= parsed["start"])
+    if parsed["end"]:
+        conditions.append(CashRegisterSession.opening_date <= parsed["end"])
+    if parsed["user_id"]:
+        conditions.append(CashRegisterSession.user_id == parsed["user_id"])
+    return conditions
+
+
+def _customer_totals(parsed: dict):
+    """
+    Compras completadas por cliente: customer_stats si no hay fechas, si no
+    una subconsulta agrupada sobre las ventas del periodo
+    """
+    if not parsed["start"] and not parsed["end"]:
+        return select(
+            CustomerStats.customer_id.label("customer_id"),
+            CustomerStats.order_count.label("sales_count"),
+            CustomerStats.total_spent.label("total_spent"),
+            CustomerStats.average_ticket.label("average_ticket"),
+            CustomerStats.last_purchase_at.label("last_purchase")
+        ).subquery()
+    conditions = [Sale.customer_id.isnot(None), Sale.status == SaleStatus.completada]
+    if parsed["start"]:
+        conditions.append(Sale.sale_date >= parsed["start"])
+    if parsed["end"]:
+        conditions.append(Sale.sale_date <= parsed["end"])
+    return (
+        select(
+            Sale.customer_id.label("customer_id"),
+            func.count(Sale.id).label("sales_count"),
+            func.sum(Sale.total_amount).label("total_spent"),
+            func.avg(Sale.total_amount).label("average_ticket"),
+            func.max(Sale.sale_date).label("last_purchase")
+        )
+        .where(*conditions)
+        .group_by(Sale.customer_id)
+        .subquery()
+    )
+
+
+def build_report_statement(tipo: str, filtro: dict):
+    """
+    Consulta de columnas del reporte con los filtros aplicados
+
+    `filtro` son los campos de FiltroReporte como dict (se envía a otro proceso).
+    Lanza ValueError con tipo o filtros inválidos.
+    """
+    if tipo not in REPORT_HEADERS:
+        raise ValueError(f"Tipo de reporte no soportado: {tipo}")
+    parsed = _parse_filtro(filtro)
+    product_id = parsed["product_id"]
+    category_id = parsed["category_id"]
+    customer_id = parsed["customer_id"]
+
+    if tipo == "ventas":
+        return (
+            select(
+                Sale.sale_number, Sale.sale_date, Sale.status, Customer.document_number,
+                Customer.first_name + " " + Customer.last_name, User.username,
+                Sale.subtotal, Sale.discount_amount, Sale.tax_amount, Sale.total_amount
+            )
+            .join(User, Sale.cashier_id == User.id)
+            .outerjoin(Customer, Sale.customer_id == Customer.id)
+            .where(*_sale_conditions(parsed))
+            .order_by(Sale.sale_date, Sale.id)
+        )
+
+    if tipo == "inventario":
+        statement = (
+            select(
+                Product.sku, Product.name, Category.name, ProductStock.quantity,
+                Product.stock_min, Product.stock_max, Product.cost_price,
+                ProductStock.quantity * Product.cost_price, ProductStock.is_low
+            )
+            .join(ProductStock, ProductStock.product_id == Product.id)
+            .outerjoin(Category, Product.category_id == Category.id)
+            .where(Product.is_active == True)
+        )
+        if product_id:
+            statement = statement.where(Product.id == product_id)
+        if category_id:
+            statement = statement.where(Product.category_id.in_(category.subtree_ids(category_id)))
+        return statement.order_by(Product.name, Product.id)
+
+    if tipo == "caja":
+        return (
+            select(
+                CashRegister.register_number, User.username, CashRegisterSession.opening_date,
+                CashRegisterSession.closing_date, CashRegisterSession.opening_amount,
+                CashRegisterSession.expected_closing_amount, CashRegisterSession.actual_closing_amount,
+                CashRegisterSession.difference, CashRegisterSession.status
+            )
+            .join(CashRegister, CashRegisterSession.cash_register_id == CashRegister.id)
+            .join(User, CashRegisterSession.user_id == User.id)
+            .where(*_session_conditions(parsed))
+            .order_by(CashRegisterSession.opening_date, CashRegisterSession.id)
+        )
+
+    # clientes: una consulta contra customer_stats (o las ventas del periodo)
+    totals = _customer_totals(parsed)
+    statement = (
+        select(
+            Customer.document_number, Customer.first_name + " " + Customer.last_name,
+            Customer.email, Customer.phone, Customer.segment, Customer.loyalty_points,
+            func.coalesce(totals.c.sales_count, 0), func.coalesce(totals.c.total_spent, 0.0),
+            func.coalesce(totals.c.average_ticket, 0.0), totals.c.last_purchase
+        )
+        .outerjoin(totals, totals.c.customer_id == Customer.id)
+        .where(Customer.is_active == True)
+    )
+    if customer_id:
+        statement = statement.where(Customer.id == customer_id)
+    return statement.order_by(func.coalesce(totals.c.total_spent, 0.0).desc(), Customer.id)
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _row(tipo: str, values) -> list:
+    row = [_cell(value) for value in values]
+    if tipo == "inventario":
+        row[-1] = "bajo" if row[-1] else "normal"
+    return row
+
+
+def iter_report_rows(tipo: str, filtro: dict) -> Iterator[list]:
+    """Filas del reporte leídas por bloques de REPORT_CHUNK_SIZE con su propia sesión"""
+    statement = build_report_statement(tipo, filtro)
+    with Session(engine) as session:
+        result = session.exec(
+            statement.execution_options(stream_results=True, yield_per=REPORT_CHUNK_SIZE)
+        )
+        for values in result:
+            yield _row(tipo, values)
+
+
+def iter_report_csv(tipo: str, filtro: dict) -> Iterator[str]:
+    """CSV del reporte codificado por bloques (para StreamingResponse)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_HEADERS[tipo])
+    for count, row in enumerate(iter_report_rows(tipo, filtro), start=1):
+        writer.writerow(row)
+        if count % REPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_report_xlsx(tipo: str, filtro: dict) -> str:
+    """
+    Escribir el reporte en un XLSX temporal y devolver su ruta
+
+    El libro es write_only: openpyxl vuelca cada fila al archivo en lugar de
+    mantener la hoja en memoria.
+    """
+    from openpyxl import Workbook
+
+    fd, path = tempfile.mkstemp(prefix=f"reporte_{tipo}_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title=tipo.capitalize())
+        sheet.append([REPORT_TITLES[tipo], datetime.now().isoformat(timespec="seconds")])
+        sheet.append([])
+        sheet.append(REPORT_HEADERS[tipo])
+        for row in iter_report_rows(tipo, filtro):
+            sheet.append(row)
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def render_report_pdf(tipo: str, filtro: dict) -> str:
+    """Escribir el reporte en un PDF temporal paginado y devolver su ruta"""
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.pdfgen import canvas
+
+    header = REPORT_HEADERS[tipo]
+    width, height = landscape(letter)
+    margin = 30
+    column_width = (width - 2 * margin) / len(header)
+    # Caracteres que caben en una columna con Helvetica 7
+    max_chars = max(int(column_width / 3.6), 4)
+    generated = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def text(value: Any) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        elif isinstance(value, datetime):
+            value = value.strftime('%Y-%m-%d %H:%M')
+        value = str(value)
+        return value if len(value) <= max_chars else value[:max_chars - 1] + "…"
+
+    def draw_row(pdf, y: float, values, font: str) -> None:
+        pdf.setFont(font, 7)
+        for index, value in enumerate(values):
+            pdf.drawString(margin + index * column_width, y, text(value))
+
+    def start_page(pdf, page: int) -> float:
+        pdf.setFont("Helvetica-Bold", 12)
+        pdf.drawString(margin, height - margin, REPORT_TITLES[tipo])
+        pdf.setFont("Helvetica", 8)
+        pdf.drawRightString(width - margin, height - margin, f"Generado: {generated} - Página {page}")
+        draw_row(pdf, height - margin - 24, header, "Helvetica-Bold")
+        return height - margin - 38
+
+    fd, path = tempfile.mkstemp(prefix=f"reporte_{tipo}_", suffix=".pdf")
+    os.close(fd)
+    try:
+        pdf = canvas.Canvas(path, pagesize=(width, height))
+        page = 1
+        y = start_page(pdf, page)
+        lines = 0
+        for row in iter_report_rows(tipo, filtro):
+            if lines == PDF_ROWS_PER_PAGE:
+                pdf.showPage()
+                page += 1
+                y = start_page(pdf, page)
+                lines = 0
+            draw_row(pdf, y, row, "Helvetica")
+            y -= 11
+            lines += 1
+        pdf.save()
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _init_render_worker() -> None:
+    # El proceso hijo no debe reutilizar las conexiones heredadas del padre
+    engine.dispose(close=False)
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=REPORT_RENDER_WORKERS, initializer=_init_render_worker
+        )
+    return _render_pool
+
+
+async def render_report(renderer, tipo: str, filtro: dict) -> str:
+    """Ejecutar render_report_xlsx/render_report_pdf fuera del event loop y devolver la ruta"""
+    loop = asyncio.get_running_loop()
+    if REPORT_RENDER_WORKERS <= 0:
+        return await loop.run_in_executor(None, renderer, tipo, filtro)
+    return await loop.run_in_executor(_get_render_pool(), renderer, tipo, filtro)
+
+
+# ==================== RESÚMENES ====================
+# Reportes que se pueden pedir como job (dependen de un periodo de fechas)
+REPORT_JOB_TYPES = ("ventas", "caja", "clientes")
+
+# Tablas de las que depende cada resumen: un commit que escribe en alguna
+# descarta los resultados guardados de ese tipo (ver ReportJobQueue.invalidate_tables)
+REPORT_TABLES = {
+    "ventas": {"sales", "sale_details", "sales_rollup_daily", "sales_rollup_hourly"},
+    "caja": {"cash_register_sessions"},
+    "clientes": {"customers", "customer_stats", "sales"},
+}
+
+
+def _sale_totals(db: Session, parsed: dict) -> dict:
+    """Totales desde sales para filtros que los rollups no cubren (cliente, producto, categoría)"""
+    conditions = [Sale.status == SaleStatus.completada, *_sale_conditions(parsed)]
+    day = func.date(Sale.sale_date)
+    totals = dict.fromkeys(SALES_ROLLUP_MEASURES, 0)
+    by_day = {}
+    for row_day, *amounts in db.exec(
+        select(
+            day, func.count(Sale.id), func.sum(Sale.subtotal), func.sum(Sale.discount_amount),
+            func.sum(Sale.tax_amount), func.sum(Sale.total_amount)
+        )
+        .where(*conditions)
+        .group_by(day)
+        .order_by(day)
+    ).all():
+        for measure, amount in zip(SALES_ROLLUP_MEASURES, amounts):
+            totals[measure] += amount or 0
+        by_day[str(row_day)] = {"sales_count": amounts[0], "total_amount": amounts[-1] or 0}
+    totals["by_day"] = by_day
+    return totals
+
+
+def report_summary(db: Session, tipo: str, filtro: dict) -> dict:
+    """
+    Resumen de ventas, caja o clientes (mismo formato que /reportes/{tipo})
+
+    Los totales se agregan en la base de datos; ventas cuenta solo ventas
+    completadas. Lanza ValueError con tipo o filtros inválidos.
+    """
+    if tipo not in REPORT_JOB_TYPES:
+        raise ValueError(f"Tipo de reporte no soportado: {tipo}")
+    parsed = _parse_filtro(filtro)
+    period = {"inicio": filtro.get("fecha_inicio"), "fin": filtro.get("fecha_fin")}
+
+    if tipo == "ventas":
+        if parsed["product_id"] or parsed["category_id"] or parsed["customer_id"]:
+            totals = _sale_totals(db, parsed)
+        else:
+            # Días y horas completos salen de los rollups: un año son unos cientos de filas
+            totals = sales_rollup.totals(
+                db, start=parsed["start"], end=parsed["end"], cashier_id=parsed["user_id"]
+            )
+        total_ventas = totals["sales_count"]
+        total_ingresos = totals["total_amount"]
+        return {
+            "total_ventas": total_ventas,
+            "total_ingresos": total_ingresos,
+            "total_descuentos": totals["discount_amount"],
+            "total_impuestos": totals["tax_amount"],
+            "promedio_venta": total_ingresos / total_ventas if total_ventas > 0 else 0,
+            "ventas_por_dia": {
+                dia: {"cantidad": values["sales_count"], "total": values["total_amount"]}
+                for dia, values in totals["by_day"].items()
+            },
+            "periodo": period
+        }
+
+    if tipo == "caja":
+        sessions = db.exec(
+            select(CashRegisterSession)
+            .where(*_session_conditions(parsed))
+            .order_by(CashRegisterSession.opening_date, CashRegisterSession.id)
+        ).all()
+        return {
+            "total_sesiones": len(sessions),
+            "total_ingresos": sum(s.opening_amount for s in sessions),
+            "total_cierres": sum(s.actual_closing_amount for s in sessions if s.actual_closing_amount),
+            "total_diferencias": sum(abs(s.difference) for s in sessions if s.difference),
+            "sesiones": [
+                {
+                    "id": str(s.id),
+                    "fecha_apertura": s.opening_date.isoformat(),
+                    "fecha_cierre": s.closing_date.isoformat() if s.closing_date else None,
+                    "monto_apertura": s.opening_amount,
+                    "monto_cierre": s.actual_closing_amount,
+                    "diferencia": s.difference,
+                    "status": _cell(s.status)
+                }
+                for s in sessions
+            ],
+            "periodo": period
+        }
+
+    totals = _customer_totals(parsed)
+    statement = (
+        select(
+            Customer.id, Customer.first_name, Customer.last_name, Customer.document_number,
+            Customer.email, Customer.phone, Customer.loyalty_points,
+            func.coalesce(totals.c.sales_count, 0), func.coalesce(totals.c.total_spent, 0.0),
+            func.coalesce(totals.c.average_ticket, 0.0), totals.c.last_purchase
+        )
+        .outerjoin(totals, totals.c.customer_id == Customer.id)
+        .where(Customer.is_active == True)
+        .order_by(func.coalesce(totals.c.total_spent, 0.0).desc(), Customer.id)
+    )
+    if parsed["customer_id"]:
+        statement = statement.where(Customer.id == parsed["customer_id"])
+    clientes = [
+        {
+            "id": str(id_),
+            "nombre": f"{first_name} {last_name}",
+            "documento": document,
+            "email": email,
+            "telefono": phone,
+            "puntos_fidelidad": points,
+            "total_compras": sales_count,
+            "total_gastado": float(total_spent),
+            "ticket_promedio": float(average_ticket),
+            "ultima_compra": last_purchase.isoformat() if last_purchase else None
+        }
+        for (
+            id_, first_name, last_name, document, email, phone, points,
+            sales_count, total_spent, average_ticket, last_purchase
+        ) in db.exec(statement).all()
+    ]
+    return {
+        "total_clientes": len(clientes),
+        "total_puntos_sistema": sum(c["puntos_fidelidad"] for c in clientes),
+        "clientes": clientes,
+        "top_clientes": clientes[:10],
+        "periodo": period
+    }
+
+
+# ==================== JOBS ====================
+# Resultados de jobs y reportes guardados en disco, por hash de tipo + filtro
+REPORT_CACHE_DIR = os.getenv(
+    "REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "minimercado_reportes")
+)
+
+# Jobs ejecutándose a la vez y jobs en espera admitidos
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_MAX_PENDING = int(os.getenv("REPORT_JOB_MAX_PENDING", "20"))
+
+# Vigencia (segundos) de un resultado de periodo cerrado (fecha_fin pasada) y de
+# uno abierto, que todavía puede cambiar con ventas nuevas
+REPORT_RESULT_TTL = int(os.getenv("REPORT_RESULT_TTL", "86400"))
+REPORT_OPEN_RESULT_TTL = int(os.getenv("REPORT_OPEN_RESULT_TTL", "60"))
+
+
+class ReportQueueFull(Exception):
+    """Hay REPORT_JOB_MAX_PENDING jobs sin terminar"""
+
+
+def report_cache_key(tipo: str, filtro: dict) -> str:
+    """`<tipo>-<hash>`: hash estable de tipo + FiltroReporte"""
+    payload = json.dumps({"tipo": tipo, "filtro": filtro}, sort_keys=True, default=str)
+    return f"{tipo}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def is_closed_period(filtro: dict) -> bool:
+    """True si fecha_fin ya pasó: el resultado no cambia y se guarda REPORT_RESULT_TTL"""
+    end = _parse_date(filtro.get("fecha_fin"), "fecha_fin")
+    return end is not None and end < datetime.utcnow()
+
+
+class ReportJobQueue:
+    """
+    Jobs de reportes en un pool de hilos acotado, con resultados en disco
+
+    El archivo del resultado se llama `<llave>.json` si el periodo estaba
+    cerrado al calcularlo y `<llave>.open.json` si no; cada uno vence con su
+    TTL. Su fecha de modificación es el inicio del cálculo: un commit en las
+    tablas del tipo toca `<tipo>.stamp` y los resultados calculados antes
+    dejan de valer. Los archivos están en disco, así la invalidación llega a
+    todos los workers que comparten REPORT_CACHE_DIR. Un pedido con el mismo
+    hash que un job en curso recibe ese job.
+    """
+
+    def __init__(self, cache_dir: str, workers: int, max_pending: int):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._last_sweep = 0.0
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        return (
+            os.path.join(self.cache_dir, f"{key}.json"),
+            os.path.join(self.cache_dir, f"{key}.open.json"),
+        )
+
+    def _stamp_path(self, tipo: str) -> str:
+        return os.path.join(self.cache_dir, f"{tipo}.stamp")
+
+    def _invalidated_at(self, tipo: str) -> float:
+        """Último commit en las tablas del tipo (0 si no hubo ninguno)"""
+        try:
+            return os.path.getmtime(self._stamp_path(tipo))
+        except OSError:
+            return 0.0
+
+    def invalidate_tables(self, tables: set[str]) -> None:
+        """Descartar los resultados de los tipos que dependen de alguna de las tablas"""
+        for tipo, depends in REPORT_TABLES.items():
+            if not depends & tables:
+                continue
+            path = self._stamp_path(tipo)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(path, "a"):
+                    os.utime(path, None)
+            except OSError:
+                continue
+
+    def cached_path(self, key: str) -> Optional[str]:
+        """Archivo vigente del resultado o None"""
+        now = time.time()
+        invalidated_at = self._invalidated_at(key.split("-", 1)[0])
+        for path, ttl in zip(self._paths(key), (REPORT_RESULT_TTL, REPORT_OPEN_RESULT_TTL)):
+            try:
+                started = os.path.getmtime(path)
+            except OSError:
+                continue
+            if now - started <= ttl and started > invalidated_at:
+                return path
+        return None
+
+    def store(self, key: str, tipo: str, filtro: dict, result: dict, closed: bool, started: float) -> str:
+        """Guardar un resultado calculado desde `started` (escritura atómica) y devolver su ruta"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._paths(key)[0 if closed else 1]
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({
+                "tipo": tipo,
+                "filtro": filtro,
+                "generado": datetime.utcnow().isoformat(),
+                "resultado": result
+            }, f, default=str)
+        os.utime(tmp_path, (started, started))
+        os.replace(tmp_path, path)
+        return path
+
+    def cached_summary(self, db: Session, tipo: str, filtro: dict) -> dict:
+        """Resumen desde disco si está vigente; si no, calcularlo y guardarlo"""
+        key = report_cache_key(tipo, filtro)
+        path = self.cached_path(key)
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    return json.load(f)["resultado"]
+            except (OSError, ValueError):
+                pass
+        closed = is_closed_period(filtro)
+        started = time.time()
+        result = report_summary(db, tipo, filtro)
+        self.store(key, tipo, filtro, result, closed, started)
+        return result
+
+    def submit(self, tipo: str, filtro: dict, user_id: Optional[UUID] = None) -> dict:
+        """
+        Encolar un reporte y devolver el job
+
+        Si hay un resultado vigente el job nace completado. Lanza ValueError
+        con filtros inválidos y ReportQueueFull si la cola está llena.
+        """
+        if tipo not in REPORT_JOB_TYPES:
+            raise ValueError(f"Tipo de reporte no soportado: {tipo}")
+        _parse_filtro(filtro)
+        self._sweep()
+        key = report_cache_key(tipo, filtro)
+        now = datetime.utcnow()
+        with self._lock:
+            for job in self._jobs.values():
+                if job["key"] == key and job["estado"] in ("pendiente", "en_proceso"):
+                    return self._view(job)
+            job = {
+                "id": str(uuid4()),
+                "key": key,
+                "tipo": tipo,
+                "filtro": filtro,
+                "solicitado_por": str(user_id) if user_id else None,
+                "estado": "pendiente",
+                "desde_cache": False,
+                "creado": now,
+                "iniciado": None,
+                "finalizado": None,
+                "error": None,
+                "path": None,
+            }
+            path = self.cached_path(key)
+            if path:
+                job.update(estado="completado", desde_cache=True, finalizado=now, path=path)
+            else:
+                unfinished = sum(
+                    1 for j in self._jobs.values() if j["estado"] in ("pendiente", "en_proceso")
+                )
+                if unfinished >= self.max_pending:
+                    raise ReportQueueFull("Demasiados reportes en cola, intente más tarde")
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="reportes"
+                    )
+                self._executor.submit(self._run, job)
+            self._jobs[job["id"]] = job
+            return self._view(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Estado del job o None si no existe o ya venció"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        """Archivo del resultado de un job completado (None si no existe o venció)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            path = job["path"] if job and job["estado"] == "completado" else None
+        return path if path and os.path.exists(path) else None
+
+    def _run(self, job: dict) -> None:
+        with self._lock:
+            job.update(estado="en_proceso", iniciado=datetime.utcnow())
+        try:
+            closed = is_closed_period(job["filtro"])
+            started = time.time()
+            with Session(engine) as session:
+                result = report_summary(session, job["tipo"], job["filtro"])
+            path = self.store(job["key"], job["tipo"], job["filtro"], result, closed, started)
+        except Exception as e:
+            with self._lock:
+                job.update(estado="error", error=str(e), finalizado=datetime.utcnow())
+            return
+        with self._lock:
+            job.update(estado="completado", path=path, finalizado=datetime.utcnow())
+
+    def _sweep(self) -> None:
+        """Borrar jobs terminados y archivos vencidos (como mucho una vez por minuto)"""
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        limit = datetime.utcnow() - timedelta(seconds=REPORT_RESULT_TTL)
+        with self._lock:
+            for job_id in [
+                job_id for job_id, job in self._jobs.items()
+                if job["finalizado"] and job["finalizado"] < limit
+            ]:
+                del self._jobs[job_id]
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith(".stamp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            ttl = REPORT_OPEN_RESULT_TTL if name.endswith(".open.json") else REPORT_RESULT_TTL
+            try:
+                if now - os.path.getmtime(path) > max(ttl, 60):
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _view(self, job: dict) -> dict:
+        return {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in job.items()
+            if key not in ("key", "path")
+        }
+
+
+report_jobs = ReportJobQueue(REPORT_CACHE_DIR, REPORT_JOB_WORKERS, REPORT_JOB_MAX_PENDING)
+on_tables_committed(report_jobs.invalidate_tables)
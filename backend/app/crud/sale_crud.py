@@ -1,12 +1,25 @@
 from typing import Optional, List
-from sqlmodel import Session, select
+from sqlmodel import Session, select, func
+from sqlalchemy import and_, or_, delete, insert, cast, extract, Integer
+from sqlalchemy.orm import selectinload
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
 from app.models.models import (
-    Sale, SaleDetail, Promotion, Invoice, SaleStatus, PromotionType
+    Sale, SaleDetail, Promotion, Invoice, SaleStatus, PromotionType, Product,
+    SalesDailyRollup, SalesHourlyRollup, ProductSalesRollup
 )
-from .base_crud import CRUDBase
+from .base_crud import CRUDBase, dialect_insert
+from .caja_crud import customer_stats
+
+
+def with_sale_relations(statement):
+    """Cliente, cajero y detalles precargados: una consulta por relación sin importar cuántas ventas"""
+    return statement.options(
+        selectinload(Sale.customer),
+        selectinload(Sale.cashier),
+        selectinload(Sale.details)
+    )
 
 
 class CRUDSale(CRUDBase[Sale, Sale, Sale]):
@@ -17,22 +30,22 @@ class CRUDSale(CRUDBase[Sale, Sale, Sale]):
     
     def get_by_cashier(self, db: Session, *, cashier_id: UUID) -> List[Sale]:
         """Obtener ventas de un cajero"""
-        statement = select(Sale).where(Sale.cashier_id == cashier_id)
+        statement = with_sale_relations(select(Sale).where(Sale.cashier_id == cashier_id))
         return db.exec(statement).all()
     
     def get_by_customer(self, db: Session, *, customer_id: UUID) -> List[Sale]:
         """Obtener ventas de un cliente"""
-        statement = select(Sale).where(Sale.customer_id == customer_id)
+        statement = with_sale_relations(select(Sale).where(Sale.customer_id == customer_id))
         return db.exec(statement).all()
     
     def get_by_cash_register(self, db: Session, *, cash_register_id: UUID) -> List[Sale]:
         """Obtener ventas de una caja registradora"""
-        statement = select(Sale).where(Sale.cash_register_id == cash_register_id)
+        statement = with_sale_relations(select(Sale).where(Sale.cash_register_id == cash_register_id))
         return db.exec(statement).all()
     
     def get_by_status(self, db: Session, *, status: SaleStatus) -> List[Sale]:
         """Obtener ventas por estado"""
-        statement = select(Sale).where(Sale.status == status)
+        statement = with_sale_relations(select(Sale).where(Sale.status == status))
         return db.exec(statement).all()
     
     def get_by_date_range(
@@ -43,10 +56,10 @@ class CRUDSale(CRUDBase[Sale, Sale, Sale]):
         end_date: datetime
     ) -> List[Sale]:
         """Obtener ventas en un rango de fechas"""
-        statement = select(Sale).where(
+        statement = with_sale_relations(select(Sale).where(
             Sale.sale_date >= start_date,
             Sale.sale_date <= end_date
-        )
+        )).order_by(Sale.sale_date, Sale.id)
         return db.exec(statement).all()
     
     def get_today_sales(self, db: Session) -> List[Sale]:
@@ -57,15 +70,16 @@ class CRUDSale(CRUDBase[Sale, Sale, Sale]):
     
     def get_with_details(self, db: Session, *, id: UUID) -> Optional[Sale]:
         """Obtener venta con sus detalles"""
-        sale = self.get(db, id)
-        if sale:
-            _ = sale.details
-            _ = sale.payments
-        return sale
+        statement = with_sale_relations(select(Sale).where(Sale.id == id)).options(
+            selectinload(Sale.payments)
+        )
+        return db.exec(statement).first()
     
     def cancel_sale(self, db: Session, *, id: UUID) -> Sale:
-        """Cancelar una venta"""
+        """Cancelar una venta (una venta completada sale de los rollups y estadísticas)"""
         sale = self.get(db, id)
+        if sale.status == SaleStatus.completada:
+            apply_sale_aggregates(db, sales=[sale], sign=-1)
         sale.status = SaleStatus.cancelada
         db.add(sale)
         db.commit()
@@ -79,10 +93,8 @@ class CRUDSale(CRUDBase[Sale, Sale, Sale]):
         start_date: datetime, 
         end_date: datetime
     ) -> float:
-        """Obtener el monto total de ventas en un periodo"""
-        sales = self.get_by_date_range(db, start_date=start_date, end_date=end_date)
-        completed_sales = [s for s in sales if s.status == SaleStatus.completada]
-        return sum(s.total_amount for s in completed_sales)
+        """Obtener el monto total de ventas completadas en un periodo (desde los rollups)"""
+        return sales_rollup.totals(db, start=start_date, end=end_date)["total_amount"]
 
 
 class CRUDSaleDetail(CRUDBase[SaleDetail, SaleDetail, SaleDetail]):
@@ -104,14 +116,10 @@ class CRUDSaleDetail(CRUDBase[SaleDetail, SaleDetail, SaleDetail]):
         end_date: datetime,
         limit: int = 10
     ) -> List[tuple]:
-        """Obtener productos más vendidos en un periodo"""
-        # Esta consulta requiere agregación SQL avanzada
-        # Se implementaría con select específico o raw SQL
-        # Por ahora retornamos estructura básica
-        statement = select(SaleDetail)
-        details = db.exec(statement).all()
-        # Implementar lógica de agrupación y ordenamiento
-        return []
+        """Productos más vendidos en un periodo: (product_id, cantidad, total) por día completo"""
+        return sales_rollup.top_products(
+            db, start_date=start_date.date(), end_date=end_date.date(), limit=limit
+        )
 
 
 class CRUDPromotion(CRUDBase[Promotion, Promotion, Promotion]):
@@ -149,6 +157,13 @@ class CRUDPromotion(CRUDBase[Promotion, Promotion, Promotion]):
 
 
 class CRUDInvoice(CRUDBase[Invoice, Invoice, Invoice]):
+    def create(self, db: Session, *, obj_in: Invoice) -> Invoice:
+        """Crear factura con número correlativo"""
+        from .numbering_crud import document_counter
+        return document_counter.create_numbered(
+            db, crud=self, obj_in=obj_in, field="invoice_number", kind="invoice"
+        )
+    
     def get_by_invoice_number(self, db: Session, *, invoice_number: str) -> Optional[Invoice]:
         """Obtener factura por número"""
         statement = select(Invoice).where(Invoice.invoice_number == invoice_number)
@@ -188,8 +203,304 @@ class CRUDInvoice(CRUDBase[Invoice, Invoice, Invoice]):
         return invoice
 
 
+# ==================== ROLLUPS DE VENTAS ====================
+SALES_ROLLUP_MEASURES = ("sales_count", "subtotal", "discount_amount", "tax_amount", "total_amount")
+PRODUCT_ROLLUP_MEASURES = ("quantity", "line_count", "subtotal", "discount_amount", "tax_amount", "total_amount")
+
+
+def _floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(moment: datetime) -> datetime:
+    floor = _floor_hour(moment)
+    return floor if floor == moment else floor + timedelta(hours=1)
+
+
+def _floor_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil_day(moment: datetime) -> datetime:
+    floor = _floor_day(moment)
+    return floor if floor == moment else floor + timedelta(days=1)
+
+
+def _rollup_segments(start: Optional[datetime], end: Optional[datetime]) -> list[tuple]:
+    """
+    Partir [start, end) en tramos (fuente, desde, hasta): "daily" para días
+    completos, "hourly" para horas completas y "raw" para los extremos que
+    no llegan a una hora. None es un extremo abierto.
+    """
+    day_from = _ceil_day(start) if start else None
+    day_to = _floor_day(end) if end else None
+    if day_from is not None and day_to is not None and day_from >= day_to:
+        partial = [(start, end)]
+        segments = []
+    else:
+        partial = [(start, day_from), (day_to, end)]
+        segments = [("daily", day_from, day_to)]
+    for lower, upper in partial:
+        if lower is None or upper is None or lower >= upper:
+            continue
+        hour_from, hour_to = _ceil_hour(lower), _floor_hour(upper)
+        if hour_from >= hour_to:
+            segments.append(("raw", lower, upper))
+            continue
+        if lower < hour_from:
+            segments.append(("raw", lower, hour_from))
+        segments.append(("hourly", hour_from, hour_to))
+        if hour_to < upper:
+            segments.append(("raw", hour_to, upper))
+    return segments
+
+
+class CRUDSalesRollup(CRUDBase[SalesDailyRollup, SalesDailyRollup, SalesDailyRollup]):
+    def apply_sales(
+        self,
+        db: Session,
+        *,
+        sales: List[Sale],
+        sign: int = 1,
+        categories: Optional[dict[UUID, Optional[UUID]]] = None
+    ) -> None:
+        """
+        Sumar (sign=1) o restar (sign=-1) ventas en los rollups diario, horario y por producto
+
+        Corre dentro de la transacción de la venta o la cancelación: cada fila
+        se actualiza con un INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x,
+        en orden de llave para que dos cajas no se bloqueen entre sí.
+        `categories` (product_id -> category_id) evita releer los productos.
+        """
+        if not sales:
+            return
+        if categories is None:
+            product_ids = list({detail.product_id for sale in sales for detail in sale.details})
+            categories = dict(db.exec(
+                select(Product.id, Product.category_id).where(Product.id.in_(product_ids))
+            ).all()) if product_ids else {}
+
+        daily: dict[tuple, list] = {}
+        hourly: dict[tuple, list] = {}
+        products: dict[tuple, list] = {}
+        for sale in sales:
+            day = sale.sale_date.date()
+            amounts = (1, sale.subtotal, sale.discount_amount, sale.tax_amount, sale.total_amount)
+            self._add(daily, (day, sale.cash_register_id, sale.cashier_id), amounts, sign)
+            self._add(hourly, (day, sale.sale_date.hour, sale.cash_register_id, sale.cashier_id), amounts, sign)
+            for detail in sale.details:
+                self._add(
+                    products,
+                    (day, detail.product_id),
+                    (detail.quantity, 1, detail.subtotal, detail.discount_amount, detail.tax_amount, detail.total),
+                    sign
+                )
+
+        self._upsert(db, SalesDailyRollup, ("business_date", "cash_register_id", "cashier_id"),
+                     SALES_ROLLUP_MEASURES, daily)
+        self._upsert(db, SalesHourlyRollup, ("business_date", "hour", "cash_register_id", "cashier_id"),
+                     SALES_ROLLUP_MEASURES, hourly)
+        self._upsert(db, ProductSalesRollup, ("business_date", "product_id"),
+                     PRODUCT_ROLLUP_MEASURES, products,
+                     replace={"category_id": lambda key: categories.get(key[1])})
+
+    def _add(self, totals: dict, key: tuple, amounts: tuple, sign: int) -> None:
+        current = totals.setdefault(key, [0] * len(amounts))
+        for index, amount in enumerate(amounts):
+            current[index] += sign * amount
+
+    def _upsert(
+        self, db: Session, model, keys: tuple, measures: tuple, totals: dict, replace: Optional[dict] = None
+    ) -> None:
+        """Sumar `totals` (llave -> montos) a las filas; `replace` son columnas que se sobrescriben"""
+        if not totals:
+            # Sin filas: un executemany vacío insertaría una fila de NULLs
+            return
+        replace = replace or {}
+        records = [
+            {
+                **dict(zip(keys, key)),
+                **dict(zip(measures, totals[key])),
+                **{column: value_for(key) for column, value_for in replace.items()}
+            }
+            for key in sorted(totals)
+        ]
+        table = model.__table__
+        statement = dialect_insert(db)(table)
+        set_ = {measure: table.c[measure] + statement.excluded[measure] for measure in measures}
+        set_.update({column: statement.excluded[column] for column in replace})
+        # executemany: la sentencia se compila una vez para todas las filas
+        db.execute(statement.on_conflict_do_update(index_elements=list(keys), set_=set_), records)
+
+    def totals(
+        self,
+        db: Session,
+        *,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        cashier_id: Optional[UUID] = None
+    ) -> dict:
+        """
+        Totales de ventas completadas entre start y end (ambos inclusive, None = abierto)
+
+        Los días completos salen de sales_rollup_daily, las horas completas de
+        sales_rollup_hourly y solo los minutos de los extremos se leen de sales.
+        Incluye `by_day`: {fecha ISO: {"sales_count", "total_amount"}}.
+        """
+        # Los tramos son [desde, hasta): el fin inclusivo pasa a exclusivo
+        end_exclusive = end + timedelta(microseconds=1) if end else None
+        result = {measure: 0 for measure in SALES_ROLLUP_MEASURES}
+        by_day: dict[str, dict] = {}
+
+        for source, lower, upper in _rollup_segments(start, end_exclusive):
+            if source == "daily":
+                day = SalesDailyRollup.business_date
+                statement = select(day, *[func.sum(getattr(SalesDailyRollup, m)) for m in SALES_ROLLUP_MEASURES])
+                if lower:
+                    statement = statement.where(day >= lower.date())
+                if upper:
+                    statement = statement.where(day < upper.date())
+                if cashier_id:
+                    statement = statement.where(SalesDailyRollup.cashier_id == cashier_id)
+            elif source == "hourly":
+                day = SalesHourlyRollup.business_date
+                hour = SalesHourlyRollup.hour
+                statement = select(day, *[func.sum(getattr(SalesHourlyRollup, m)) for m in SALES_ROLLUP_MEASURES]).where(
+                    or_(day > lower.date(), and_(day == lower.date(), hour >= lower.hour)),
+                    or_(day < upper.date(), and_(day == upper.date(), hour < upper.hour))
+                )
+                if cashier_id:
+                    statement = statement.where(SalesHourlyRollup.cashier_id == cashier_id)
+            else:
+                day = func.date(Sale.sale_date)
+                statement = select(
+                    day, func.count(Sale.id), func.sum(Sale.subtotal), func.sum(Sale.discount_amount),
+                    func.sum(Sale.tax_amount), func.sum(Sale.total_amount)
+                ).where(
+                    Sale.status == SaleStatus.completada,
+                    Sale.sale_date >= lower,
+                    Sale.sale_date < upper
+                )
+                if cashier_id:
+                    statement = statement.where(Sale.cashier_id == cashier_id)
+
+            for row_day, *amounts in db.exec(statement.group_by(day)).all():
+                key = str(row_day)
+                entry = by_day.setdefault(key, {"sales_count": 0, "total_amount": 0.0})
+                for measure, amount in zip(SALES_ROLLUP_MEASURES, amounts):
+                    result[measure] += amount or 0
+                entry["sales_count"] += amounts[0] or 0
+                entry["total_amount"] += amounts[-1] or 0
+
+        result["by_day"] = dict(sorted(by_day.items()))
+        return result
+
+    def top_products(
+        self,
+        db: Session,
+        *,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        category_ids=None,
+        limit: int = 10
+    ) -> List[tuple]:
+        """(product_id, cantidad, total) más vendidos entre dos días (inclusive) desde product_sales_rollup"""
+        statement = select(
+            ProductSalesRollup.product_id,
+            func.sum(ProductSalesRollup.quantity),
+            func.sum(ProductSalesRollup.total_amount)
+        )
+        if start_date:
+            statement = statement.where(ProductSalesRollup.business_date >= start_date)
+        if end_date:
+            statement = statement.where(ProductSalesRollup.business_date <= end_date)
+        if category_ids is not None:
+            statement = statement.where(ProductSalesRollup.category_id.in_(category_ids))
+        statement = (
+            statement.group_by(ProductSalesRollup.product_id)
+            .order_by(func.sum(ProductSalesRollup.quantity).desc(), ProductSalesRollup.product_id)
+            .limit(limit)
+        )
+        return db.exec(statement).all()
+
+    def rebuild(
+        self,
+        db: Session,
+        *,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> dict:
+        """
+        Recalcular los rollups desde sales/sale_details entre dos días (inclusive, None = todo)
+
+        Borra las filas del rango y las vuelve a insertar con INSERT ... SELECT
+        agrupado en la base de datos. No hace commit.
+        """
+        sale_conditions = [Sale.status == SaleStatus.completada]
+        if start_date:
+            sale_conditions.append(Sale.sale_date >= datetime.combine(start_date, datetime.min.time()))
+        if end_date:
+            sale_conditions.append(
+                Sale.sale_date < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+            )
+        day = func.date(Sale.sale_date)
+        hour = cast(extract("hour", Sale.sale_date), Integer)
+        sums = [func.sum(Sale.subtotal), func.sum(Sale.discount_amount), func.sum(Sale.tax_amount), func.sum(Sale.total_amount)]
+
+        counts = {}
+        for model in (SalesDailyRollup, SalesHourlyRollup, ProductSalesRollup):
+            statement = delete(model)
+            if start_date:
+                statement = statement.where(model.business_date >= start_date)
+            if end_date:
+                statement = statement.where(model.business_date <= end_date)
+            db.execute(statement)
+
+        counts["daily"] = db.execute(insert(SalesDailyRollup).from_select(
+            ["business_date", "cash_register_id", "cashier_id", *SALES_ROLLUP_MEASURES],
+            select(day, Sale.cash_register_id, Sale.cashier_id, func.count(Sale.id), *sums)
+            .where(*sale_conditions)
+            .group_by(day, Sale.cash_register_id, Sale.cashier_id)
+        )).rowcount
+        counts["hourly"] = db.execute(insert(SalesHourlyRollup).from_select(
+            ["business_date", "hour", "cash_register_id", "cashier_id", *SALES_ROLLUP_MEASURES],
+            select(day, hour, Sale.cash_register_id, Sale.cashier_id, func.count(Sale.id), *sums)
+            .where(*sale_conditions)
+            .group_by(day, hour, Sale.cash_register_id, Sale.cashier_id)
+        )).rowcount
+        counts["products"] = db.execute(insert(ProductSalesRollup).from_select(
+            ["business_date", "product_id", "category_id", *PRODUCT_ROLLUP_MEASURES],
+            select(
+                day, SaleDetail.product_id, Product.category_id,
+                func.sum(SaleDetail.quantity), func.count(SaleDetail.id), func.sum(SaleDetail.subtotal),
+                func.sum(SaleDetail.discount_amount), func.sum(SaleDetail.tax_amount), func.sum(SaleDetail.total)
+            )
+            .join(Sale, SaleDetail.sale_id == Sale.id)
+            .outerjoin(Product, SaleDetail.product_id == Product.id)
+            .where(*sale_conditions)
+            .group_by(day, SaleDetail.product_id, Product.category_id)
+        )).rowcount
+        return counts
+
+
+def apply_sale_aggregates(
+    db: Session,
+    *,
+    sales: List[Sale],
+    sign: int = 1,
+    categories: Optional[dict[UUID, Optional[UUID]]] = None
+) -> None:
+    """
+    Llevar ventas completadas (sign=1) o retiradas (sign=-1) a los rollups y a
+    las estadísticas de clientes, dentro de la transacción en curso
+    """
+    sales_rollup.apply_sales(db, sales=sales, sign=sign, categories=categories)
+    customer_stats.apply_sales(db, sales=sales, sign=sign)
+
+
 # Instancias globales
 sale = CRUDSale(Sale)
 sale_detail = CRUDSaleDetail(SaleDetail)
 promotion = CRUDPromotion(Promotion)
-invoice = CRUDInvoice(Invoice)
\ No newline at end of file
+invoice = CRUDInvoice(Invoice)
+sales_rollup = CRUDSalesRollup(SalesDailyRollup)
\ No newline at end of file
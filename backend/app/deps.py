@@ -2,15 +2,22 @@
 Sistema de Dependencias para FastAPI
 Incluye autenticación, autorización y acceso a CRUD
 """
-from typing import Optional, Annotated
+import os
+import json
+import time
+import hashlib
+from typing import Optional, Annotated, Any, Callable
 from fastapi import Depends, HTTPException, status, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from uuid import UUID
 
 # Imports de autenticación
 from app.auth.auth import decode_token
-from app.db.database import get_session
+from app.db.database import get_session, get_async_session
 
 # Imports de CRUD
 from app.crud.users_crud import user, profile, permission, system_parameter
@@ -27,7 +34,8 @@ from app.crud.caja_crud import (
     customer, customer_preference, loyalty_transaction, customer_notification
 )
 
-from app.models.models import User, Profile
+from app.crud.idempotency_crud import idempotency_key
+from app.models.models import User, Profile, IdempotencyKey
 
 
 # ==================== CONFIGURACIÓN DE SEGURIDAD ====================
@@ -45,6 +53,12 @@ def get_db():
         session.close()
 
 
+async def get_async_db():
+    """Obtener sesión asíncrona de base de datos (no bloquea el event loop)"""
+    async for session in get_async_session():
+        yield session
+
+
 async def get_token(token: str = Depends(oauth2_scheme)) -> str:
     """Obtener token del header"""
     return token
@@ -344,6 +358,8 @@ def get_customer_notification_crud(db: Session = Depends(get_db)):
 CurrentUser = Annotated[User, Depends(get_current_user)]
 ActiveUser = Annotated[User, Depends(get_current_active_user)]
 DBSession = Annotated[Session, Depends(get_db)]
+AsyncDBSession = Annotated[AsyncSession, Depends(get_async_db)]
+IdempotencyKeyHeader = Annotated[Optional[str], Header(alias="Idempotency-Key", max_length=255)]
 
 
 # ==================== PERMISOS PREDEFINIDOS ====================
@@ -451,10 +467,106 @@ async def get_optional_user(
         return None
 
 
+
+# ==================== IDEMPOTENCIA ====================
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_SWEEP_SECONDS = 300
+# Una llave en proceso más antigua que esto es de un intento que murió antes de
+# confirmar (la respuesta se guarda en la misma transacción que la operación)
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+_last_idempotency_sweep = 0.0
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Hash estable del cuerpo de la solicitud"""
+    return hashlib.sha256(
+        json.dumps(jsonable_encoder(payload), sort_keys=True).encode()
+    ).hexdigest()
+
+
+def run_idempotent(
+    db: Session,
+    *,
+    key: Optional[str],
+    user_id: UUID,
+    endpoint: str,
+    payload: Any,
+    handler: Callable[[Session, Optional[IdempotencyKey]], Any]
+) -> Any:
+    """
+    Ejecutar una operación de escritura respetando el header Idempotency-Key
+    
+    La primera solicitud reserva la llave y ejecuta la operación; el handler
+    recibe el registro de la llave (None sin header) y guarda su respuesta con
+    `stage_idempotent_response` antes de su commit, así operación y respuesta
+    se confirman juntas. Los reintentos con la misma llave reciben esa
+    respuesta sin repetir la operación. Si la operación falla la llave se libera.
+    """
+    global _last_idempotency_sweep
+
+    if not key:
+        return handler(db, None)
+
+    # Barrido de llaves vencidas, como máximo una vez por intervalo en cada worker
+    if time.monotonic() - _last_idempotency_sweep > IDEMPOTENCY_SWEEP_SECONDS:
+        _last_idempotency_sweep = time.monotonic()
+        idempotency_key.purge_expired(db)
+
+    request_hash = request_fingerprint(payload)
+    record, created = idempotency_key.claim(
+        db,
+        user_id=user_id,
+        key=key,
+        endpoint=endpoint,
+        request_hash=request_hash,
+        ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+        lease_seconds=IDEMPOTENCY_LEASE_SECONDS
+    )
+    # La reserva se confirma sola: los reintentos deben verla en proceso
+    db.commit()
+
+    if not created:
+        if record is None or record.status != "completado":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Ya hay una solicitud en proceso con esta Idempotency-Key"
+            )
+        if record.endpoint != endpoint or record.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="La Idempotency-Key ya se usó con una solicitud diferente"
+            )
+        return JSONResponse(
+            status_code=record.response_code,
+            content=json.loads(record.response_body),
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    try:
+        result = handler(db, record)
+    except Exception:
+        idempotency_key.release(db, user_id=user_id, key=key)
+        raise
+
+    body = jsonable_encoder(result)
+    if record.status != "completado":
+        # Handler que no guardó su respuesta: se completa en una transacción aparte
+        idempotency_key.complete(db, record=record, status_code=status.HTTP_200_OK, body=body)
+    return body
+
+
+def stage_idempotent_response(db: Session, record: Optional[IdempotencyKey], response: Any) -> None:
+    """Dejar la respuesta de la llave en la transacción en curso (se confirma con la operación)"""
+    if record is not None:
+        idempotency_key.stage(
+            db, record=record, status_code=status.HTTP_200_OK, body=jsonable_encoder(response)
+        )
+
 # ==================== EXPORT ====================
 __all__ = [
     # Básicas
     "get_db",
+    "get_async_db",
     "get_token",
     "get_current_user",
     "get_current_active_user",
@@ -464,6 +576,8 @@ __all__ = [
     "PermissionChecker",
     "require_role",
     "verify_resource_ownership",
+    "run_idempotent",
+    "request_fingerprint",
     
     # CRUD Usuarios
     "get_user_crud",
@@ -516,6 +630,9 @@ __all__ = [
     "CurrentUser",
     "ActiveUser",
     "DBSession",
+    "AsyncDBSession",
+    "IdempotencyKeyHeader",
+    "stage_idempotent_response",
     
     # Permisos predefinidos
     "RequireUserRead",
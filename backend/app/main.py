@@ -18,6 +18,8 @@ from app.routers import (
     router_dashboard,
     router_reportes
 )
+# Registra en cada worker la invalidación del caché de reportes al confirmar escrituras
+import app.crud.report_crud  # noqa: F401
 
 app = FastAPI(
     title="Minimercado - Backend",
@@ -44,6 +46,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permitir todos los métodos
     allow_headers=["*"],  # Permitir todos los headers
+    expose_headers=["X-Next-Cursor"],  # Cursor de la página siguiente (paginación por cursor)
     max_age=3600,
 )
 
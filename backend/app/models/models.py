@@ -2,8 +2,9 @@
 from typing import Optional
 from app.models.enums import *
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import BigInteger, Column
 from uuid import uuid4, UUID
-from datetime import datetime
+from datetime import datetime, date
 
 class ProfilePermission(SQLModel, table=True):
     __tablename__ = "profile_permissions"
@@ -79,6 +80,26 @@ class SystemParameter(SQLModel, table=True):
     updated_by: Optional[UUID] = Field(default=None, foreign_key="users.id")
 
 
+class DocumentCounter(SQLModel, table=True):
+    __tablename__ = "document_counters"
+    prefix: str = Field(primary_key=True)
+    period: str = Field(primary_key=True)  # YYYYMMDD
+    last_value: int = 0
+
+
+class IdempotencyKey(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+    user_id: UUID = Field(foreign_key="users.id", primary_key=True)
+    key: str = Field(primary_key=True, max_length=255)
+    endpoint: str
+    request_hash: str
+    status: str = "en_proceso"  # en_proceso, completado
+    response_code: Optional[int] = None
+    response_body: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
 # ==================== MÓDULO DE PRODUCTOS ====================
 class Category(SQLModel, table=True):
     __tablename__ = "categories"
@@ -92,6 +113,14 @@ class Category(SQLModel, table=True):
     promotions: list["Promotion"] = Relationship(back_populates="categories", link_model=PromotionCategory)
 
 
+class CategoryClosure(SQLModel, table=True):
+    """Pares ancestro-descendiente del árbol de categorías (incluye cada categoría consigo misma, depth 0)"""
+    __tablename__ = "category_closure"
+    ancestor_id: UUID = Field(foreign_key="categories.id", primary_key=True)
+    descendant_id: UUID = Field(foreign_key="categories.id", primary_key=True, index=True)
+    depth: int = 0
+
+
 class Brand(SQLModel, table=True):
     __tablename__ = "brands"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
@@ -106,7 +135,7 @@ class Product(SQLModel, table=True):
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
     sku: str = Field(unique=True, index=True)
     barcode: Optional[str] = Field(default=None, index=True)
-    name: str
+    name: str = Field(index=True)
     description: Optional[str] = None
     category_id: Optional[UUID] = Field(default=None, foreign_key="categories.id")
     brand_id: Optional[UUID] = Field(default=None, foreign_key="brands.id")
@@ -121,6 +150,8 @@ class Product(SQLModel, table=True):
     requires_lot_control: bool = False
     requires_expiration_date: bool = False
     is_active: bool = True
+    search_text: Optional[str] = None  # nombre, SKU y código normalizados (ver products_crud.search)
+    catalog_version: int = Field(default=0, index=True)  # versión del último cambio (ver /products/changes)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -142,7 +173,7 @@ class ProductPresentation(SQLModel, table=True):
     product_id: UUID = Field(foreign_key="products.id")
     presentation_name: str
     quantity_per_unit: float
-    barcode: Optional[str] = None
+    barcode: Optional[str] = Field(default=None, index=True)
     price: float
     
     product: Optional["Product"] = Relationship(back_populates="presentations")
@@ -177,7 +208,7 @@ class PurchaseOrder(SQLModel, table=True):
     supplier_id: UUID = Field(foreign_key="suppliers.id")
     order_date: datetime = Field(default_factory=datetime.utcnow)
     expected_delivery_date: Optional[datetime] = None
-    status: OrderStatus = OrderStatus.pendiente
+    status: OrderStatus = Field(default=OrderStatus.pendiente, index=True)
     subtotal: float = 0.0
     tax_amount: float = 0.0
     total_amount: float = 0.0
@@ -240,6 +271,7 @@ class Inventory(SQLModel, table=True):
     product_id: UUID = Field(foreign_key="products.id")
     location_id: Optional[UUID] = Field(default=None, foreign_key="locations.id")
     quantity: float = 0.0
+    reserved_quantity: float = 0.0  # Apartado por carritos abiertos (ver StockReservation)
     last_updated: datetime = Field(default_factory=datetime.utcnow)
     updated_by: Optional[UUID] = Field(default=None, foreign_key="users.id")
     
@@ -247,6 +279,18 @@ class Inventory(SQLModel, table=True):
     location: Optional["Location"] = Relationship(back_populates="inventory")
 
 
+class ProductStock(SQLModel, table=True):
+    """Saldo de stock por producto (suma de sus filas de inventario), mantenido en cada escritura; todo producto tiene su fila"""
+    __tablename__ = "product_stock"
+    product_id: UUID = Field(foreign_key="products.id", primary_key=True)
+    quantity: float = Field(default=0.0, index=True)
+    stock_min: float = 0.0  # copia de products.stock_min para evaluar el stock bajo sin join
+    is_low: bool = Field(default=False, index=True)  # quantity <= stock_min
+    # Versión del último cambio del saldo (en Postgres, id de la transacción; ver product_stock.current_version)
+    stock_version: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, default=0, index=True))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class InventoryMovement(SQLModel, table=True):
     __tablename__ = "inventory_movements"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
@@ -258,12 +302,24 @@ class InventoryMovement(SQLModel, table=True):
     reason: Optional[str] = None
     reference_document: Optional[str] = None
     user_id: UUID = Field(foreign_key="users.id")
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     
     product: Optional["Product"] = Relationship(back_populates="inventory_movements")
     user: Optional["User"] = Relationship(back_populates="inventory_movements")
 
 
+class StockReservation(SQLModel, table=True):
+    __tablename__ = "stock_reservations"
+    id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
+    cart_id: str = Field(index=True)
+    product_id: UUID = Field(foreign_key="products.id", index=True)
+    inventory_id: UUID = Field(foreign_key="inventory.id")
+    quantity: float
+    user_id: UUID = Field(foreign_key="users.id")
+    expires_at: datetime = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class ProductReception(SQLModel, table=True):
     __tablename__ = "product_receptions"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
@@ -287,7 +343,7 @@ class ProductReceptionDetail(SQLModel, table=True):
     quantity_ordered: float
     quantity_received: float
     lot_number: Optional[str] = None
-    expiration_date: Optional[datetime] = None
+    expiration_date: Optional[datetime] = Field(default=None, index=True)
     location_id: Optional[UUID] = Field(default=None, foreign_key="locations.id")
     
     reception: Optional["ProductReception"] = Relationship(back_populates="details")
@@ -310,7 +366,7 @@ class Sale(SQLModel, table=True):
     __tablename__ = "sales"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
     sale_number: str = Field(unique=True, index=True)
-    sale_date: datetime = Field(default_factory=datetime.utcnow)
+    sale_date: datetime = Field(default_factory=datetime.utcnow, index=True)
     cashier_id: UUID = Field(foreign_key="users.id")
     cash_register_id: UUID = Field(foreign_key="cash_registers.id")
     customer_id: Optional[UUID] = Field(default=None, foreign_key="customers.id")
@@ -334,8 +390,10 @@ class Sale(SQLModel, table=True):
 class SaleDetail(SQLModel, table=True):
     __tablename__ = "sale_details"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
-    sale_id: UUID = Field(foreign_key="sales.id")
+    sale_id: UUID = Field(foreign_key="sales.id", index=True)
     product_id: UUID = Field(foreign_key="products.id")
+    product_name: Optional[str] = None  # copia al momento de la venta: el ticket no depende del catálogo
+    product_sku: Optional[str] = None
     quantity: float
     unit_price: float
     discount_percentage: float = 0.0
@@ -349,6 +407,47 @@ class SaleDetail(SQLModel, table=True):
     product: Optional["Product"] = Relationship(back_populates="sale_details")
 
 
+class SalesDailyRollup(SQLModel, table=True):
+    """Ventas completadas agregadas por día (UTC), caja y cajero; se actualiza en cada venta y cancelación"""
+    __tablename__ = "sales_rollup_daily"
+    business_date: date = Field(primary_key=True)
+    cash_register_id: UUID = Field(foreign_key="cash_registers.id", primary_key=True)
+    cashier_id: UUID = Field(foreign_key="users.id", primary_key=True)
+    sales_count: int = 0
+    subtotal: float = 0.0
+    discount_amount: float = 0.0
+    tax_amount: float = 0.0
+    total_amount: float = 0.0
+
+
+class SalesHourlyRollup(SQLModel, table=True):
+    """Igual que SalesDailyRollup con la hora (0-23) del día en la llave"""
+    __tablename__ = "sales_rollup_hourly"
+    business_date: date = Field(primary_key=True)
+    hour: int = Field(primary_key=True)
+    cash_register_id: UUID = Field(foreign_key="cash_registers.id", primary_key=True)
+    cashier_id: UUID = Field(foreign_key="users.id", primary_key=True)
+    sales_count: int = 0
+    subtotal: float = 0.0
+    discount_amount: float = 0.0
+    tax_amount: float = 0.0
+    total_amount: float = 0.0
+
+
+class ProductSalesRollup(SQLModel, table=True):
+    """Ítems vendidos (ventas completadas) por día y producto, con la categoría del producto"""
+    __tablename__ = "product_sales_rollup"
+    business_date: date = Field(primary_key=True)
+    product_id: UUID = Field(foreign_key="products.id", primary_key=True, index=True)
+    category_id: Optional[UUID] = Field(default=None, foreign_key="categories.id", index=True)
+    quantity: float = 0.0
+    line_count: int = 0
+    subtotal: float = 0.0
+    discount_amount: float = 0.0
+    tax_amount: float = 0.0
+    total_amount: float = 0.0
+
+
 class Promotion(SQLModel, table=True):
     __tablename__ = "promotions"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
@@ -407,9 +506,9 @@ class CashRegisterSession(SQLModel, table=True):
     __tablename__ = "cash_register_sessions"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
     cash_register_id: UUID = Field(foreign_key="cash_registers.id")
-    user_id: UUID = Field(foreign_key="users.id")
+    user_id: UUID = Field(foreign_key="users.id", index=True)
     opening_date: datetime = Field(default_factory=datetime.utcnow)
-    closing_date: Optional[datetime] = None
+    closing_date: Optional[datetime] = Field(default=None, index=True)
     opening_amount: float = 0.0
     expected_closing_amount: float = 0.0
     actual_closing_amount: float = 0.0
@@ -437,7 +536,7 @@ class PaymentMethod(SQLModel, table=True):
 class CashTransaction(SQLModel, table=True):
     __tablename__ = "cash_transactions"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
-    session_id: UUID = Field(foreign_key="cash_register_sessions.id")
+    session_id: UUID = Field(foreign_key="cash_register_sessions.id", index=True)
     transaction_type: TransactionType
     amount: float
     payment_method_id: UUID = Field(foreign_key="payment_methods.id")
@@ -507,7 +606,7 @@ class Customer(SQLModel, table=True):
     loyalty_points: float = 0.0
     notes: Optional[str] = None
     is_active: bool = True
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
     sales: list["Sale"] = Relationship(back_populates="customer")
@@ -516,6 +615,17 @@ class Customer(SQLModel, table=True):
     loyalty_transactions: list["LoyaltyTransaction"] = Relationship(back_populates="customer")
     notifications: list["CustomerNotification"] = Relationship(back_populates="customer")
 
+
+class CustomerStats(SQLModel, table=True):
+    """Compras completadas por cliente, mantenidas al registrar, cancelar o eliminar ventas"""
+    __tablename__ = "customer_stats"
+    customer_id: UUID = Field(foreign_key="customers.id", primary_key=True)
+    order_count: int = Field(default=0, index=True)
+    total_spent: float = Field(default=0.0, index=True)
+    average_ticket: float = 0.0  # total_spent / order_count
+    last_purchase_at: Optional[datetime] = Field(default=None, index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class CustomerPreference(SQLModel, table=True):
     __tablename__ = "customer_preferences"
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
@@ -3,11 +3,11 @@ from typing import Optional
 from uuid import UUID
 from pydantic import BaseModel
 from datetime import datetime
-from sqlmodel import select
+from sqlmodel import Session, select
 from sqlalchemy.orm import selectinload
 
-from app.deps import DBSession, get_current_user
-from app.models.models import CashRegisterSession, CashRegister, CashTransaction, User, TransactionType, SessionStatus
+from app.deps import DBSession, IdempotencyKeyHeader, get_current_user, run_idempotent, stage_idempotent_response
+from app.models.models import CashRegisterSession, CashRegister, CashTransaction, User, TransactionType, SessionStatus, IdempotencyKey
 from app.auth.auth import RoleChecker
 
 router = APIRouter(
@@ -278,11 +278,34 @@ async def create_cash_transaction(
     session_id: UUID,
     transaction_data: TransactionCreate,
     db: DBSession,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: IdempotencyKeyHeader = None
 ):
     """
     Registrar una transacción de caja (ingreso/egreso)
+    
+    Header opcional Idempotency-Key para reintentos seguros.
     """
+    return run_idempotent(
+        db,
+        key=idempotency_key,
+        user_id=current_user.id,
+        endpoint=f"POST /caja/cash-sessions/{session_id}/transactions",
+        payload=transaction_data,
+        handler=lambda session, record: register_cash_transaction(
+            session, session_id, transaction_data, current_user.id, record
+        )
+    )
+
+
+def register_cash_transaction(
+    db: Session,
+    session_id: UUID,
+    transaction_data: TransactionCreate,
+    user_id: UUID,
+    idempotency_record: Optional[IdempotencyKey] = None
+) -> dict:
+    """Validar la sesión y guardar la transacción de caja (con la respuesta de la Idempotency-Key)"""
     # Verificar que la sesión existe y está abierta
     session = db.exec(select(CashRegisterSession).where(CashRegisterSession.id == session_id)).first()
     
@@ -316,14 +339,15 @@ async def create_cash_transaction(
         reference_number=transaction_data.reference_number,
         description=transaction_data.description,
         created_at=datetime.utcnow(),
-        created_by=current_user.id
+        created_by=user_id
     )
     
     db.add(transaction)
+    response = format_cash_transaction(transaction)
+    stage_idempotent_response(db, idempotency_record, response)
     db.commit()
-    db.refresh(transaction)
     
-    return format_cash_transaction(transaction)
+    return response
 
 @router.get("/cash-sessions/{session_id}/transactions", dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def list_session_transactions(
@@ -45,7 +45,10 @@ async def create_category(
         raise HTTPException(status_code=400, detail="Categoria ya existe")
     
     new_category = Category(**category_data.dict())
-    created = category.create(db, obj_in=new_category)
+    try:
+        created = category.create(db, obj_in=new_category)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
     return {
         "message": "Categoria creada exitosamente",
@@ -93,7 +96,8 @@ async def get_root_categories(
 @router.get("/categories/{category_id}/subcategories", tags=["Categorias"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
 async def get_subcategories(
     category_id: UUID,
-    db: DBSession
+    db: DBSession,
+    recursive: bool = Query(False, description="Incluir todos los niveles inferiores")
 ):
     """
     Obtener subcategorias de una categoria
@@ -101,10 +105,35 @@ async def get_subcategories(
     Path params:
     - category_id: UUID de la categoria padre
     
+    Query params:
+    - recursive: Si es true retorna todo el subarbol, por nivel (default: false)
+    
     Retorna lista de categorias hijas
     Util para navegacion jerarquica
     """
-    from crud.products_crud import category
+    from app.crud.products_crud import category
     
-    subcategories = category.get_subcategories(db, parent_id=category_id)
+    subcategories = category.get_subcategories(db, parent_id=category_id, recursive=recursive)
     return subcategories
+
+
+@router.get("/categories/{category_id}/path", tags=["Categorias"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
+async def get_category_path(
+    category_id: UUID,
+    db: DBSession
+):
+    """
+    Obtener el camino de una categoria desde la raiz
+    
+    Path params:
+    - category_id: UUID de la categoria
+    
+    Retorna lista de categorias desde la raiz hasta la categoria indicada
+    Util para breadcrumbs
+    """
+    from app.crud.products_crud import category
+    
+    path = category.get_path(db, category_id=category_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Categoria no encontrada")
+    return path
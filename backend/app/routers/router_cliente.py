@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Response
 from typing import Optional
 from uuid import UUID
 from pydantic import BaseModel
@@ -6,8 +6,9 @@ from datetime import datetime
 from sqlmodel import select, or_
 
 from app.deps import DBSession, get_current_user
-from app.models.models import Customer, User
+from app.models.models import Customer, CustomerStats, User
 from app.auth.auth import RoleChecker
+from app.crud.base_crud import apply_keyset, keyset_page
 
 router = APIRouter()
 
@@ -55,6 +56,15 @@ def format_customer_response(customer: Customer) -> dict:
         "updated_at": customer.updated_at.isoformat()
     }
 
+def format_customer_stats(stats: Optional[CustomerStats]) -> dict:
+    """Estadísticas de compra del cliente (ceros si todavía no compró)"""
+    return {
+        "order_count": stats.order_count if stats else 0,
+        "total_spent": stats.total_spent if stats else 0.0,
+        "average_ticket": stats.average_ticket if stats else 0.0,
+        "last_purchase_at": stats.last_purchase_at.isoformat() if stats and stats.last_purchase_at else None
+    }
+
 # ========== ENDPOINTS ==========
 @router.post("/customers", tags=["Clientes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def create_customer(
@@ -99,23 +109,37 @@ async def create_customer(
 @router.get("/customers", tags=["Clientes"])
 async def list_customers(
     db: DBSession,
+    response: Response,
     skip: int = Query(0, ge=0, description="Registros a saltar"),
     limit: int = Query(100, ge=1, le=1000, description="Límite de registros"),
-    active_only: bool = Query(True, description="Solo clientes activos")
+    active_only: bool = Query(True, description="Solo clientes activos"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (header X-Next-Cursor)")
 ):
     """
     Listar todos los clientes con paginación (sin autenticación para desarrollo)
+    
+    Con `cursor` la página continúa después de la anterior sin OFFSET; el
+    header X-Next-Cursor trae el cursor de la siguiente.
     """
     query = select(Customer)
     
     if active_only:
         query = query.where(Customer.is_active == True)
     
-    # Ordenar por fecha de creación descendente
-    query = query.order_by(Customer.created_at.desc())
-    query = query.offset(skip).limit(limit)
+    # Ordenar por fecha de creación descendente (id como desempate)
+    try:
+        query = apply_keyset(
+            query, sort_column=Customer.created_at, id_column=Customer.id,
+            cursor=cursor, limit=limit, descending=True
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    if not cursor and skip:
+        query = query.offset(skip)
     
-    customers = db.exec(query).all()
+    customers, next_cursor = keyset_page(db.exec(query).all(), limit=limit, sort_attr="created_at")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [format_customer_response(customer) for customer in customers]
 
 @router.get("/customers/{customer_id}", tags=["Clientes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
@@ -290,14 +314,26 @@ async def get_vip_customers(
 @router.get("/customers/top/list", tags=["Clientes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def get_top_customers(
     db: DBSession,
-    limit: int = Query(10, ge=1, le=50, description="Cantidad de clientes top")
+    limit: int = Query(10, ge=1, le=500, description="Cantidad de clientes top"),
+    sort: str = Query(
+        "loyalty_points",
+        pattern="^(loyalty_points|total_spent|order_count|average_ticket|last_purchase)$",
+        description="Criterio del ranking"
+    )
 ):
     """
-    Top clientes por puntos de fidelidad
+    Top clientes por puntos de fidelidad (default) o por compras
+    
+    Query params:
+    - limit: Cantidad de clientes (default: 10)
+    - sort: loyalty_points, total_spent, order_count, average_ticket o last_purchase
+    
+    El orden y el límite se aplican en SQL sobre customer_stats; cada cliente
+    incluye sus estadísticas de compra.
     """
-    query = select(Customer).where(Customer.is_active == True)
-    query = query.order_by(Customer.loyalty_points.desc())
-    query = query.limit(limit)
+    from app.crud.caja_crud import customer_stats
     
-    customers = db.exec(query).all()
-    return [format_customer_response(customer) for customer in customers]
+    return [
+        {**format_customer_response(customer), "stats": format_customer_stats(stats)}
+        for customer, stats in customer_stats.get_top(db, sort=sort, limit=limit)
+    ]
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Dict, Any, List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
-from sqlmodel import select, func
+from sqlmodel import Session, select, func
+from uuid import UUID
 
+from app.db.database import engine
 from app.deps import DBSession
 from app.models.models import (
     Sale,
@@ -11,64 +16,30 @@ from app.models.models import (
     Supplier,
     Customer,
     InventoryMovement,
-    Inventory,
 )
 from app.models.enums import SaleStatus
-from app.auth.auth import RoleChecker, get_current_user
+from app.auth.auth import RoleChecker, get_current_user, decode_token
 
 router = APIRouter()
 
+# El stream también acepta el token por query: EventSource no envía headers
+stream_security = HTTPBearer(auto_error=False)
+
 @router.get("/dashboard/metrics", tags=["Dashboard"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero", "Contador"]))])
-async def get_dashboard_metrics(
+def get_dashboard_metrics(
     db: DBSession,
     current_user: User = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     Obtener métricas principales para el dashboard
-    """
-    # Ventas de hoy
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = datetime.utcnow().replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    ventas_hoy_query = select(func.sum(Sale.total_amount)).where(
-        Sale.sale_date >= today_start,
-        Sale.sale_date <= today_end,
-        Sale.status == SaleStatus.completada
-    )
-    ventas_hoy = db.exec(ventas_hoy_query).first() or 0.0
-    
-    # Total productos
-    total_productos = db.exec(select(func.count(Product.id))).first() or 0
-    
-    # Total usuarios
-    total_usuarios = db.exec(select(func.count(User.id)).where(User.is_active == True)).first() or 0
-    
-    # Total proveedores
-    total_proveedores = db.exec(select(func.count(Supplier.id)).where(Supplier.is_active == True)).first() or 0
     
-    # Total clientes
-    total_clientes = db.exec(select(func.count(Customer.id)).where(Customer.is_active == True)).first() or 0
-    
-    # Stock bajo (productos con cantidad menor o igual al mínimo)
-    # Productos con stock por debajo del mínimo configurado
-    stock_bajo_query = (
-        select(func.count(Product.id))
-        .select_from(Product)
-        .join(Inventory, Inventory.product_id == Product.id, isouter=True)
-        .group_by(Product.id, Product.stock_min)
-        .having(func.coalesce(func.sum(Inventory.quantity), 0) <= Product.stock_min)
-    )
-    stock_bajo_result = db.exec(stock_bajo_query).all() or []
-    stock_bajo = len(stock_bajo_result)
+    Se sirven desde un caché con TTL corto que se invalida al confirmar ventas,
+    movimientos de inventario o cambios de clientes; las peticiones simultáneas
+    comparten un solo cálculo.
+    """
+    from app.crud.dashboard_crud import get_metrics
     
-    return {
-        "ventas_hoy": float(ventas_hoy),
-        "total_productos": total_productos,
-        "total_usuarios": total_usuarios,
-        "total_proveedores": total_proveedores,
-        "total_clientes": total_clientes,
-        "stock_bajo": stock_bajo
-    }
+    return get_metrics(db)
 
 
 @router.get("/dashboard/recent-activity", tags=["Dashboard"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero", "Contador"]))])
@@ -142,40 +113,129 @@ async def get_recent_activity(
 
 
 @router.get("/dashboard/sales-summary", tags=["Dashboard"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
-async def get_sales_summary(
+def get_sales_summary(
     db: DBSession,
     days: int = 7
 ) -> Dict[str, Any]:
     """
-    Obtener resumen de ventas de los últimos días
+    Obtener resumen de ventas de los últimos días (cacheado como las métricas)
     """
-    start_date = datetime.utcnow() - timedelta(days=days)
+    from app.crud.dashboard_crud import get_sales_summary as sales_summary
     
-    # Total de ventas en el periodo
-    total_sales_query = select(func.sum(Sale.total_amount)).where(
-        Sale.sale_date >= start_date,
-        Sale.status == SaleStatus.completada
-    )
-    total_sales = db.exec(total_sales_query).first() or 0.0
+    return sales_summary(db, days)
+
+
+@router.get("/dashboard/cajero", tags=["Dashboard"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
+def get_cashier_dashboard(
+    db: DBSession,
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Dashboard del cajero: su sesión de caja abierta y sus ventas por hora de hoy
     
-    # Cantidad de ventas
-    count_sales_query = select(func.count(Sale.id)).where(
-        Sale.sale_date >= start_date,
-        Sale.status == SaleStatus.completada
+    - sesion: apertura, ventas, impuestos, transacciones por tipo y monto
+      esperado al cierre (null si no tiene caja abierta)
+    - ventas_hoy y ventas_por_hora: desde el rollup horario
+    """
+    from app.crud.dashboard_crud import get_cashier_dashboard as cashier_dashboard
+    
+    return cashier_dashboard(db, current_user.id)
+
+
+@router.get("/dashboard/almacen", tags=["Dashboard"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Almacen"]))])
+def get_warehouse_dashboard(
+    db: DBSession,
+    dias: int = Query(30, ge=1, le=365, description="Horizonte de lotes por vencer"),
+    limit: int = Query(10, ge=1, le=100)
+) -> Dict[str, Any]:
+    """
+    Dashboard de almacén: stock bajo, órdenes de compra por recibir y lotes
+    que vencen en los próximos `dias` días (totales y los `limit` más urgentes)
+    """
+    from app.crud.dashboard_crud import get_warehouse_dashboard as warehouse_dashboard
+    
+    return warehouse_dashboard(db, days=dias, limit=limit)
+
+
+@router.get("/dashboard/contador", tags=["Dashboard"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
+def get_accountant_dashboard(
+    db: DBSession,
+    fecha_inicio: Optional[datetime] = Query(None, description="Por defecto el primer día del mes"),
+    fecha_fin: Optional[datetime] = Query(None),
+    limit: int = Query(10, ge=1, le=100)
+) -> Dict[str, Any]:
+    """
+    Dashboard del contador: ingresos e impuestos del periodo y diferencias de
+    las cajas cerradas en él (totales y las `limit` mayores)
+    """
+    from app.crud.dashboard_crud import get_accountant_dashboard as accountant_dashboard
+    
+    try:
+        return accountant_dashboard(db, start=fecha_inicio, end=fecha_fin, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/dashboard/stream", tags=["Dashboard"])
+async def stream_dashboard_events(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(stream_security),
+    access_token: Optional[str] = Query(None, description="Token JWT para clientes EventSource (sin header Authorization)")
+):
+    """
+    Eventos en vivo del dashboard (Server-Sent Events)
+    
+    Envía `venta`, `movimiento` y `producto` al confirmarse cada escritura, con
+    el mismo formato que /dashboard/recent-activity más un bloque `data`.
+    Cada rol recibe solo sus eventos: el cajero sus propias ventas y productos
+    nuevos, almacén movimientos y productos, contador ventas y movimientos.
+    `recargar` indica que se perdieron eventos y conviene pedir las métricas.
+    
+    Autenticación: header `Authorization: Bearer <token>` o, desde el navegador
+    con `new EventSource("/dashboard/stream?access_token=<token>")`, el mismo
+    token en la query (el header tiene prioridad).
+    
+    La conexión no mantiene sesión de base de datos abierta.
+    """
+    from app.crud.dashboard_crud import stream_events
+    
+    token = credentials.credentials if credentials else access_token
+    if not token:
+        raise HTTPException(
+            status_code=401,
+            detail="No autenticado",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    user_id, role = await run_in_threadpool(resolve_stream_user, token)
+    return StreamingResponse(
+        stream_events(role, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    count_sales = db.exec(count_sales_query).first() or 0
-    
-    # Promedio de venta
-    avg_sale = float(total_sales) / count_sales if count_sales > 0 else 0.0
-    
-    return {
-        "period_days": days,
-        "total_sales": float(total_sales),
-        "count_sales": count_sales,
-        "average_sale": avg_sale,
-        "start_date": start_date.isoformat(),
-        "end_date": datetime.utcnow().isoformat()
-    }
+
+
+def resolve_stream_user(token: str) -> tuple[str, str]:
+    """Usuario y rol normalizado del token, con una sesión que se cierra antes del stream"""
+    from app.crud import users_crud
+    from app.crud.dashboard_crud import DASHBOARD_EVENT_ROLES
+    
+    payload = decode_token(token)
+    if not payload or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="No se pudo validar las credenciales")
+    try:
+        user_id = UUID(payload["sub"])
+    except ValueError:
+        raise HTTPException(status_code=401, detail="No se pudo validar las credenciales")
+    
+    with Session(engine) as db:
+        user = users_crud.user.get(db, id=user_id)
+        if not user or not user.is_active:
+            raise HTTPException(status_code=401, detail="No se pudo validar las credenciales")
+        profile = users_crud.profile.get(db, id=user.profile_id)
+    
+    role = RoleChecker(allowed_roles=[])._normalize(profile.name if profile else "")
+    if not any(role in roles for roles in DASHBOARD_EVENT_ROLES.values()):
+        raise HTTPException(status_code=403, detail="Rol sin acceso a eventos del dashboard")
+    return str(user_id), role
 
 
 def format_time_ago(time_diff: timedelta) -> str:
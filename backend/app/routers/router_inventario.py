@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from typing import Optional
 from uuid import UUID
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from sqlmodel import select
+from sqlmodel import Session, select
 
-from app.deps import DBSession
-from app.models.models import Inventory, InventoryMovement, Product
+from app.deps import DBSession, IdempotencyKeyHeader, run_idempotent, stage_idempotent_response
+from app.utils.streaming import stream_rows, STREAM_FORMAT_PATTERN
+from app.models.models import Inventory, InventoryMovement, Product, ProductStock, StockReservation, IdempotencyKey
 from app.auth.auth import RoleChecker, get_current_user
+from app.crud.base_crud import apply_keyset, keyset_page
 
 router = APIRouter()
 
@@ -19,6 +21,7 @@ def format_inventory_item(item: Inventory):
         "product_id": str(item.product_id),
         "location_id": str(item.location_id) if item.location_id else None,
         "quantity": item.quantity,
+        "reserved_quantity": item.reserved_quantity,
         "last_updated": item.last_updated.isoformat() if item.last_updated else None,
         "updated_by": str(item.updated_by) if item.updated_by else None
     }
@@ -40,12 +43,37 @@ def format_movement(movement: InventoryMovement):
     }
 
 
+MOVEMENT_CSV_HEADER = [
+    "id", "product_id", "movement_type", "quantity", "previous_stock", "new_stock",
+    "reason", "reference_document", "user_id", "created_at"
+]
+
+
+def format_reservation(reservation: StockReservation):
+    """Formatear apartado de stock de un carrito"""
+    return {
+        "id": str(reservation.id),
+        "cart_id": reservation.cart_id,
+        "product_id": str(reservation.product_id),
+        "quantity": reservation.quantity,
+        "expires_at": reservation.expires_at.isoformat(),
+        "user_id": str(reservation.user_id)
+    }
+
+
 class InventoryAdjustmentRequest(BaseModel):
     product_id: UUID
     new_quantity: float
     reason: str
 
 
+class StockReservationRequest(BaseModel):
+    cart_id: str
+    product_id: UUID
+    quantity: float = Field(..., gt=0)
+    ttl_seconds: int = Field(300, ge=30, le=3600)
+
+
 @router.get("/inventory", tags=["Inventario"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def list_inventory(
     db: DBSession,
@@ -68,16 +96,14 @@ async def list_inventory(
     if product_id:
         query = query.where(Inventory.product_id == product_id)
     
-    # Ejecutar query base
-    inventory_items = db.exec(query.offset(skip).limit(limit)).all()
-    
-    # Filtrar por stock bajo si se pide
+    # Stock bajo: mismo criterio que las alertas (saldo total del producto <= stock mínimo),
+    # filtrado en SQL antes de paginar
     if low_stock:
-        filtered_items = []
-        for item in inventory_items:
-            if item.product and item.quantity <= item.product.stock_min:
-                filtered_items.append(item)
-        inventory_items = filtered_items
+        query = query.join(ProductStock, ProductStock.product_id == Inventory.product_id).where(
+            ProductStock.is_low == True
+        )
+    
+    inventory_items = db.exec(query.offset(skip).limit(limit)).all()
     
     return [format_inventory_item(i) for i in inventory_items]
 
@@ -85,11 +111,14 @@ async def list_inventory(
 @router.get("/inventory/movement-list", tags=["Inventario"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def list_inventory_movements(
     db: DBSession,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     product_id: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern=STREAM_FORMAT_PATTERN)
 ):
     """
     Listar movimientos de inventario con filtros opcionales
@@ -100,6 +129,9 @@ async def list_inventory_movements(
     - product_id: Filtrar por producto (opcional, UUID como string)
     - start_date: Fecha inicio ISO8601 (opcional)
     - end_date: Fecha fin ISO8601 (opcional)
+    - cursor: Página siguiente según el header X-Next-Cursor (opcional, reemplaza a skip)
+    - format: ndjson o csv (opcional): descarga en streaming de todos los
+      movimientos filtrados, sin paginación
     """
     # Validar límites
     if skip < 0:
@@ -136,12 +168,105 @@ async def list_inventory_movements(
         except:
             pass
     
-    query = query.order_by(InventoryMovement.created_at.desc())
-    movements = db.exec(query.offset(skip).limit(limit)).all()
+    if format:
+        return stream_rows(
+            query.order_by(InventoryMovement.created_at.desc(), InventoryMovement.id.desc()),
+            fmt=format,
+            filename="movimientos",
+            to_json=format_movement,
+            csv_header=MOVEMENT_CSV_HEADER,
+            to_csv=lambda movement: [list(format_movement(movement).values())]
+        )
+    
+    try:
+        query = apply_keyset(
+            query, sort_column=InventoryMovement.created_at, id_column=InventoryMovement.id,
+            cursor=cursor, limit=limit, descending=True
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    if not cursor and skip:
+        query = query.offset(skip)
+    movements, next_cursor = keyset_page(db.exec(query).all(), limit=limit, sort_attr="created_at")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return [format_movement(m) for m in movements]
 
 
+@router.post("/inventory/reservations", tags=["Inventario"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
+async def hold_stock(
+    reservation_data: StockReservationRequest,
+    db: DBSession,
+    current_user = Depends(get_current_user)
+):
+    """
+    Apartar stock para un carrito en construcción
+    
+    Body JSON:
+    {
+        "cart_id": "id del carrito en el POS",
+        "product_id": "uuid",
+        "quantity": 2,
+        "ttl_seconds": 300
+    }
+    
+    Volver a enviar el mismo carrito/producto ajusta la cantidad y renueva el
+    vencimiento. Al cobrar con `cart_id` en POST /sales el apartado se consume.
+    Los carritos son de cada usuario: el mismo `cart_id` de otro usuario es
+    otro carrito.
+    """
+    from app.crud.inventario_crud import stock_reservation
+    
+    stock_reservation.purge_expired(db)
+    reservation = stock_reservation.hold(
+        db,
+        cart_id=reservation_data.cart_id,
+        product_id=reservation_data.product_id,
+        quantity=reservation_data.quantity,
+        user_id=current_user.id,
+        ttl_seconds=reservation_data.ttl_seconds
+    )
+    if not reservation:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Stock insuficiente para apartar {reservation_data.quantity} unidades"
+        )
+    
+    return format_reservation(reservation)
+
+
+@router.get("/inventory/reservations/{cart_id}", tags=["Inventario"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
+async def list_cart_reservations(
+    cart_id: str,
+    db: DBSession,
+    current_user = Depends(get_current_user)
+):
+    """
+    Listar los apartados vigentes de un carrito del usuario
+    """
+    from app.crud.inventario_crud import stock_reservation
+    
+    now = datetime.utcnow()
+    holds = stock_reservation.get_by_cart(db, cart_id=cart_id, user_id=current_user.id)
+    return [format_reservation(h) for h in holds if h.expires_at > now]
+
+
+@router.delete("/inventory/reservations/{cart_id}", tags=["Inventario"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
+async def release_cart_reservations(
+    cart_id: str,
+    db: DBSession,
+    current_user = Depends(get_current_user)
+):
+    """
+    Liberar todos los apartados de un carrito del usuario (carrito cancelado)
+    """
+    from app.crud.inventario_crud import stock_reservation
+    
+    released = stock_reservation.release_cart(db, cart_id=cart_id, user_id=current_user.id)
+    return {"message": "Apartados liberados", "released": released}
+
+
 @router.get("/inventory/{product_id}", tags=["Inventario"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def get_product_inventory(
     product_id: UUID,
@@ -170,6 +295,7 @@ async def get_product_inventory(
             "product_id": str(product_id),
             "location_id": None,
             "quantity": 0,
+            "reserved_quantity": 0,
             "last_updated": None,
             "updated_by": None
         }
@@ -181,7 +307,8 @@ async def get_product_inventory(
 async def adjust_inventory(
     adjustment_data: InventoryAdjustmentRequest,
     db: DBSession,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    idempotency_key: IdempotencyKeyHeader = None
 ):
     """
     Ajustar inventario de un producto
@@ -192,27 +319,35 @@ async def adjust_inventory(
         "new_quantity": 100,
         "reason": "Ajuste de inventario"
     }
-    """
-    # Obtener inventario existente
-    query = select(Inventory).where(Inventory.product_id == adjustment_data.product_id)
-    inventory = db.exec(query).first()
-    
-    previous_stock = inventory.quantity if inventory else 0
     
-    if not inventory:
-        # Crear nuevo registro
-        inventory = Inventory(
-            product_id=adjustment_data.product_id,
-            quantity=adjustment_data.new_quantity,
-            last_updated=datetime.utcnow(),
-            updated_by=current_user.id
-        )
-        db.add(inventory)
-    else:
-        # Actualizar inventario existente
-        inventory.quantity = adjustment_data.new_quantity
-        inventory.last_updated = datetime.utcnow()
-        inventory.updated_by = current_user.id
+    Header opcional Idempotency-Key para reintentos seguros.
+    """
+    return run_idempotent(
+        db,
+        key=idempotency_key,
+        user_id=current_user.id,
+        endpoint="POST /inventory/adjustment",
+        payload=adjustment_data,
+        handler=lambda session, record: apply_adjustment(session, adjustment_data, current_user.id, record)
+    )
+
+
+def apply_adjustment(
+    db: Session,
+    adjustment_data: InventoryAdjustmentRequest,
+    user_id: UUID,
+    idempotency_record: Optional[IdempotencyKey] = None
+) -> dict:
+    """Fijar la cantidad del inventario y registrar el movimiento de ajuste (con la respuesta de la Idempotency-Key)"""
+    from app.crud.inventario_crud import inventory as inventory_crud, product_stock
+
+    # Fila principal (la misma de la que descuentan las ventas), sin pisar un descuento concurrente
+    inventory, previous_stock = inventory_crud.set_quantity_atomic(
+        db,
+        product_id=adjustment_data.product_id,
+        quantity=adjustment_data.new_quantity,
+        user_id=user_id
+    )
     
     # SIEMPRE registrar movimiento (nuevo o actualización)
     movement = InventoryMovement(
@@ -222,13 +357,17 @@ async def adjust_inventory(
         previous_stock=previous_stock,
         new_stock=adjustment_data.new_quantity,
         reason=adjustment_data.reason,
-        user_id=current_user.id,
+        user_id=user_id,
         created_at=datetime.utcnow()
     )
     db.add(movement)
-    
+    product_stock.apply_deltas(
+        db, deltas={adjustment_data.product_id: adjustment_data.new_quantity - previous_stock}
+    )
+    db.flush()
+    response = format_inventory_item(inventory)
+    stage_idempotent_response(db, idempotency_record, response)
     db.commit()
-    db.refresh(inventory)
     
-    return format_inventory_item(inventory)
+    return response
 
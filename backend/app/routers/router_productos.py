@@ -1,74 +1,189 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, UploadFile, File
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, List, Literal
 from uuid import UUID
-from pydantic import BaseModel
+from operator import attrgetter
+from pydantic import BaseModel, Field, root_validator
+from fastapi.responses import JSONResponse
 
 from app.deps import *
 from app.models.models import *
-from sqlmodel import select, func
+from sqlmodel import Session, select, func
 from app.auth.auth import RoleChecker
-from app.deps import DBSession
+from app.deps import DBSession, AsyncDBSession
 router = APIRouter()
 
 
+# Campos escalares del producto, leídos con un solo attrgetter precompilado
+_PRODUCT_HEAD = attrgetter("sku", "barcode", "name", "description")
+_PRODUCT_TAIL = attrgetter(
+    "unit_of_measure", "sale_price", "cost_price", "tax_rate", "stock_min", "stock_max",
+    "weight", "requires_lot_control", "requires_expiration_date", "is_active"
+)
+
+
+def _format_category(category: Category) -> dict:
+    return {"id": str(category.id), "name": category.name, "description": category.description}
+
+
+def _format_brand(brand: Brand) -> dict:
+    return {"id": str(brand.id), "name": brand.name, "description": brand.description}
+
+
+def _format_supplier(supplier: Supplier) -> dict:
+    return {
+        "id": str(supplier.id),
+        "business_name": supplier.business_name,
+        "tax_id": supplier.tax_id,
+        "contact_name": supplier.representative_name,
+        "email": supplier.email,
+        "phone": supplier.phone,
+        "address": supplier.address,
+        "city": None,  # Campos opcionales no presentes
+        "country": None,
+        "is_active": supplier.is_active
+    }
+
+
+def _related(cache: dict, obj, formatter):
+    """Dict de categoría/marca/proveedor, armado una sola vez por objeto en cada respuesta"""
+    if obj is None:
+        return None
+    key = (formatter, obj.id)
+    formatted = cache.get(key)
+    if formatted is None:
+        formatted = cache[key] = formatter(obj)
+    return formatted
+
+
+def _serialize_product(product: Product, stock: float, cache: dict) -> dict:
+    sku, barcode, name, description = _PRODUCT_HEAD(product)
+    (unit_of_measure, sale_price, cost_price, tax_rate, stock_min, stock_max,
+     weight, requires_lot_control, requires_expiration_date, is_active) = _PRODUCT_TAIL(product)
+    category_id = product.category_id
+    brand_id = product.brand_id
+    supplier_id = product.main_supplier_id
+    return {
+        "id": str(product.id),
+        "sku": sku,
+        "barcode": barcode,
+        "name": name,
+        "description": description,
+        "category_id": str(category_id) if category_id else None,
+        "category": _related(cache, product.category, _format_category),
+        "brand_id": str(brand_id) if brand_id else None,
+        "brand": _related(cache, product.brand, _format_brand),
+        "main_supplier_id": str(supplier_id) if supplier_id else None,
+        "supplier": _related(cache, product.supplier, _format_supplier),
+        "unit_of_measure": unit_of_measure,
+        "sale_price": sale_price,
+        "cost_price": cost_price,
+        "tax_rate": tax_rate,
+        "stock_min": stock_min,
+        "stock_max": stock_max,
+        "weight": weight,
+        "requires_lot_control": requires_lot_control,
+        "requires_expiration_date": requires_expiration_date,
+        "is_active": is_active,
+        "stock": stock,
+        "created_at": product.created_at.isoformat(),
+        "updated_at": product.updated_at.isoformat()
+    }
+
+
 def format_product_response(product: Product, stock_map: dict | None = None):
     """Helper para formatear producto con estructura esperada por Angular"""
     calculated_stock = 0
-    if stock_map:
+    if stock_map is not None:
         calculated_stock = stock_map.get(str(product.id), 0)
     elif getattr(product, "inventory", None):
         try:
             calculated_stock = sum(inv.quantity for inv in product.inventory)
         except Exception:
             calculated_stock = 0
+    return _serialize_product(product, calculated_stock, {})
+
+
+def product_list_response(products, stock_map: dict, headers: dict | None = None) -> JSONResponse:
+    """
+    Respuesta de listados de productos
+    
+    Los productos deben venir con category, brand y supplier precargados
+    (selectinload). Ya son tipos JSON nativos, así que se serializan directo
+    sin pasar por jsonable_encoder.
+    """
+    cache: dict = {}
+    content = [
+        _serialize_product(p, stock_map.get(str(p.id), 0), cache)
+        for p in products
+    ]
+    return JSONResponse(content=content, headers=headers)
+
+
+def build_stock_map(db: Session, products) -> dict:
+    """Saldo de stock de los productos indicados (lookup por clave primaria en product_stock)"""
+    from app.crud.inventario_crud import product_stock
 
+    stock = product_stock.get_map(db, product_ids=[p.id for p in products])
+    return {str(pid): qty for pid, qty in stock.items()}
+
+
+def _changes_until(get_changes, db, *, since: int, until: int, limit: int, version_attr: str = "catalog_version"):
+    """
+    Cambios en (since, until] de una lista: (filas, versión alcanzada, has_more)
+    
+    Si la lista quedó cortada se responde solo hasta la versión del corte,
+    completa (sin límite) para no partirla entre dos respuestas.
+    """
+    rows = get_changes(db, since=since, until=until, limit=limit)
+    if len(rows) <= limit:
+        return rows, until, False
+    cut = getattr(rows[limit - 1], version_attr)
+    return get_changes(db, since=since, until=cut, limit=None), cut, True
+
+
+def format_presentation(presentation: ProductPresentation) -> dict:
+    """Presentación escaneada (empaque con su propio código y precio)"""
     return {
-        "id": str(product.id),
-        "sku": product.sku,
-        "barcode": product.barcode,
-        "name": product.name,
-        "description": product.description,
-        "category_id": str(product.category_id) if product.category_id else None,
-        "category": {
-            "id": str(product.category.id),
-            "name": product.category.name,
-            "description": product.category.description
-        } if product.category else None,
-        "brand_id": str(product.brand_id) if product.brand_id else None,
-        "brand": {
-            "id": str(product.brand.id),
-            "name": product.brand.name,
-            "description": product.brand.description
-        } if product.brand else None,
-        "main_supplier_id": str(product.main_supplier_id) if product.main_supplier_id else None,
-        "supplier": {
-            "id": str(product.supplier.id),
-            "business_name": product.supplier.business_name,
-            "tax_id": product.supplier.tax_id,
-            "contact_name": product.supplier.contact_name,
-            "email": product.supplier.email,
-            "phone": product.supplier.phone,
-            "address": product.supplier.address,
-            "city": product.supplier.city,
-            "country": product.supplier.country,
-            "is_active": product.supplier.is_active
-        } if product.supplier else None,
-        "unit_of_measure": product.unit_of_measure,
-        "sale_price": product.sale_price,
-        "cost_price": product.cost_price,
-        "tax_rate": product.tax_rate,
-        "stock_min": product.stock_min,
-        "stock_max": product.stock_max,
-        "weight": product.weight,
-        "requires_lot_control": product.requires_lot_control,
-        "requires_expiration_date": product.requires_expiration_date,
-        "is_active": product.is_active,
-        "stock": calculated_stock,
-        "created_at": product.created_at.isoformat(),
-        "updated_at": product.updated_at.isoformat()
+        "id": str(presentation.id),
+        "presentation_name": presentation.presentation_name,
+        "quantity_per_unit": presentation.quantity_per_unit,
+        "barcode": presentation.barcode,
+        "price": presentation.price
     }
 
 
+def cached_product_lookup(db: Session, *, kind: str, code: str) -> JSONResponse:
+    """
+    Producto por SKU o código de barras desde el índice en memoria
+    
+    En un acierto solo se consulta el saldo de stock (lookup por clave primaria);
+    el resto de la respuesta ya está serializada.
+    """
+    from app.crud.products_crud import product, product_lookup_cache
+    from app.crud.inventario_crud import product_stock
+
+    key = f"{kind}:{code}"
+    entry = product_lookup_cache.get(key)
+    if entry is None:
+        version = product_lookup_cache.version
+        presentation = None
+        if kind == "barcode":
+            prod, presentation = product.get_by_any_barcode(db, barcode=code)
+        else:
+            prod = product.get_by_sku(db, sku=code)
+        if not prod:
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        payload = format_product_response(prod, {})
+        if kind == "barcode":
+            payload["presentation"] = format_presentation(presentation) if presentation else None
+        entry = (prod.id, payload)
+        product_lookup_cache.put(key, entry, version)
+
+    product_id, payload = entry
+    stock = product_stock.get_map(db, product_ids=[product_id]).get(product_id, 0)
+    return JSONResponse(content={**payload, "stock": stock})
+
 class ProductCreate(BaseModel):
     name: str
     sku: str
@@ -88,6 +203,45 @@ class ProductCreate(BaseModel):
     requires_expiration_date: bool = False
     is_active: bool = True
 
+class BulkSelector(BaseModel):
+    """Productos alcanzados por un cambio masivo (filtros combinados con AND)"""
+    category_id: Optional[UUID] = None
+    brand_id: Optional[UUID] = None
+    supplier_id: Optional[UUID] = None
+    all_products: bool = False
+
+    @root_validator(skip_on_failure=True)
+    def require_selector(cls, values):
+        if not (values.get("category_id") or values.get("brand_id")
+                or values.get("supplier_id") or values.get("all_products")):
+            raise ValueError("Indique category_id, brand_id, supplier_id o all_products")
+        return values
+
+class PriceRule(BulkSelector):
+    field: Literal["sale_price", "cost_price"] = "sale_price"
+    percentage: float = Field(..., gt=-100, le=1000, description="Ej: 5 = +5%, -10 = -10%")
+    round_to: Optional[float] = Field(None, gt=0, description="Redondear al multiplo (ej: 0.05)")
+
+class PriceItem(BaseModel):
+    product_id: UUID
+    sale_price: Optional[float] = Field(None, ge=0)
+    cost_price: Optional[float] = Field(None, ge=0)
+
+class AttributeValues(BaseModel):
+    tax_rate: Optional[float] = Field(None, ge=0)
+    stock_min: Optional[float] = Field(None, ge=0)
+    stock_max: Optional[float] = Field(None, ge=0)
+    unit_of_measure: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class AttributeChange(BulkSelector):
+    values: AttributeValues
+
+class BulkProductUpdate(BaseModel):
+    rules: List[PriceRule] = []
+    prices: List[PriceItem] = Field([], max_items=10000)
+    attributes: List[AttributeChange] = []
+
 @router.post("/products", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador"]))])
 async def create_product(
     product_data: ProductCreate,
@@ -130,12 +284,97 @@ async def create_product(
     return format_product_response(created)
 
 
+@router.post("/products/import", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador"]))])
+async def import_products(
+    db: DBSession,
+    file: UploadFile = File(..., description="Archivo .csv o .xlsx con encabezados")
+):
+    """
+    Importar productos desde CSV o XLSX (crea o actualiza por SKU)
+    
+    Columnas (encabezados de la primera fila):
+    - sku: Obligatoria
+    - name, cost_price, sale_price: Obligatorias solo para productos nuevos
+    - barcode, description, unit_of_measure, tax_rate, stock_min, stock_max,
+      weight, requires_lot_control, requires_expiration_date, is_active
+    - category, brand, supplier: Por nombre (deben existir)
+    
+    Las celdas vacias conservan el valor actual, asi una lista de precios con
+    sku, cost_price y sale_price solo actualiza precios. El CSV puede usar
+    ',' o ';' como separador.
+    
+    Retorna: total, created, updated, error_count y errors [{row, sku, error}]
+    """
+    from app.crud.import_crud import product_import, read_product_rows
+
+    try:
+        rows = read_product_rows(file.file, file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Lectura y escritura por lotes fuera del event loop
+        return await run_in_threadpool(product_import.import_rows, db, rows=rows)
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Librería openpyxl no instalada. Ejecute: pip install openpyxl"
+        )
+    except (UnicodeDecodeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Archivo ilegible: {e}")
+
+
+@router.post("/products/bulk-update", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador"]))])
+async def bulk_update_products(
+    update_data: BulkProductUpdate,
+    db: DBSession
+):
+    """
+    Cambiar precios y atributos de muchos productos en una sola transaccion
+    
+    Body:
+    - rules: Cambio porcentual por categoria (con sus subcategorias), marca o proveedor
+      [{field: sale_price|cost_price, percentage, round_to, category_id, brand_id, supplier_id, all_products}]
+    - prices: Precios explicitos [{product_id, sale_price, cost_price}]
+    - attributes: Atributos por filtro [{values: {tax_rate, stock_min, stock_max, unit_of_measure, is_active}, category_id, ...}]
+    
+    Se aplica en orden: reglas, precios explicitos y atributos, con una sola
+    version del catalogo. Si un product_id no existe no se modifica nada (404).
+    
+    Retorna version y cantidad de productos alcanzados por cada cambio
+    """
+    from app.crud.products_crud import product
+
+    attributes = [
+        {**change.dict(exclude={"values"}), "values": change.values.dict(exclude_none=True)}
+        for change in update_data.attributes
+    ]
+    attributes = [change for change in attributes if change["values"]]
+    if not (update_data.rules or update_data.prices or attributes):
+        raise HTTPException(status_code=400, detail="No hay cambios para aplicar")
+
+    try:
+        return product.bulk_update(
+            db,
+            rules=[rule.dict() for rule in update_data.rules],
+            prices=[item.dict() for item in update_data.prices],
+            attributes=attributes
+        )
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=404,
+            detail=f"Productos no encontrados: {', '.join(str(pid) for pid in e.args[0])}"
+        )
+
+
 @router.get("/products", tags=["Productos"])
 async def list_products(
-    db: DBSession,
+    db: AsyncDBSession,
     skip: int = Query(0, ge=0, description="Registros a saltar"),
     limit: int = Query(100, ge=1, le=1000, description="Limite de registros"),
-    active_only: bool = Query(True, description="Solo productos activos")
+    active_only: bool = Query(True, description="Solo productos activos"),
+    cursor: Optional[str] = Query(None, description="Cursor de la pagina siguiente (header X-Next-Cursor)")
 ):
     """
     Listar todos los productos del catalogo (sin autenticación para desarrollo)
@@ -144,26 +383,88 @@ async def list_products(
     - skip: Paginacion (default: 0)
     - limit: Cantidad maxima (default: 100, max: 1000)
     - active_only: Solo activos (default: true)
+    - cursor: Continuar despues de la pagina anterior; reemplaza a skip
     
-    Retorna lista de productos con toda su informacion
+    Retorna lista de productos ordenada por nombre. Si hay mas paginas, el
+    header X-Next-Cursor trae el cursor de la siguiente.
     """
     from app.crud.products_crud import product
+    from app.crud.inventario_crud import product_stock
+
+    try:
+        filtered, next_cursor = await product.get_catalog_page_async(
+            db, skip=skip, limit=limit, active_only=active_only, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    # Saldo de stock solo de los productos de la página (lookup por clave primaria)
+    stock = await product_stock.get_map_async(db, product_ids=[p.id for p in filtered])
+    stock_map = {str(pid): qty for pid, qty in stock.items()}
     
-    from sqlmodel import func
+    return product_list_response(
+        filtered, stock_map, headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+    )
 
-    if active_only:
-        products = product.get_active_products(db)
-        filtered = products[skip:skip+limit]
-    else:
-        filtered = product.get_multi(db, skip=skip, limit=limit)
 
-    # Precalcular stock por producto en un solo query
-    stock_rows = db.exec(
-        select(Inventory.product_id, func.sum(Inventory.quantity)).group_by(Inventory.product_id)
-    ).all()
-    stock_map = {str(pid): qty or 0 for pid, qty in stock_rows}
+@router.get("/products/changes", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
+async def get_catalog_changes(
+    db: DBSession,
+    since: int = Query(0, ge=0, description="Ultima version del catalogo que tiene el cliente"),
+    stock_since: int = Query(0, ge=0, description="Ultima version de stock que tiene el cliente"),
+    limit: int = Query(500, ge=1, le=5000, description="Cantidad aproximada de cambios por respuesta")
+):
+    """
+    Cambios del catalogo desde una version (sincronizacion incremental de la caja)
     
-    return [format_product_response(p, stock_map) for p in filtered]
+    Query params:
+    - since: `version` recibida en la respuesta anterior (0 = catalogo completo)
+    - stock_since: `stock_version` recibida en la respuesta anterior (0 = todos los saldos)
+    - limit: Cambios por respuesta y lista (default: 500, max: 5000)
+    
+    Retorna:
+    - version: Enviar como `since` en la siguiente consulta
+    - stock_version: Enviar como `stock_since` en la siguiente consulta
+    - products: Productos creados, modificados o desactivados, con precio y stock
+      (un cambio en sus presentaciones tambien los incluye)
+    - stock: Saldos de stock que cambiaron [{product_id, stock}]
+    - has_more: Si hay mas cambios, consultar de nuevo de inmediato
+    
+    Los saldos llevan su propia version: las ventas y ajustes no pasan por
+    el contador del catalogo. Una misma version nunca se reparte entre dos
+    respuestas, asi que con cambios masivos una respuesta puede traer mas de
+    `limit` filas. Un cambio puede repetirse en la respuesta siguiente;
+    aplicarlo de nuevo no tiene efecto.
+    """
+    from app.crud.products_crud import product
+    from app.crud.inventario_crud import product_stock
+    from app.crud.numbering_crud import document_counter
+
+    # Primero las versiones confirmadas: todo cambio <= current ya es visible
+    current = document_counter.current_catalog_version(db)
+    current_stock = product_stock.current_version(db)
+
+    changed_products, version, products_more = _changes_until(
+        product.get_changes, db, since=since, until=current, limit=limit
+    )
+    changed_stock, stock_version, stock_more = _changes_until(
+        product_stock.get_changes, db, since=stock_since, until=current_stock, limit=limit,
+        version_attr="stock_version"
+    )
+
+    stock_map = build_stock_map(db, changed_products)
+    cache: dict = {}
+    return JSONResponse(content={
+        "version": version,
+        "stock_version": stock_version,
+        "products": [
+            _serialize_product(p, stock_map.get(str(p.id), 0), cache) for p in changed_products
+        ],
+        "stock": [
+            {"product_id": str(s.product_id), "stock": s.quantity} for s in changed_stock
+        ],
+        "has_more": products_more or stock_more
+    })
 
 
 @router.get("/products/{product_id}", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
@@ -180,17 +481,12 @@ async def get_product(
     Retorna producto completo o 404
     """
     from app.crud.products_crud import product
-    from sqlmodel import func
     
     prod = product.get(db, id=product_id)
     if not prod:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
-    stock_row = db.exec(
-        select(func.sum(Inventory.quantity)).where(Inventory.product_id == product_id)
-    ).first()
-    stock_map = {str(product_id): stock_row or 0}
-    return format_product_response(prod, stock_map)
+    return format_product_response(prod, build_stock_map(db, [prod]))
 
 
 @router.get("/products/sku/{sku}", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
@@ -206,17 +502,7 @@ async def get_product_by_sku(
     
     Retorna producto o 404
     """
-    from app.crud.products_crud import product
-    from sqlmodel import func
-    
-    prod = product.get_by_sku(db, sku=sku)
-    if not prod:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
-    stock_row = db.exec(
-        select(func.sum(Inventory.quantity)).where(Inventory.product_id == prod.id)
-    ).first()
-    stock_map = {str(prod.id): stock_row or 0}
-    return format_product_response(prod, stock_map)
+    return cached_product_lookup(db, kind="sku", code=sku)
 
 
 @router.get("/products/barcode/{barcode}", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
@@ -230,46 +516,44 @@ async def get_product_by_barcode(
     Path params:
     - barcode: Codigo de barras del producto
     
-    Util para escaneo de productos
+    Util para escaneo de productos. Tambien resuelve codigos de presentaciones:
+    en ese caso "presentation" trae la presentacion escaneada.
     Retorna producto o 404
     """
-    from app.crud.products_crud import product
-    from sqlmodel import func
-    
-    prod = product.get_by_barcode(db, barcode=barcode)
-    if not prod:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
-    stock_row = db.exec(
-        select(func.sum(Inventory.quantity)).where(Inventory.product_id == prod.id)
-    ).first()
-    stock_map = {str(prod.id): stock_row or 0}
-    return format_product_response(prod, stock_map)
+    return cached_product_lookup(db, kind="barcode", code=barcode)
 
 
 @router.get("/products/search/name", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
 async def search_products_by_name(
     db: DBSession,
-    name: str = Query(..., min_length=1, description="Termino de busqueda")
+    name: str = Query(..., min_length=1, description="Termino de busqueda"),
+    limit: int = Query(50, ge=1, le=200, description="Cantidad maxima de resultados"),
+    active_only: bool = Query(False, description="Solo productos activos")
 ):
     """
-    Buscar productos por nombre (busqueda parcial)
+    Buscar productos por nombre, SKU o codigo de barras
     
     Query params:
     - name: Termino de busqueda (minimo 1 caracter)
+    - limit: Cantidad maxima (default: 50, max: 200)
+    - active_only: Solo activos (default: false)
     
-    Busca coincidencias parciales en el nombre
-    Retorna lista de productos que coinciden
+    Ignora tildes y mayusculas ("cafe" encuentra "Café"). Los resultados
+    vienen ordenados por relevancia: codigo exacto, nombre que empieza con
+    el termino, palabra que empieza con el termino y coincidencias parciales.
     """
     from app.crud.products_crud import product
     
-    products = product.search_by_name(db, name=name)
-    return [format_product_response(p) for p in products]
+    products = product.search(db, query=name, limit=limit, active_only=active_only)
+    stock_map = build_stock_map(db, products)
+    return product_list_response(products, stock_map)
 
 
 @router.get("/products/category/{category_id}", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
 async def get_products_by_category(
     category_id: UUID,
-    db: DBSession
+    db: DBSession,
+    include_subcategories: bool = Query(True, description="Incluir productos de las subcategorias")
 ):
     """
     Obtener todos los productos de una categoria
@@ -277,16 +561,17 @@ async def get_products_by_category(
     Path params:
     - category_id: UUID de la categoria
     
+    Query params:
+    - include_subcategories: Incluir todo el subarbol (default: true)
+    
     Retorna lista de productos de esa categoria
     """
     from app.crud.products_crud import product
-    products = product.get_products_by_category(db, category_id=category_id)
-    ids = [p.id for p in products]
-    stock_rows = db.exec(
-        select(Inventory.product_id, func.sum(Inventory.quantity)).where(Inventory.product_id.in_(ids)).group_by(Inventory.product_id)
-    ).all()
-    stock_map = {str(pid): qty or 0 for pid, qty in stock_rows}
-    return [format_product_response(p, stock_map) for p in products]
+    products = product.get_by_category(
+        db, category_id=category_id, include_subcategories=include_subcategories
+    )
+    stock_map = build_stock_map(db, products)
+    return product_list_response(products, stock_map)
 
 
 @router.get("/products/supplier/{supplier_id}", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador","Cajero"]))])
@@ -303,34 +588,41 @@ async def get_products_by_supplier(
     Retorna lista de productos del proveedor
     """
     from app.crud.products_crud import product
-    products = product.get_products_by_supplier(db, supplier_id=supplier_id)
-    ids = [p.id for p in products]
-    stock_rows = db.exec(
-        select(Inventory.product_id, func.sum(Inventory.quantity)).where(Inventory.product_id.in_(ids)).group_by(Inventory.product_id)
-    ).all()
-    stock_map = {str(pid): qty or 0 for pid, qty in stock_rows}
-    return [format_product_response(p, stock_map) for p in products]
+    products = product.get_by_supplier(db, supplier_id=supplier_id)
+    stock_map = build_stock_map(db, products)
+    return product_list_response(products, stock_map)
 
 
 @router.get("/products/low-stock/list", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador"]))])
 async def get_low_stock_products(
     db: DBSession,
-    stock_threshold: float = Query(0, description="Umbral de stock para alerta")
+    skip: int = Query(0, ge=0, description="Registros a saltar"),
+    limit: int = Query(100, ge=1, le=1000, description="Limite de registros"),
+    category_id: Optional[UUID] = Query(None, description="Filtrar por categoria (incluye subcategorias)"),
+    stock_threshold: Optional[float] = Query(None, ge=0, description="Umbral fijo en lugar del stock minimo de cada producto")
 ):
     """
     Obtener productos con stock bajo
     
-    Retorna productos donde el stock actual es menor al stock minimo
-    Util para alertas de reabastecimiento
+    Query params:
+    - skip, limit: Paginacion (default: 0, 100)
+    - category_id: Filtrar por categoria y sus subcategorias (opcional)
+    - stock_threshold: Umbral fijo (opcional; por defecto el stock minimo de cada producto)
+    
+    Retorna productos activos cuyo stock es menor o igual al umbral, los mas
+    criticos primero. Util para alertas de reabastecimiento. El header
+    X-Total-Count trae la cantidad total.
     """
     from app.crud.products_crud import product
-    low_stock = product.get_low_stock_products(db, stock_threshold=stock_threshold)
-    ids = [p.id for p in low_stock]
-    stock_rows = db.exec(
-        select(Inventory.product_id, func.sum(Inventory.quantity)).where(Inventory.product_id.in_(ids)).group_by(Inventory.product_id)
-    ).all()
-    stock_map = {str(pid): qty or 0 for pid, qty in stock_rows}
-    return [format_product_response(p, stock_map) for p in low_stock]
+
+    low_stock = product.get_low_stock(
+        db, skip=skip, limit=limit, category_id=category_id, threshold=stock_threshold
+    )
+    total = product.count_low_stock(db, category_id=category_id, threshold=stock_threshold)
+    stock_map = {str(prod.id): quantity for prod, quantity in low_stock}
+    return product_list_response(
+        [prod for prod, _ in low_stock], stock_map, headers={"X-Total-Count": str(total)}
+    )
 
 
 @router.put("/products/{product_id}", tags=["Productos"],dependencies=[Depends(RoleChecker(allowed_roles=["Administrador"]))])
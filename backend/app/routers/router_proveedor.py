@@ -247,21 +247,17 @@ async def create_purchase_order(
     }
     """
     from app.crud.proovider_crud import purchase_order, purchase_order_detail
+    from app.crud.numbering_crud import document_counter
     
-    # Generar número de orden
-    last_order = db.exec(
-        __import__('sqlmodel').select(PurchaseOrder)
-        .order_by(PurchaseOrder.order_date.desc())
-        .limit(1)
-    ).first()
-    order_number = f"PO-{datetime.utcnow().strftime('%Y%m%d')}-{len([last_order]) + 1:04d}"
+    # Generar número de orden desde el contador del día
+    order_number = document_counter.next_number(db, kind="purchase_order")
     
     # Crear orden
     new_order = PurchaseOrder(
         order_number=order_number,
         supplier_id=order_data.supplier_id,
         expected_delivery_date=order_data.expected_delivery_date,
-        created_by_user_id=current_user.id,
+        created_by=current_user.id,
         status=OrderStatus.pendiente
     )
     
@@ -2,9 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Optional
 from pydantic import BaseModel
 from datetime import datetime, date
-from sqlmodel import select, func
-from fastapi.responses import StreamingResponse
-import io
+from sqlmodel import Session, select, func
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+import os
 
 from app.deps import DBSession, get_current_user
 from app.models.models import Sale, SaleDetail, Product, Customer, CashRegisterSession, CashTransaction, Inventory, InventoryMovement, User
@@ -25,66 +26,32 @@ class ExportRequest(BaseModel):
     tipo: str  # ventas, inventario, caja, clientes
     filtro: FiltroReporte
 
+class ReportJobRequest(BaseModel):
+    tipo: str  # ventas, caja, clientes
+    filtro: FiltroReporte
+
+def _summary(db: Session, tipo: str, filtro: FiltroReporte) -> dict:
+    """Resumen desde el caché de reportes o calculado (400 con filtros inválidos)"""
+    from app.crud.report_crud import report_jobs
+    
+    try:
+        return report_jobs.cached_summary(db, tipo, filtro.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 # ========== ENDPOINTS DE REPORTES ==========
 @router.post("/reportes/ventas", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
-async def reporte_ventas(
+def reporte_ventas(
     filtro: FiltroReporte,
-    db: DBSession,
-    current_user: User = Depends(get_current_user)
+    db: DBSession
 ):
     """
     Genera reporte de ventas con filtros
-    """
-    query = select(Sale)
-    
-    # Aplicar filtros
-    if filtro.fecha_inicio:
-        try:
-            fecha_inicio = datetime.fromisoformat(filtro.fecha_inicio.replace('Z', '+00:00'))
-            query = query.where(Sale.sale_date >= fecha_inicio)
-        except:
-            pass
-    
-    if filtro.fecha_fin:
-        try:
-            fecha_fin = datetime.fromisoformat(filtro.fecha_fin.replace('Z', '+00:00'))
-            query = query.where(Sale.sale_date <= fecha_fin)
-        except:
-            pass
     
-    if filtro.cliente_id:
-        from uuid import UUID
-        query = query.where(Sale.customer_id == UUID(filtro.cliente_id))
-    
-    sales = db.exec(query).all()
-    
-    # Calcular totales
-    total_ventas = len(sales)
-    total_ingresos = sum(sale.total_amount for sale in sales)
-    total_descuentos = sum(sale.discount_amount for sale in sales)
-    total_impuestos = sum(sale.tax_amount for sale in sales)
-    
-    # Ventas por día
-    ventas_por_dia = {}
-    for sale in sales:
-        dia = sale.sale_date.date().isoformat()
-        if dia not in ventas_por_dia:
-            ventas_por_dia[dia] = {"cantidad": 0, "total": 0}
-        ventas_por_dia[dia]["cantidad"] += 1
-        ventas_por_dia[dia]["total"] += sale.total_amount
-    
-    return {
-        "total_ventas": total_ventas,
-        "total_ingresos": total_ingresos,
-        "total_descuentos": total_descuentos,
-        "total_impuestos": total_impuestos,
-        "promedio_venta": total_ingresos / total_ventas if total_ventas > 0 else 0,
-        "ventas_por_dia": ventas_por_dia,
-        "periodo": {
-            "inicio": filtro.fecha_inicio,
-            "fin": filtro.fecha_fin
-        }
-    }
+    Totales agregados en la base de datos; un periodo cerrado (fecha_fin pasada)
+    se responde desde el caché de reportes. Para rangos largos use /reportes/jobs.
+    """
+    return _summary(db, "ventas", filtro)
 
 @router.post("/reportes/inventario", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Almacen"]))])
 async def reporte_inventario(
@@ -131,222 +98,169 @@ async def reporte_inventario(
     }
 
 @router.post("/reportes/caja", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
-async def reporte_caja(
+def reporte_caja(
     filtro: FiltroReporte,
     db: DBSession
 ):
     """
     Genera reporte de movimientos de caja
     """
-    query = select(CashRegisterSession)
-    
-    if filtro.fecha_inicio:
-        try:
-            fecha_inicio = datetime.fromisoformat(filtro.fecha_inicio.replace('Z', '+00:00'))
-            query = query.where(CashRegisterSession.opening_date >= fecha_inicio)
-        except:
-            pass
-    
-    if filtro.fecha_fin:
-        try:
-            fecha_fin = datetime.fromisoformat(filtro.fecha_fin.replace('Z', '+00:00'))
-            query = query.where(CashRegisterSession.opening_date <= fecha_fin)
-        except:
-            pass
-    
-    sessions = db.exec(query).all()
-    
-    # Calcular totales
-    total_sesiones = len(sessions)
-    total_ingresos = sum(s.opening_amount for s in sessions)
-    total_cierres = sum(s.actual_closing_amount for s in sessions if s.actual_closing_amount)
-    total_diferencias = sum(abs(s.difference) for s in sessions if s.difference)
-    
-    sesiones_data = []
-    for session in sessions:
-        sesiones_data.append({
-            "id": str(session.id),
-            "fecha_apertura": session.opening_date.isoformat(),
-            "fecha_cierre": session.closing_date.isoformat() if session.closing_date else None,
-            "monto_apertura": session.opening_amount,
-            "monto_cierre": session.actual_closing_amount,
-            "diferencia": session.difference,
-            "status": session.status.value if hasattr(session.status, 'value') else session.status
-        })
-    
-    return {
-        "total_sesiones": total_sesiones,
-        "total_ingresos": total_ingresos,
-        "total_cierres": total_cierres,
-        "total_diferencias": total_diferencias,
-        "sesiones": sesiones_data,
-        "periodo": {
-            "inicio": filtro.fecha_inicio,
-            "fin": filtro.fecha_fin
-        }
-    }
+    return _summary(db, "caja", filtro)
 
 @router.post("/reportes/clientes", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
-async def reporte_clientes(
+def reporte_clientes(
     filtro: FiltroReporte,
     db: DBSession
 ):
     """
-    Genera reporte de clientes con compras
+    Genera reporte de clientes con compras (fecha_inicio/fecha_fin acotan las compras)
+    """
+    return _summary(db, "clientes", filtro)
+
+# ========== JOBS DE REPORTES ==========
+def _job_response(job: dict) -> dict:
+    if job["estado"] == "completado":
+        job["resultado_url"] = f"/reportes/jobs/{job['id']}/resultado"
+    return job
+
+@router.post("/reportes/jobs", status_code=status.HTTP_202_ACCEPTED, tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
+def crear_job_reporte(
+    request: ReportJobRequest,
+    current_user: User = Depends(get_current_user)
+):
     """
-    # Obtener todos los clientes
-    customers = db.exec(select(Customer).where(Customer.is_active == True)).all()
+    Encola un reporte (ventas, caja, clientes) y devuelve el job para consultar su estado
     
-    clientes_data = []
-    total_clientes = len(customers)
-    total_puntos = 0
+    Si el mismo reporte ya está calculado y vigente el job se devuelve completado;
+    si hay uno igual en curso se devuelve ese job.
+    """
+    from app.crud.report_crud import report_jobs, ReportQueueFull
     
-    for customer in customers:
-        # Contar compras del cliente
-        sales_count = db.exec(
-            select(func.count(Sale.id)).where(Sale.customer_id == customer.id)
-        ).first() or 0
-        
-        # Total gastado
-        total_spent = db.exec(
-            select(func.sum(Sale.total_amount)).where(Sale.customer_id == customer.id)
-        ).first() or 0.0
-        
-        total_puntos += customer.loyalty_points
-        
-        clientes_data.append({
-            "id": str(customer.id),
-            "nombre": f"{customer.first_name} {customer.last_name}",
-            "documento": customer.document_number,
-            "email": customer.email,
-            "telefono": customer.phone,
-            "puntos_fidelidad": customer.loyalty_points,
-            "total_compras": sales_count,
-            "total_gastado": float(total_spent) if total_spent else 0.0
-        })
+    try:
+        job = report_jobs.submit(request.tipo, request.filtro.dict(), user_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ReportQueueFull as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    return _job_response(job)
+
+@router.get("/reportes/jobs/{job_id}", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
+def estado_job_reporte(job_id: str):
+    """
+    Estado del job: pendiente, en_proceso, completado o error
+    """
+    from app.crud.report_crud import report_jobs
     
-    # Ordenar por total gastado
-    clientes_data.sort(key=lambda x: x["total_gastado"], reverse=True)
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job de reporte no encontrado")
+    return _job_response(job)
+
+@router.get("/reportes/jobs/{job_id}/resultado", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
+def resultado_job_reporte(job_id: str):
+    """
+    Resultado de un job completado (JSON con tipo, filtro, generado y resultado)
+    """
+    from app.crud.report_crud import report_jobs
     
-    return {
-        "total_clientes": total_clientes,
-        "total_puntos_sistema": total_puntos,
-        "clientes": clientes_data,
-        "top_clientes": clientes_data[:10]  # Top 10
-    }
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job de reporte no encontrado")
+    if job["estado"] != "completado":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"El reporte no está listo (estado: {job['estado']})"
+        )
+    path = report_jobs.result_path(job_id)
+    if not path:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="El resultado del reporte expiró")
+    return FileResponse(path, media_type="application/json")
+
+# ========== EXPORTACIÓN ==========
+def _export_args(request: ExportRequest) -> tuple[str, dict]:
+    """Validar tipo y filtros antes de empezar a generar el archivo"""
+    from app.crud.report_crud import build_report_statement
+    
+    filtro = request.filtro.dict()
+    try:
+        build_report_statement(request.tipo, filtro)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return request.tipo, filtro
+
+def _file_response(path: str, media_type: str, filename: str) -> FileResponse:
+    """Enviar el archivo generado por bloques y borrarlo al terminar"""
+    return FileResponse(
+        path,
+        media_type=media_type,
+        filename=filename,
+        background=BackgroundTask(os.remove, path)
+    )
 
 @router.post("/reportes/exportar/excel", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
 async def exportar_excel(
-    request: ExportRequest,
-    db: DBSession
+    request: ExportRequest
 ):
     """
-    Exporta reporte a Excel
+    Exporta reporte a Excel (tipo: ventas, inventario, caja, clientes)
     NOTA: Requiere openpyxl instalado: pip install openpyxl
+    
+    El libro se genera en modo write_only dentro del pool de procesos de reportes.
     """
     try:
-        from openpyxl import Workbook
-        from openpyxl.utils import get_column_letter
+        import openpyxl  # noqa: F401
     except ImportError:
         raise HTTPException(
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
             detail="Librería openpyxl no instalada. Ejecute: pip install openpyxl"
         )
-    
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Reporte"
-    
-    # Encabezados básicos
-    ws['A1'] = 'Reporte Generado'
-    ws['B1'] = datetime.now().isoformat()
-    
-    # Datos simulados (en producción llamaríamos al endpoint correspondiente)
-    ws['A3'] = 'Tipo de Reporte'
-    ws['B3'] = request.tipo
-    
-    # Guardar en memoria
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=reporte_{request.tipo}.xlsx"}
+    from app.crud.report_crud import render_report, render_report_xlsx
+    
+    tipo, filtro = _export_args(request)
+    path = await render_report(render_report_xlsx, tipo, filtro)
+    return _file_response(
+        path,
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        f"reporte_{tipo}.xlsx"
     )
 
 @router.post("/reportes/exportar/csv", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
 async def exportar_csv(
-    request: ExportRequest,
-    db: DBSession
+    request: ExportRequest
 ):
     """
-    Exporta reporte a CSV
-    """
-    import csv
+    Exporta reporte a CSV (tipo: ventas, inventario, caja, clientes)
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Encabezados
-    writer.writerow(['Reporte', 'Fecha'])
-    writer.writerow([request.tipo, datetime.now().isoformat()])
-    writer.writerow([])
-    
-    # Datos según tipo
-    writer.writerow(['Columna 1', 'Columna 2', 'Columna 3'])
-    writer.writerow(['Dato 1', 'Dato 2', 'Dato 3'])
-    
-    # Convertir a bytes
-    output.seek(0)
-    content = output.getvalue().encode('utf-8')
+    Las filas se envían a medida que se leen de la base de datos.
+    """
+    from app.crud.report_crud import iter_report_csv
     
+    tipo, filtro = _export_args(request)
     return StreamingResponse(
-        io.BytesIO(content),
+        iter_report_csv(tipo, filtro),
         media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=reporte_{request.tipo}.csv"}
+        headers={"Content-Disposition": f"attachment; filename=reporte_{tipo}.csv"}
     )
 
 @router.post("/reportes/exportar/pdf", tags=["Reportes"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Contador"]))])
 async def exportar_pdf(
-    request: ExportRequest,
-    db: DBSession
+    request: ExportRequest
 ):
     """
-    Exporta reporte a PDF
+    Exporta reporte a PDF (tipo: ventas, inventario, caja, clientes)
     NOTA: Requiere reportlab instalado: pip install reportlab
+    
+    El documento se pagina y se genera dentro del pool de procesos de reportes.
     """
     try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.pdfgen import canvas
+        import reportlab  # noqa: F401
     except ImportError:
         raise HTTPException(
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
             detail="Librería reportlab no instalada. Ejecute: pip install reportlab"
         )
+    from app.crud.report_crud import render_report, render_report_pdf
     
-    # Crear PDF en memoria
-    output = io.BytesIO()
-    c = canvas.Canvas(output, pagesize=letter)
-    
-    # Título
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(100, 750, f"Reporte de {request.tipo}")
-    
-    # Fecha
-    c.setFont("Helvetica", 12)
-    c.drawString(100, 730, f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    # Contenido simulado
-    c.drawString(100, 700, "Datos del reporte aquí...")
-    
-    c.save()
-    output.seek(0)
-    
-    return StreamingResponse(
-        output,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=reporte_{request.tipo}.pdf"}
-    )
+    tipo, filtro = _export_args(request)
+    path = await render_report(render_report_pdf, tipo, filtro)
+    return _file_response(path, "application/pdf", f"reporte_{tipo}.pdf")
@@ -1,20 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Response
 from typing import Optional, List
 from uuid import UUID
-from pydantic import BaseModel
-from datetime import datetime
-from sqlmodel import select
+import json
+from pydantic import BaseModel, Field, validator
+from datetime import datetime, timedelta, timezone
+from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
 
-from app.deps import DBSession
-from app.models.models import Sale, SaleDetail, Customer, CashRegister, PaymentMethod, Inventory, InventoryMovement, Product, CashTransaction, CashRegisterSession, User
+from app.deps import DBSession, AsyncDBSession, IdempotencyKeyHeader, run_idempotent, stage_idempotent_response, request_fingerprint
+from app.utils.streaming import stream_rows, STREAM_FORMAT_PATTERN
+from app.models.models import Sale, SaleDetail, Customer, CashRegister, PaymentMethod, Inventory, InventoryMovement, Product, CashTransaction, CashRegisterSession, User, IdempotencyKey
 from app.auth.auth import RoleChecker, get_current_user
+from app.crud.base_crud import apply_keyset, keyset_page
 from app.models.enums import SaleStatus, MovementType, TransactionType, SessionStatus
 
 router = APIRouter()
 
 
 def format_sale_response(sale: Sale, product_map: dict | None = None):
-    """Formatear venta con estructura esperada por Angular"""
+    """
+    Formatear venta con estructura esperada por Angular
+    
+    El nombre del producto sale de la copia guardada en el detalle; `product_map`
+    solo completa detalles anteriores a esa copia (ver sales_response).
+    """
     return {
         "id": str(sale.id),
         "sale_number": sale.sale_number,
@@ -43,11 +52,10 @@ def format_sale_response(sale: Sale, product_map: dict | None = None):
             {
                 "id": str(detail.id),
                 "product_id": str(detail.product_id),
-                "product_name": (
-                    detail.product.name
-                    if getattr(detail, "product", None) and getattr(detail.product, "name", None)
-                    else product_map.get(detail.product_id) if product_map else None
+                "product_name": detail.product_name or (
+                    product_map.get(detail.product_id) if product_map else None
                 ),
+                "product_sku": detail.product_sku,
                 "quantity": detail.quantity,
                 "unit_price": detail.unit_price,
                 "discount_percentage": detail.discount_percentage,
@@ -64,6 +72,63 @@ def format_sale_response(sale: Sale, product_map: dict | None = None):
     }
 
 
+def missing_product_names(db: Session, sales: List[Sale]) -> dict:
+    """
+    Nombres del catálogo para los detalles sin nombre copiado (ventas
+    registradas antes de guardar la copia); solo consulta si hay alguno
+    """
+    missing = {
+        detail.product_id
+        for sale in sales for detail in sale.details
+        if not detail.product_name
+    }
+    if not missing:
+        return {}
+    return dict(db.exec(
+        select(Product.id, Product.name).where(Product.id.in_(list(missing)))
+    ).all())
+
+
+def sales_response(db: Session, sales: List[Sale]) -> list[dict]:
+    """Formatear varias ventas (cargadas con with_sale_relations)"""
+    product_map = missing_product_names(db, sales)
+    return [format_sale_response(sale, product_map) for sale in sales]
+
+
+SALE_CSV_HEADER = [
+    "sale_number", "sale_date", "status", "customer_document", "cashier",
+    "product_sku", "product_name", "quantity", "unit_price", "discount_amount",
+    "tax_amount", "line_total", "sale_total"
+]
+
+
+def sale_csv_rows(sale: Sale, product_map: dict | None = None) -> list[list]:
+    """
+    Filas CSV de una venta: una por ítem con los datos de cabecera repetidos
+
+    Una venta sin ítems sale en una sola fila con las columnas del ítem vacías.
+    """
+    status_value = sale.status.value if hasattr(sale.status, 'value') else str(sale.status)
+    head = [
+        sale.sale_number,
+        sale.sale_date.isoformat(),
+        status_value,
+        sale.customer.document_number if sale.customer else "",
+        sale.cashier.username if sale.cashier else ""
+    ]
+    if not sale.details:
+        return [head + ["", "", "", "", "", "", "", sale.total_amount]]
+    return [
+        head + [
+            detail.product_sku,
+            detail.product_name or (product_map.get(detail.product_id) if product_map else None),
+            detail.quantity, detail.unit_price,
+            detail.discount_amount, detail.tax_amount, detail.total, sale.total_amount
+        ]
+        for detail in sale.details
+    ]
+
+
 class SaleItemCreate(BaseModel):
     product_id: UUID
     quantity: float
@@ -76,19 +141,49 @@ class SaleCreate(BaseModel):
     customer_id: Optional[UUID] = None
     cash_register_id: Optional[UUID] = None
     payment_method_id: Optional[UUID] = None
+    cart_id: Optional[str] = None  # Carrito con apartados del cajero (POST /inventory/reservations)
     items: List[SaleItemCreate]
     notes: Optional[str] = None
 
 
+# Ventas por bloque al sincronizar cajas que estuvieron sin conexión
+SALE_BATCH_CHUNK_SIZE = 100
+OFFLINE_REFERENCE_TTL = timedelta(days=30)
+
+
+class OfflineSaleCreate(BaseModel):
+    client_reference: Optional[str] = Field(None, max_length=200)  # Id local de la venta en la caja
+    sold_at: Optional[datetime] = None  # Hora real de la venta sin conexión
+    customer_id: Optional[UUID] = None
+    payment_method_id: Optional[UUID] = None
+    items: List[SaleItemCreate]
+    notes: Optional[str] = None
+
+    @validator("sold_at")
+    def sold_at_utc(cls, value):
+        """Las fechas se guardan en UTC sin zona horaria"""
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class SaleBatchCreate(BaseModel):
+    sales: List[OfflineSaleCreate] = Field(..., min_items=1, max_items=1000)
+
+
 @router.post("/sales", tags=["Ventas"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def create_sale(
     sale_data: SaleCreate,
-    db: DBSession,
-    current_user: User = Depends(get_current_user)
+    db: AsyncDBSession,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: IdempotencyKeyHeader = None
 ):
     """
     Crear una nueva venta
     
+    Header opcional Idempotency-Key: un reintento con la misma llave devuelve
+    la venta ya registrada en lugar de crear otra.
+    
     Body JSON:
     {
         "customer_id": "uuid (optional)",
@@ -106,12 +201,51 @@ async def create_sale(
         "notes": "Notas de la venta (optional)"
     }
     """
-    from app.crud.sale_crud import sale as sale_crud
-    
-    # Validar que el usuario tenga una sesión de caja abierta
+    # El checkout corre sobre la conexión asíncrona: no bloquea el event loop
+    return await db.run_sync(
+        run_idempotent,
+        key=idempotency_key,
+        user_id=current_user.id,
+        endpoint="POST /sales",
+        payload=sale_data,
+        handler=lambda session, record: register_sale(session, sale_data, current_user.id, record)
+    )
+
+
+def insufficient_stock_error(
+    db: Session,
+    requested: dict[UUID, float],
+    held_by_product: dict[UUID, float],
+    product_by_id: dict[UUID, Product]
+) -> HTTPException:
+    """Armar el error de stock insuficiente con el disponible real de cada producto"""
+    from app.crud.inventario_crud import inventory as inventory_crud
+
+    rows = inventory_crud.get_primary_rows(db, product_ids=list(requested))
+    for product_id, quantity in requested.items():
+        row = rows.get(product_id)
+        available = (
+            row.quantity - row.reserved_quantity + held_by_product.get(product_id, 0)
+            if row else 0
+        )
+        if available < quantity:
+            product = product_by_id.get(product_id)
+            product_name = product.name if product else "Producto desconocido"
+            return HTTPException(
+                status_code=400, 
+                detail=f"Stock insuficiente para {product_name}. Solicitado: {quantity}, Disponible: {available}"
+            )
+    return HTTPException(
+        status_code=409,
+        detail="El stock cambió durante la venta, intente nuevamente"
+    )
+
+
+def get_open_session(db: Session, cashier_id: UUID) -> CashRegisterSession:
+    """Sesión de caja abierta del cajero (400 si no tiene)"""
     active_session = db.exec(
         select(CashRegisterSession).where(
-            CashRegisterSession.user_id == current_user.id,
+            CashRegisterSession.user_id == cashier_id,
             CashRegisterSession.status == SessionStatus.abierta
         )
     ).first()
@@ -120,89 +254,68 @@ async def create_sale(
             status_code=400,
             detail="Debes abrir una caja antes de registrar ventas"
         )
+    return active_session
 
-    # Generar número de venta único
-    import datetime as dt
-    from sqlmodel import func
-    
-    today_start = dt.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = dt.datetime.utcnow().replace(hour=23, minute=59, second=59, microsecond=999999)
+
+def get_default_payment_method_id(db: Session) -> UUID:
+    """Método de pago usado cuando la venta no indica uno"""
+    payment_method_id = db.exec(select(PaymentMethod.id)).first()
+    if not payment_method_id:
+        raise HTTPException(status_code=400, detail="No hay métodos de pago configurados")
+    return payment_method_id
+
+
+def build_sale_records(
+    sale_data,
+    *,
+    sale_number: str,
+    cashier_id: UUID,
+    cash_register_id: UUID,
+    session_id: UUID,
+    running_stock: dict[UUID, float],
+    product_labels: dict[UUID, tuple[str, str]],
+    sold_at: datetime
+) -> tuple[Sale, list[SaleDetail], list[InventoryMovement], CashTransaction]:
+    """
+    Armar venta, detalles, movimientos de salida y transacción de caja (sin tocar la base)
     
-    count_query = select(func.count(Sale.id)).where(
-        Sale.sale_date >= today_start,
-        Sale.sale_date <= today_end
+    `running_stock` trae el stock de cada producto antes de esta venta y queda
+    actualizado con el stock posterior, para encadenar varias ventas.
+    `product_labels` (product_id -> (nombre, SKU)) se copia en cada detalle.
+    """
+    new_sale = Sale(
+        sale_number=sale_number,
+        sale_date=sold_at,
+        cashier_id=cashier_id,
+        cash_register_id=cash_register_id,
+        customer_id=sale_data.customer_id,
+        status=SaleStatus.completada,
+        notes=sale_data.notes,
+        created_at=sold_at
     )
-    today_count = db.exec(count_query).first() or 0
-    sale_number = f"V-{dt.datetime.utcnow().strftime('%Y%m%d')}-{today_count + 1:05d}"
-    
-    # Resolver caja y método de pago: forzamos la caja de la sesión activa del cajero
-    sale_data.cash_register_id = active_session.cash_register_id
-    if not sale_data.payment_method_id:
-        payment_method = db.exec(select(PaymentMethod)).first()
-        if not payment_method:
-            raise HTTPException(status_code=400, detail="No hay métodos de pago configurados")
-        sale_data.payment_method_id = payment_method.id
-    
-    # Calcular totales
+
     subtotal = 0.0
     discount_total = 0.0
     tax_total = 0.0
-    
-    # ⭐ VALIDAR STOCK DISPONIBLE PARA CADA PRODUCTO
-    for item in sale_data.items:
-        inventory_query = select(Inventory).where(Inventory.product_id == item.product_id)
-        inventory = db.exec(inventory_query).first()
-        
-        if not inventory or inventory.quantity < item.quantity:
-            available = inventory.quantity if inventory else 0
-            product_query = select(Product).where(Product.id == item.product_id)
-            product = db.exec(product_query).first()
-            product_name = product.name if product else "Producto desconocido"
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Stock insuficiente para {product_name}. Solicitado: {item.quantity}, Disponible: {available}"
-            )
-    
+    details = []
+    movements = []
+
     for item in sale_data.items:
         item_subtotal = item.quantity * item.unit_price
         item_discount = item_subtotal * (item.discount_percentage / 100)
         item_tax = (item_subtotal - item_discount) * item.tax_rate
+        item_total = item_subtotal - item_discount + item_tax
         
         subtotal += item_subtotal
         discount_total += item_discount
         tax_total += item_tax
-    
-    total = subtotal - discount_total + tax_total
-    
-    # Crear venta
-    new_sale = Sale(
-        sale_number=sale_number,
-        sale_date=dt.datetime.utcnow(),
-        cashier_id=current_user.id,
-        cash_register_id=sale_data.cash_register_id,
-        customer_id=sale_data.customer_id,
-        subtotal=subtotal,
-        discount_amount=discount_total,
-        tax_amount=tax_total,
-        total_amount=total,
-        status=SaleStatus.completada,
-        notes=sale_data.notes,
-        created_at=dt.datetime.utcnow()
-    )
-    
-    db.add(new_sale)
-    db.flush()  # Obtener ID
-    
-    # Crear detalles
-    for item in sale_data.items:
-        item_subtotal = item.quantity * item.unit_price
-        item_discount = item_subtotal * (item.discount_percentage / 100)
-        item_tax = (item_subtotal - item_discount) * item.tax_rate
-        item_total = item_subtotal - item_discount + item_tax
         
-        detail = SaleDetail(
+        product_name, product_sku = product_labels.get(item.product_id, (None, None))
+        details.append(SaleDetail(
             sale_id=new_sale.id,
             product_id=item.product_id,
+            product_name=product_name,
+            product_sku=product_sku,
             quantity=item.quantity,
             unit_price=item.unit_price,
             discount_percentage=item.discount_percentage,
@@ -211,75 +324,449 @@ async def create_sale(
             tax_rate=item.tax_rate,
             tax_amount=item_tax,
             total=item_total
-        )
-        db.add(detail)
-        
-        # ⭐ DESCONTAR DEL INVENTARIO
-        inventory_query = select(Inventory).where(Inventory.product_id == item.product_id)
-        inventory = db.exec(inventory_query).first()
+        ))
         
-        if inventory:
-            inventory.quantity -= item.quantity
-            db.add(inventory)
-        
-        # ⭐ CREAR MOVIMIENTO DE INVENTARIO (SALIDA POR VENTA)
-        previous_stock = inventory.quantity if inventory else 0  # Stock antes de la salida
+        # ⭐ MOVIMIENTO DE INVENTARIO (SALIDA POR VENTA)
+        # inventory_movements no tiene columnas de costo ni de fecha aparte: el
+        # costo sale de products.cost_price y created_at es la hora de la venta
+        previous_stock = running_stock[item.product_id]  # Stock antes de la salida
         new_stock = previous_stock - item.quantity  # Stock después de la salida
+        running_stock[item.product_id] = new_stock
         
-        movement = InventoryMovement(
+        movements.append(InventoryMovement(
             product_id=item.product_id,
             movement_type=MovementType.salida,
             quantity=item.quantity,
             previous_stock=previous_stock,
             new_stock=new_stock,
-            unit_cost=item.unit_price,
-            total_cost=item.quantity * item.unit_price,
             reference_document=f"Venta {sale_number}",
-            user_id=current_user.id,
-            movement_date=dt.datetime.utcnow(),
-            created_at=dt.datetime.utcnow()
-        )
-        db.add(movement)
+            user_id=cashier_id,
+            created_at=sold_at
+        ))
     
-    # ⭐ CREAR TRANSACCIÓN DE CAJA PARA LA VENTA
-    # Buscar sesión de caja abierta para esta caja registradora
-    active_session_query = select(CashRegisterSession).where(
-        CashRegisterSession.cash_register_id == sale_data.cash_register_id,
-        CashRegisterSession.status == SessionStatus.abierta
+    total = subtotal - discount_total + tax_total
+    new_sale.subtotal = subtotal
+    new_sale.discount_amount = discount_total
+    new_sale.tax_amount = tax_total
+    new_sale.total_amount = total
+    new_sale.details = details
+
+    # ⭐ TRANSACCIÓN DE CAJA SOBRE LA SESIÓN ACTIVA YA CONSULTADA
+    cash_transaction = CashTransaction(
+        session_id=session_id,
+        transaction_type=TransactionType.venta,
+        amount=total,
+        payment_method_id=sale_data.payment_method_id,
+        reference_number=sale_number,
+        description=f"Venta {sale_number}",
+        created_by=cashier_id,
+        created_at=sold_at
     )
-    active_session = db.exec(active_session_query).first()
-    
-    if active_session:
-        # Crear transacción de tipo venta
-        cash_transaction = CashTransaction(
-            session_id=active_session.id,
-            transaction_type=TransactionType.venta,
-            amount=total,
-            payment_method_id=sale_data.payment_method_id,
-            reference_number=sale_number,
-            description=f"Venta {sale_number}",
-            created_by=current_user.id,
-            created_at=dt.datetime.utcnow()
-        )
-        db.add(cash_transaction)
+
+    return new_sale, details, movements, cash_transaction
+
+
+def register_sale(
+    db: Session,
+    sale_data: SaleCreate,
+    cashier_id: UUID,
+    idempotency_record: Optional[IdempotencyKey] = None,
+    purge_expired_holds: bool = True
+) -> dict:
+    """
+    Registrar la venta completa (detalles, inventario y caja) en una transacción
+
+    El pipeline hace un número constante de viajes a la base de datos sin
+    importar cuántas líneas tenga el carrito: una lectura del inventario
+    involucrado, un único descuento condicional (sin bloqueos previos),
+    inserciones en lote de detalles y movimientos y una sola transacción de caja.
+    Si falta stock se liberan los apartados vencidos de esos productos y se
+    reintenta una vez antes de rechazar la venta. El número de venta se toma
+    después del descuento, en la misma transacción (ver
+    CRUDDocumentCounter._take_from_block). La respuesta de la
+    Idempotency-Key (`idempotency_record`) se guarda en la misma transacción.
+    """
+    from app.crud.inventario_crud import inventory as inventory_crud, stock_reservation, product_stock
+    from app.crud.numbering_crud import document_counter
+    from app.crud.sale_crud import apply_sale_aggregates
+
+    # Validar que el usuario tenga una sesión de caja abierta
+    active_session = get_open_session(db, cashier_id)
+
+    # Resolver caja y método de pago: forzamos la caja de la sesión activa del cajero
+    sale_data.cash_register_id = active_session.cash_register_id
+    if not sale_data.payment_method_id:
+        sale_data.payment_method_id = get_default_payment_method_id(db)
     
+    # Cantidad total pedida por producto (un producto puede repetirse en el carrito)
+    requested: dict[UUID, float] = {}
+    for item in sale_data.items:
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+    product_ids = list(requested)
+
+    # Fila de inventario de cada producto: lectura sin bloqueo, el descuento es condicional
+    inventory_by_product = inventory_crud.get_primary_rows(db, product_ids=product_ids)
+
+    # Nombre y SKU de los productos: se copian en los detalles y se usan en los errores
+    products = db.exec(select(Product).where(Product.id.in_(product_ids))).all()
+    product_by_id = {p.id: p for p in products}
+
+    # ⭐ APARTADOS DEL CARRITO: se liberan y su stock pasa a esta venta
+    held_by_product: dict[UUID, float] = {}
+    if sale_data.cart_id:
+        cart_holds = stock_reservation.get_by_cart(
+            db, cart_id=sale_data.cart_id, user_id=cashier_id, for_update=True
+        )
+        for hold in cart_holds:
+            held_by_product[hold.product_id] = held_by_product.get(hold.product_id, 0) + hold.quantity
+        stock_reservation.release_holds(db, holds=cart_holds)
+
+    # ⭐ DESCUENTO ATÓMICO: UPDATE … WHERE quantity - reserved_quantity >= cantidad
+    decrements = {
+        inventory_by_product[pid].id: qty
+        for pid, qty in requested.items()
+        if pid in inventory_by_product
+    }
+    if len(decrements) != len(requested) or not inventory_crud.decrement_stock_atomic(
+        db, decrements=decrements, user_id=cashier_id
+    ):
+        db.rollback()
+        # Carritos abandonados: sus apartados vencidos todavía restan del disponible
+        if purge_expired_holds and stock_reservation.purge_expired(db, product_ids=product_ids):
+            return register_sale(db, sale_data, cashier_id, idempotency_record, purge_expired_holds=False)
+        raise insufficient_stock_error(db, requested, held_by_product, product_by_id)
+    product_stock.apply_deltas(db, deltas={pid: -qty for pid, qty in requested.items()})
+
+    # Número de venta recién con el stock descontado: un rechazo no consume números
+    sale_number = document_counter.next_number(db, kind="sale")
+
+    # Stock resultante: las filas ya quedaron bloqueadas por el UPDATE
+    stock_after = dict(db.exec(
+        select(Inventory.id, Inventory.quantity).where(Inventory.id.in_(list(decrements)))
+    ).all())
+    
+    running_stock = {
+        pid: stock_after[inventory_by_product[pid].id] + qty
+        for pid, qty in requested.items()
+    }
+    new_sale, details, movements, cash_transaction = build_sale_records(
+        sale_data,
+        sale_number=sale_number,
+        cashier_id=cashier_id,
+        cash_register_id=active_session.cash_register_id,
+        session_id=active_session.id,
+        running_stock=running_stock,
+        product_labels={p.id: (p.name, p.sku) for p in products},
+        sold_at=datetime.utcnow()
+    )
+
+    # El unit of work agrupa los INSERT de cada tabla en un executemany
+    db.add(new_sale)
+    db.add_all(details)
+    db.add_all(movements)
+    db.add(cash_transaction)
+    apply_sale_aggregates(db, sales=[new_sale], categories={p.id: p.category_id for p in products})
+    # La respuesta (y la guardada para la Idempotency-Key) lleva cliente y cajero
+    db.flush()
+    db.expire(new_sale, ["customer", "cashier"])
+    response = format_sale_response(new_sale)
+    stage_idempotent_response(db, idempotency_record, response)
     db.commit()
-    db.refresh(new_sale)
     
-    return format_sale_response(new_sale)
+    return response
+
+
+@router.post("/sales/batch", tags=["Ventas"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
+async def create_sales_batch(
+    batch: SaleBatchCreate,
+    db: AsyncDBSession,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Sincronizar ventas registradas sin conexión
+    
+    Body JSON:
+    {
+        "sales": [
+            {
+                "client_reference": "caja1-000123",
+                "sold_at": "2024-01-01T10:15:00Z",
+                "items": [{"product_id": "uuid", "quantity": 1, "unit_price": 2.5}]
+            }
+        ]
+    }
+    
+    Las ventas se procesan en orden de sold_at y cada una se registra o se
+    rechaza por separado. Reenviar un client_reference ya sincronizado la
+    devuelve como duplicada sin volver a descontar stock.
+    """
+    return await db.run_sync(register_sale_batch, batch, current_user.id)
+
+
+def register_sale_batch(db: Session, batch: SaleBatchCreate, cashier_id: UUID) -> dict:
+    """
+    Registrar un lote de ventas offline por bloques de SALE_BATCH_CHUNK_SIZE
+
+    Las lecturas se hacen una vez para todo el lote (sesión, productos,
+    inventario y referencias ya sincronizadas) y el stock se valida en memoria.
+    Cada bloque hace un único descuento condicional e inserciones en lote y se
+    confirma en su propia transacción.
+    """
+    from app.crud.inventario_crud import stock_reservation
+
+    active_session = get_open_session(db, cashier_id)
+    session_ref = (active_session.id, active_session.cash_register_id)
+
+    default_payment_method_id = None
+    if any(not sale.payment_method_id for sale in batch.sales):
+        default_payment_method_id = get_default_payment_method_id(db)
+
+    product_ids = list({item.product_id for sale in batch.sales for item in sale.items})
+    product_labels = {
+        pid: (name, sku)
+        for pid, name, sku in db.exec(
+            select(Product.id, Product.name, Product.sku).where(Product.id.in_(product_ids))
+        ).all()
+    }
+
+    # Referencias ya sincronizadas en envíos anteriores
+    reference_keys = {
+        f"offline-sale:{sale.client_reference}"
+        for sale in batch.sales if sale.client_reference
+    }
+    synced = {}
+    if reference_keys:
+        synced = {
+            record.key: record
+            for record in db.exec(
+                select(IdempotencyKey).where(
+                    IdempotencyKey.user_id == cashier_id,
+                    IdempotencyKey.key.in_(list(reference_keys))
+                )
+            ).all()
+        }
+
+    results: list[Optional[dict]] = [None] * len(batch.sales)
+    pending = []
+    seen_keys = set()
+    ordered = sorted(
+        enumerate(batch.sales),
+        key=lambda pair: pair[1].sold_at or datetime.max
+    )
+    for index, sale in ordered:
+        key = f"offline-sale:{sale.client_reference}" if sale.client_reference else None
+        if key in synced:
+            results[index] = {**json.loads(synced[key].response_body), "status": "duplicada"}
+            continue
+        if key and key in seen_keys:
+            results[index] = offline_sale_rejected(sale, "client_reference repetido en el lote")
+            continue
+        if key:
+            seen_keys.add(key)
+        if not sale.payment_method_id:
+            sale.payment_method_id = default_payment_method_id
+        pending.append((index, sale, key))
+
+    # Los apartados vencidos no deben restar del stock con que se validan las ventas
+    stock_reservation.purge_expired(db, product_ids=product_ids)
+    stock = read_available_stock(db, product_ids)
+    for start in range(0, len(pending), SALE_BATCH_CHUNK_SIZE):
+        chunk = pending[start:start + SALE_BATCH_CHUNK_SIZE]
+        stock = register_offline_chunk(
+            db, chunk, results,
+            cashier_id=cashier_id,
+            session_ref=session_ref,
+            product_labels=product_labels,
+            stock=stock
+        )
+
+    statuses = [result["status"] for result in results]
+    return {
+        "total": len(results),
+        "registered": statuses.count("registrada"),
+        "duplicates": statuses.count("duplicada"),
+        "rejected": statuses.count("rechazada"),
+        "results": results
+    }
+
+
+def read_available_stock(db: Session, product_ids: list[UUID]) -> dict[UUID, tuple[UUID, float]]:
+    """product_id -> (fila de inventario, disponible) sin mantener objetos del ORM"""
+    from app.crud.inventario_crud import inventory as inventory_crud
+
+    rows = inventory_crud.get_primary_rows(db, product_ids=product_ids)
+    return {pid: (row.id, row.quantity - row.reserved_quantity) for pid, row in rows.items()}
+
+
+def offline_sale_rejected(sale: OfflineSaleCreate, error: str) -> dict:
+    """Resultado de una venta offline que no se registró"""
+    return {"client_reference": sale.client_reference, "status": "rechazada", "error": error}
+
+
+def register_offline_chunk(
+    db: Session,
+    chunk: list,
+    results: list,
+    *,
+    cashier_id: UUID,
+    session_ref: tuple[UUID, UUID],
+    product_labels: dict[UUID, tuple[str, str]],
+    stock: dict[UUID, tuple[UUID, float]],
+    attempts: int = 3
+) -> dict[UUID, tuple[UUID, float]]:
+    """
+    Validar y registrar un bloque de ventas offline en una transacción
+    
+    Retorna el stock disponible que queda para el siguiente bloque.
+    """
+    from app.crud.inventario_crud import inventory as inventory_crud, product_stock
+    from app.crud.numbering_crud import document_counter
+    from app.crud.sale_crud import apply_sale_aggregates
+
+    session_id, cash_register_id = session_ref
+    product_ids = list(product_labels)
+
+    for _ in range(attempts):
+        # Stock disponible en memoria: cada venta aceptada descuenta para las siguientes
+        available = {pid: quantity for pid, (_, quantity) in stock.items()}
+        accepted = []
+        chunk_requested: dict[UUID, float] = {}
+        for index, sale, key in chunk:
+            requested: dict[UUID, float] = {}
+            for item in sale.items:
+                requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+
+            error = None
+            for pid, quantity in requested.items():
+                if pid not in product_labels:
+                    error = f"Producto no encontrado: {pid}"
+                elif pid not in available or available[pid] < quantity:
+                    error = (
+                        f"Stock insuficiente para {product_labels[pid][0]}. "
+                        f"Solicitado: {quantity}, Disponible: {available.get(pid, 0)}"
+                    )
+                if error:
+                    break
+            if error:
+                results[index] = offline_sale_rejected(sale, error)
+                continue
+
+            for pid, quantity in requested.items():
+                available[pid] -= quantity
+                chunk_requested[pid] = chunk_requested.get(pid, 0) + quantity
+            accepted.append((index, sale, key))
+
+        if not accepted:
+            return stock
+
+        decrements = {
+            stock[pid][0]: quantity
+            for pid, quantity in chunk_requested.items()
+        }
+        if inventory_crud.decrement_stock_atomic(db, decrements=decrements, user_id=cashier_id):
+            break
+
+        # El stock cambió mientras validábamos: releer y validar el bloque otra vez
+        db.rollback()
+        stock = read_available_stock(db, product_ids)
+    else:
+        for index, sale, _ in chunk:
+            results[index] = offline_sale_rejected(
+                sale, "El stock cambió durante la sincronización, intente nuevamente"
+            )
+        return stock
+
+    product_stock.apply_deltas(db, deltas={pid: -quantity for pid, quantity in chunk_requested.items()})
+
+    # Números recién con el stock descontado: los intentos fallidos no los consumen
+    sale_numbers = [
+        document_counter.next_number(db, kind="sale", when=sale.sold_at)
+        for _, sale, _ in accepted
+    ]
+
+    stock_after = dict(db.exec(
+        select(Inventory.id, Inventory.quantity).where(Inventory.id.in_(list(decrements)))
+    ).all())
+    running_stock = {
+        pid: stock_after[stock[pid][0]] + quantity
+        for pid, quantity in chunk_requested.items()
+    }
+
+    now = datetime.utcnow()
+    records = []
+    new_sales = []
+    chunk_results = []
+    for (index, sale, key), sale_number in zip(accepted, sale_numbers):
+        new_sale, details, movements, cash_transaction = build_sale_records(
+            sale,
+            sale_number=sale_number,
+            cashier_id=cashier_id,
+            cash_register_id=cash_register_id,
+            session_id=session_id,
+            running_stock=running_stock,
+            product_labels=product_labels,
+            sold_at=sale.sold_at or now
+        )
+        records.append(new_sale)
+        new_sales.append(new_sale)
+        records.extend(details)
+        records.extend(movements)
+        records.append(cash_transaction)
+
+        result = {
+            "client_reference": sale.client_reference,
+            "status": "registrada",
+            "sale_id": str(new_sale.id),
+            "sale_number": sale_number,
+            "total_amount": new_sale.total_amount
+        }
+        chunk_results.append((index, result))
+        if key:
+            records.append(IdempotencyKey(
+                user_id=cashier_id,
+                key=key,
+                endpoint="POST /sales/batch",
+                request_hash=request_fingerprint(sale),
+                status="completado",
+                response_code=200,
+                response_body=json.dumps(result),
+                expires_at=now + OFFLINE_REFERENCE_TTL
+            ))
+
+    # El unit of work agrupa los INSERT de cada tabla en un executemany
+    db.add_all(records)
+    try:
+        apply_sale_aggregates(db, sales=new_sales)
+        db.commit()
+    except IntegrityError:
+        # Otra sincronización registró alguna de estas referencias al mismo tiempo
+        db.rollback()
+        for index, sale, _ in accepted:
+            results[index] = offline_sale_rejected(
+                sale, "Conflicto al sincronizar la venta, intente nuevamente"
+            )
+        return read_available_stock(db, product_ids)
+
+    for index, result in chunk_results:
+        results[index] = result
+
+    # Lo que quedó disponible tras el bloque, sin volver a consultar
+    return {pid: (inventory_id, available[pid]) for pid, (inventory_id, _) in stock.items()}
 
 
 @router.get("/sales", tags=["Ventas"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def list_sales(
     db: DBSession,
+    response: Response,
     current_user: User = Depends(get_current_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     customer_id: Optional[UUID] = None,
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    cursor: Optional[str] = None
 ):
     """
-    Listar ventas.
+    Listar ventas (más recientes primero).
     Admin ve todas las ventas, Cajero solo ve las de su caja activa.
     
     Query params:
@@ -287,10 +774,12 @@ async def list_sales(
     - limit: Límite (default: 100)
     - customer_id: Filtrar por cliente (optional)
     - status: Filtrar por estado (optional)
+    - cursor: Página siguiente según el header X-Next-Cursor (optional, reemplaza a skip)
     """
     from app.crud.users_crud import profile
+    from app.crud.sale_crud import with_sale_relations
     
-    query = select(Sale)
+    query = with_sale_relations(select(Sale))
     
     # Verificar si es admin o cajero
     user_profile = profile.get(db, id=current_user.profile_id)
@@ -318,22 +807,65 @@ async def list_sales(
     if status:
         query = query.where(Sale.status == status)
     
-    sales = db.exec(query.offset(skip).limit(limit)).all()
+    try:
+        query = apply_keyset(
+            query, sort_column=Sale.sale_date, id_column=Sale.id,
+            cursor=cursor, limit=limit, descending=True
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not cursor and skip:
+        query = query.offset(skip)
+    sales, next_cursor = keyset_page(db.exec(query).all(), limit=limit, sort_attr="sale_date")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
-    # Prefetch product names for all sale details to avoid missing product_name
-    product_ids = set()
-    for s in sales:
-        if s.details:
-            for d in s.details:
-                if d.product_id:
-                    product_ids.add(d.product_id)
+    return sales_response(db, sales)
 
-    product_map = {}
-    if product_ids:
-        products = db.exec(select(Product).where(Product.id.in_(product_ids))).all()
-        product_map = {p.id: p.name for p in products}
+
+@router.get("/sales/por-fecha", tags=["Ventas"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
+async def get_sales_by_date(
+    db: DBSession,
+    fechaInicio: str = Query(...),
+    fechaFin: str = Query(...),
+    format: Optional[str] = Query(None, pattern=STREAM_FORMAT_PATTERN, description="ndjson o csv: descarga en streaming")
+):
+    """
+    Obtener ventas por rango de fecha
+    
+    Query params:
+    - fechaInicio: Fecha inicio ISO8601 (required)
+    - fechaFin: Fecha fin ISO8601 (required)
+    - format: ndjson (una venta por línea) o csv (una fila por ítem) (optional)
+    
+    Con `format` las ventas se leen y se envían por bloques: la memoria no
+    depende del rango de fechas.
+    """
+    try:
+        start = datetime.fromisoformat(fechaInicio)
+        end = datetime.fromisoformat(fechaFin)
+    except:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido")
     
-    return [format_sale_response(s, product_map) for s in sales]
+    from app.crud.sale_crud import sale as sale_crud, with_sale_relations
+    
+    if format:
+        statement = with_sale_relations(
+            select(Sale).where(Sale.sale_date >= start, Sale.sale_date <= end)
+        ).order_by(Sale.sale_date, Sale.id)
+        return stream_rows(
+            statement,
+            fmt=format,
+            filename="ventas",
+            to_json=format_sale_response,
+            csv_header=SALE_CSV_HEADER,
+            to_csv=sale_csv_rows,
+            chunk_context=missing_product_names
+        )
+    
+    sales = sale_crud.get_by_date_range(db, start_date=start, end_date=end)
+    
+    return sales_response(db, sales)
 
 
 @router.get("/sales/{sale_id}", tags=["Ventas"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
@@ -344,13 +876,15 @@ async def get_sale(
     """
     Obtener una venta específica por ID
     """
-    query = select(Sale).where(Sale.id == sale_id)
+    from app.crud.sale_crud import with_sale_relations
+    
+    query = with_sale_relations(select(Sale).where(Sale.id == sale_id))
     sale = db.exec(query).first()
     
     if not sale:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
     
-    return format_sale_response(sale)
+    return sales_response(db, [sale])[0]
 
 
 @router.delete("/sales/{sale_id}", tags=["Ventas"])
@@ -373,6 +907,10 @@ async def delete_sale(
     # (NO restauramos el stock, solo eliminamos el registro del movimiento)
     status_value = sale.status.value if hasattr(sale.status, 'value') else str(sale.status)
     if status_value == 'completada':
+        # La venta deja de contar en los reportes y en las estadísticas del cliente
+        from app.crud.sale_crud import apply_sale_aggregates
+        apply_sale_aggregates(db, sales=[sale], sign=-1)
+        
         movement_query = select(InventoryMovement).where(
             InventoryMovement.reference_document.like(f"%Venta {sale.sale_number}%")
         )
@@ -416,55 +954,49 @@ async def cancel_sale(
     if sale.status == SaleStatus.cancelada:
         raise HTTPException(status_code=400, detail="La venta ya está cancelada")
     
+    if sale.status == SaleStatus.completada:
+        from app.crud.sale_crud import apply_sale_aggregates
+        apply_sale_aggregates(db, sales=[sale], sign=-1)
     sale.status = SaleStatus.cancelada
     db.add(sale)
     db.commit()
     db.refresh(sale)
     
-    return format_sale_response(sale)
-
-
-@router.get("/sales/por-fecha", tags=["Ventas"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
-async def get_sales_by_date(
-    db: DBSession,
-    fechaInicio: str = Query(...),
-    fechaFin: str = Query(...)
-):
-    """
-    Obtener ventas por rango de fecha
-    
-    Query params:
-    - fechaInicio: Fecha inicio ISO8601 (required)
-    - fechaFin: Fecha fin ISO8601 (required)
-    """
-    try:
-        start = datetime.fromisoformat(fechaInicio)
-        end = datetime.fromisoformat(fechaFin)
-    except:
-        raise HTTPException(status_code=400, detail="Formato de fecha inválido")
-    
-    query = select(Sale).where(
-        Sale.sale_date >= start,
-        Sale.sale_date <= end
-    )
-    
-    sales = db.exec(query).all()
-    
-    return [format_sale_response(s) for s in sales]
+    return sales_response(db, [sale])[0]
 
 
 @router.get("/sales/cliente/{customer_id}", tags=["Ventas"], dependencies=[Depends(RoleChecker(allowed_roles=["Administrador", "Cajero"]))])
 async def get_sales_by_customer(
     customer_id: UUID,
     db: DBSession,
-    skip: int = Query(0),
-    limit: int = Query(100)
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
 ):
     """
-    Obtener ventas de un cliente específico
+    Obtener ventas de un cliente específico (más recientes primero)
+    
+    Query params:
+    - skip: Paginación (default: 0)
+    - limit: Límite (default: 100)
+    - cursor: Página siguiente según el header X-Next-Cursor (optional, reemplaza a skip)
     """
-    query = select(Sale).where(Sale.customer_id == customer_id)
+    from app.crud.sale_crud import with_sale_relations
     
-    sales = db.exec(query.offset(skip).limit(limit)).all()
+    query = with_sale_relations(select(Sale).where(Sale.customer_id == customer_id))
     
-    return [format_sale_response(s) for s in sales]
+    try:
+        query = apply_keyset(
+            query, sort_column=Sale.sale_date, id_column=Sale.id,
+            cursor=cursor, limit=limit, descending=True
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not cursor and skip:
+        query = query.offset(skip)
+    sales, next_cursor = keyset_page(db.exec(query).all(), limit=limit, sort_attr="sale_date")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return sales_response(db, sales)
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from uuid import uuid4
+
+from sqlmodel import SQLModel, Session, create_engine, select, func
+
+from app.crud.inventario_crud import inventory as inventory_crud, product_stock
+from app.models.models import (
+    DocumentCounter, Inventory, InventoryMovement, Product, ProductStock
+)
+from app.routers.router_inventario import InventoryAdjustmentRequest, apply_adjustment
+
+
+class TestAjusteConVentaConcurrente(unittest.TestCase):
+    """Un ajuste y una venta que se cruzan no deben descuadrar product_stock"""
+
+    def setUp(self):
+        # Archivo y no memoria: la venta corre en otra conexión
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        SQLModel.metadata.create_all(self.engine, tables=[
+            Product.__table__, Inventory.__table__, InventoryMovement.__table__,
+            ProductStock.__table__, DocumentCounter.__table__
+        ])
+        self.user_id = uuid4()
+        self.product_id = uuid4()
+        with Session(self.engine) as db:
+            db.add(Product(id=self.product_id, sku="P-1", name="Arroz", sale_price=2, cost_price=1))
+            db.add(Inventory(product_id=self.product_id, quantity=50))
+            db.flush()
+            product_stock.ensure_rows(db)
+            db.commit()
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def sell(self, quantity: float) -> None:
+        """Lo mismo que hace register_sale con el inventario, en su propia transacción"""
+        with Session(self.engine) as other:
+            row = inventory_crud.get_primary_rows(other, product_ids=[self.product_id])[self.product_id]
+            self.assertTrue(inventory_crud.decrement_stock_atomic(
+                other, decrements={row.id: quantity}, user_id=self.user_id
+            ))
+            product_stock.apply_deltas(other, deltas={self.product_id: -quantity})
+            other.commit()
+
+    def adjust_with_sale_in_between(self, new_quantity: float, sold: float) -> None:
+        original = inventory_crud.get_primary_rows
+        pending = [sold]
+
+        def read_then_sell(db, *, product_ids):
+            rows = original(db, product_ids=product_ids)
+            # La venta se confirma entre la lectura del ajuste y su escritura
+            if pending:
+                self.sell(pending.pop())
+            return rows
+
+        request = InventoryAdjustmentRequest(
+            product_id=self.product_id, new_quantity=new_quantity, reason="Conteo"
+        )
+        with mock.patch.object(inventory_crud, "get_primary_rows", side_effect=read_then_sell):
+            with Session(self.engine) as db:
+                apply_adjustment(db, request, self.user_id)
+
+    def test_saldo_coincide_con_inventario(self):
+        self.adjust_with_sale_in_between(30, sold=2)
+        with Session(self.engine) as db:
+            inventory_total = db.exec(
+                select(func.sum(Inventory.quantity)).where(Inventory.product_id == self.product_id)
+            ).one()
+            balance = product_stock.get_map(db, product_ids=[self.product_id])[self.product_id]
+        self.assertEqual(inventory_total, 30)
+        self.assertEqual(balance, inventory_total)
+
+    def test_movimiento_parte_del_stock_despues_de_la_venta(self):
+        self.adjust_with_sale_in_between(30, sold=2)
+        with Session(self.engine) as db:
+            movement = db.exec(select(InventoryMovement)).one()
+        self.assertEqual(movement.previous_stock, 48)
+        self.assertEqual(movement.quantity, -18)
+
+    def test_ajuste_usa_la_fila_de_las_ventas(self):
+        with Session(self.engine) as db:
+            db.add(Inventory(product_id=self.product_id, quantity=5))
+            db.commit()
+            primary = inventory_crud.get_primary_rows(db, product_ids=[self.product_id])[self.product_id]
+            primary_id = primary.id
+        request = InventoryAdjustmentRequest(product_id=self.product_id, new_quantity=7, reason="Conteo")
+        with Session(self.engine) as db:
+            response = apply_adjustment(db, request, self.user_id)
+        self.assertEqual(response["id"], str(primary_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import unittest
+from unittest import mock
+from uuid import uuid4
+
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+from app.crud.inventario_crud import product_stock
+from app.crud.products_crud import product as product_crud, product_lookup_cache
+from app.models.models import Product, ProductPresentation
+from app.routers.router_productos import cached_product_lookup
+
+
+class TestIndiceDelEscaner(unittest.TestCase):
+    """El caché de SKU / código de barras nunca debe servir un producto ya modificado"""
+
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        SQLModel.metadata.create_all(self.engine)
+        self.db = Session(self.engine)
+        self.product_id = uuid4()
+        self.db.add(Product(id=self.product_id, sku="P-1", barcode="7790001", name="Arroz", sale_price=10, cost_price=8))
+        self.db.add(ProductPresentation(
+            product_id=self.product_id, presentation_name="Caja x12",
+            quantity_per_unit=12, barcode="7790012", price=110
+        ))
+        self.db.flush()
+        product_stock.ensure_rows(self.db)
+        self.db.commit()
+        product_lookup_cache.invalidate()
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+        product_lookup_cache.invalidate()
+
+    def lookup(self, kind: str = "sku", code: str = "P-1") -> dict:
+        with Session(self.engine) as db:
+            return json.loads(cached_product_lookup(db, kind=kind, code=code).body)
+
+    def update_price(self, price: float) -> None:
+        with Session(self.engine) as db:
+            product_crud.update(db, db_obj=db.get(Product, self.product_id), obj_in={"sale_price": price})
+
+    def test_acierto_no_consulta_el_producto(self):
+        with mock.patch.object(product_crud, "get_by_sku", wraps=product_crud.get_by_sku) as get_by_sku:
+            self.lookup()
+            self.lookup()
+        self.assertEqual(get_by_sku.call_count, 1)
+
+    def test_codigo_de_presentacion_resuelve_el_producto(self):
+        found = self.lookup(kind="barcode", code="7790012")
+        self.assertEqual(found["id"], str(self.product_id))
+        self.assertEqual(found["presentation"]["quantity_per_unit"], 12)
+        self.assertIsNone(self.lookup(kind="barcode", code="7790001")["presentation"])
+
+    def test_actualizar_invalida(self):
+        self.assertEqual(self.lookup()["sale_price"], 10)
+        self.update_price(12)
+        self.assertEqual(self.lookup()["sale_price"], 12)
+
+    def test_desactivar_invalida(self):
+        self.assertTrue(self.lookup(kind="barcode", code="7790001")["is_active"])
+        with Session(self.engine) as db:
+            product_crud.deactivate(db, id=self.product_id)
+        self.assertFalse(self.lookup(kind="barcode", code="7790001")["is_active"])
+
+    def test_lectura_previa_a_la_invalidacion_no_se_guarda(self):
+        original = product_crud.get_by_sku
+
+        def read_then_update(db, *, sku):
+            found = original(db, sku=sku)
+            # El precio cambia después de la lectura y antes de guardar en el caché
+            self.update_price(15)
+            return found
+
+        with mock.patch.object(product_crud, "get_by_sku", side_effect=read_then_update):
+            self.assertEqual(self.lookup()["sale_price"], 10)
+        self.assertEqual(self.lookup()["sale_price"], 15)
+
+    def bulk_update(self, **changes) -> dict:
+        with Session(self.engine) as db:
+            return product_crud.bulk_update(db, **changes)
+
+    def test_cambio_masivo_invalida(self):
+        self.assertEqual(self.lookup()["sale_price"], 10)
+        self.assertEqual(self.lookup(kind="barcode", code="7790012")["sale_price"], 10)
+        self.bulk_update(rules=[{"field": "sale_price", "percentage": 10, "all_products": True}])
+        self.assertEqual(self.lookup()["sale_price"], 11)
+        self.assertEqual(self.lookup(kind="barcode", code="7790012")["sale_price"], 11)
+        self.bulk_update(prices=[{"product_id": self.product_id, "sale_price": 20}])
+        self.assertEqual(self.lookup()["sale_price"], 20)
+
+    def test_cambio_masivo_con_una_sola_version(self):
+        summary = self.bulk_update(
+            rules=[{"field": "cost_price", "percentage": 5, "all_products": True}],
+            prices=[{"product_id": self.product_id, "sale_price": 20}],
+            attributes=[{"values": {"stock_min": 3}, "all_products": True}]
+        )
+        found = self.lookup()
+        self.assertEqual((found["sale_price"], found["cost_price"], found["stock_min"]), (20, 8.4, 3))
+        with Session(self.engine) as db:
+            self.assertEqual(db.get(Product, self.product_id).catalog_version, summary["version"])
+        # Tres cambios, una versión: el siguiente cambio masivo usa la inmediata
+        following = self.bulk_update(prices=[{"product_id": self.product_id, "sale_price": 21}])
+        self.assertEqual(following["version"], summary["version"] + 1)
+
+    def test_cambio_masivo_durante_una_lectura(self):
+        original = product_crud.get_by_any_barcode
+
+        def read_then_bulk_update(db, *, barcode):
+            found = original(db, barcode=barcode)
+            self.bulk_update(prices=[{"product_id": self.product_id, "sale_price": 30}])
+            return found
+
+        with mock.patch.object(product_crud, "get_by_any_barcode", side_effect=read_then_bulk_update):
+            self.assertEqual(self.lookup(kind="barcode", code="7790012")["sale_price"], 10)
+        self.assertEqual(self.lookup(kind="barcode", code="7790012")["sale_price"], 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
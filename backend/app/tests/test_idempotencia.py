@@ -0,0 +1,155 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+from app.deps import run_idempotent, stage_idempotent_response
+from app.crud.idempotency_crud import idempotency_key
+from app.models.models import IdempotencyKey
+
+
+class WorkerCrash(BaseException):
+    """Corte del proceso entre el commit de la operación y el final de la solicitud"""
+
+
+class TestRunIdempotent(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        SQLModel.metadata.create_all(self.engine, tables=[IdempotencyKey.__table__])
+        self.db = Session(self.engine)
+        self.user_id = uuid4()
+        self.calls = 0
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def handler(self, db, record):
+        self.calls += 1
+        response = {"sale_number": f"V-{self.calls:05d}"}
+        stage_idempotent_response(db, record, response)
+        db.commit()
+        return response
+
+    def run_key(self, key="llave-1", payload=None, handler=None):
+        return run_idempotent(
+            self.db,
+            key=key,
+            user_id=self.user_id,
+            endpoint="POST /sales",
+            payload=payload or {"total": 10},
+            handler=handler or self.handler
+        )
+
+    def test_sin_llave_ejecuta_siempre(self):
+        run_idempotent(
+            self.db, key=None, user_id=self.user_id, endpoint="POST /sales",
+            payload={}, handler=self.handler
+        )
+        run_idempotent(
+            self.db, key=None, user_id=self.user_id, endpoint="POST /sales",
+            payload={}, handler=self.handler
+        )
+        self.assertEqual(self.calls, 2)
+
+    def test_reintento_devuelve_respuesta_guardada(self):
+        first = self.run_key()
+        replay = self.run_key()
+        self.assertEqual(self.calls, 1)
+        self.assertIsInstance(replay, JSONResponse)
+        self.assertEqual(replay.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(replay.body), first)
+
+    def test_llave_con_otra_solicitud_es_422(self):
+        self.run_key(payload={"total": 10})
+        with self.assertRaises(HTTPException) as ctx:
+            self.run_key(payload={"total": 99})
+        self.assertEqual(ctx.exception.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def claim_from_other_worker(self):
+        with Session(self.engine) as other:
+            record, created = idempotency_key.claim(
+                other, user_id=self.user_id, key="llave-1", endpoint="POST /sales",
+                request_hash="x", ttl_seconds=3600, lease_seconds=60
+            )
+            other.commit()
+            self.assertTrue(created)
+
+    def test_llave_en_proceso_es_409(self):
+        self.claim_from_other_worker()
+        with self.assertRaises(HTTPException) as ctx:
+            self.run_key()
+        self.assertEqual(ctx.exception.status_code, 409)
+        self.assertEqual(self.calls, 0)
+
+    def test_llave_en_proceso_abandonada_se_reutiliza(self):
+        with Session(self.engine) as other:
+            record, _ = idempotency_key.claim(
+                other, user_id=self.user_id, key="llave-1", endpoint="POST /sales",
+                request_hash="x", ttl_seconds=3600, lease_seconds=60
+            )
+            record.created_at = datetime.utcnow() - timedelta(minutes=5)
+            other.add(record)
+            other.commit()
+        self.run_key()
+        self.assertEqual(self.calls, 1)
+
+    def test_llave_abandonada_la_toma_un_solo_reintento(self):
+        self.claim_from_other_worker()
+        with Session(self.engine) as other:
+            record = idempotency_key.get_by_key(other, user_id=self.user_id, key="llave-1")
+            record.created_at = datetime.utcnow() - timedelta(minutes=5)
+            other.add(record)
+            other.commit()
+
+        first, second = Session(self.engine), Session(self.engine)
+        try:
+            # Los dos reintentos ya leyeron la llave abandonada
+            for session in (first, second):
+                idempotency_key.get_by_key(session, user_id=self.user_id, key="llave-1")
+            results = []
+            for session in (first, second):
+                _, created = idempotency_key.claim(
+                    session, user_id=self.user_id, key="llave-1", endpoint="POST /sales",
+                    request_hash="x", ttl_seconds=3600, lease_seconds=60
+                )
+                session.commit()
+                results.append(created)
+        finally:
+            first.close()
+            second.close()
+        self.assertEqual(results, [True, False])
+
+    def test_operacion_fallida_libera_la_llave(self):
+        def failing(db, record):
+            raise HTTPException(status_code=400, detail="Stock insuficiente")
+
+        with self.assertRaises(HTTPException):
+            self.run_key(handler=failing)
+        self.run_key()
+        self.assertEqual(self.calls, 1)
+
+    def test_respuesta_confirmada_con_la_operacion(self):
+        def crash_after_commit(db, record):
+            self.handler(db, record)
+            raise WorkerCrash()
+
+        with self.assertRaises(WorkerCrash):
+            self.run_key(handler=crash_after_commit)
+        self.db.rollback()
+        replay = self.run_key()
+        self.assertEqual(self.calls, 1)
+        self.assertIsInstance(replay, JSONResponse)
+        self.assertEqual(json.loads(replay.body), {"sale_number": "V-00001"})
+
+
+if __name__ == "__main__":
+    unittest.main()
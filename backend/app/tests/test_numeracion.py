@@ -0,0 +1,128 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from app.crud.numbering_crud import CRUDDocumentCounter, NUMBERING_BLOCK_SIZE
+from app.models.models import DocumentCounter, Sale
+
+
+DAY = datetime(2026, 3, 10)
+
+
+class TestBloquesDeNumeracion(unittest.TestCase):
+    """Dos workers (dos instancias del contador) numerando ventas sobre la misma base"""
+
+    def setUp(self):
+        # Archivo y no memoria: cada worker usa su propia conexión
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        SQLModel.metadata.create_all(self.engine, tables=[Sale.__table__, DocumentCounter.__table__])
+        self.workers = [CRUDDocumentCounter(DocumentCounter), CRUDDocumentCounter(DocumentCounter)]
+
+    def add_sale(self, db: Session, sale_number: str) -> None:
+        db.add(Sale(
+            sale_number=sale_number, cashier_id=uuid4(), cash_register_id=uuid4(),
+            subtotal=1, total_amount=1
+        ))
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def take(self, worker: CRUDDocumentCounter, *, commit: bool = True) -> int:
+        with Session(self.engine) as db:
+            number = worker.next_number(db, kind="sale", when=DAY)
+            if commit:
+                db.commit()
+            else:
+                db.rollback()
+        return int(number.rsplit("-", 1)[1])
+
+    def counter_value(self) -> int:
+        with Session(self.engine) as db:
+            return db.exec(select(DocumentCounter.last_value)).one()
+
+    def test_workers_no_repiten_numeros(self):
+        first, second = self.workers
+        numbers = []
+        for _ in range(NUMBERING_BLOCK_SIZE + 5):
+            numbers.append(self.take(first))
+            numbers.append(self.take(second))
+        self.assertEqual(len(set(numbers)), len(numbers))
+        # Cada worker reservó dos bloques y nada más
+        self.assertEqual(self.counter_value(), 4 * NUMBERING_BLOCK_SIZE)
+
+    def test_rollback_devuelve_el_numero(self):
+        worker = self.workers[0]
+        self.assertEqual(self.take(worker), 1)
+        self.assertEqual(self.take(worker, commit=False), 2)
+        # El reintento de la venta recibe el mismo número: sin huecos
+        self.assertEqual(self.take(worker), 2)
+        self.assertEqual(self.take(worker), 3)
+
+    def test_rollback_de_la_reserva_deshace_el_bloque(self):
+        worker = self.workers[0]
+        self.assertEqual(self.take(worker, commit=False), 1)
+        self.assertEqual(self.take(worker), 1)
+        self.assertEqual(self.counter_value(), NUMBERING_BLOCK_SIZE)
+
+    def test_respeta_numeros_emitidos_antes_del_contador(self):
+        with Session(self.engine) as db:
+            self.add_sale(db, f"V-{DAY:%Y%m%d}-00007")
+            db.commit()
+        self.assertEqual(self.take(self.workers[0]), 8)
+        self.assertEqual(self.take(self.workers[1]), 8 + NUMBERING_BLOCK_SIZE)
+
+    def test_reserva_sin_segunda_conexion(self):
+        checked_out = [0]
+        peak = [0]
+
+        def on_checkout(*_):
+            checked_out[0] += 1
+            peak[0] = max(peak[0], checked_out[0])
+
+        def on_checkin(*_):
+            checked_out[0] -= 1
+
+        event.listen(self.engine, "checkout", on_checkout)
+        event.listen(self.engine, "checkin", on_checkin)
+        # Transacción de la venta abierta con escrituras antes de pedir el número
+        with Session(self.engine) as db:
+            self.add_sale(db, "V-BORRADOR")
+            db.flush()
+            self.workers[0].next_number(db, kind="sale", when=DAY)
+            db.commit()
+        self.assertEqual(peak[0], 1)
+
+    def test_reserva_concurrente_espera_el_commit(self):
+        first, second = self.workers
+        numbers = []
+
+        def take_from_second():
+            with Session(self.engine) as other:
+                numbers.append(second.next_number(other, kind="sale", when=DAY))
+                other.commit()
+
+        with Session(self.engine) as db:
+            numbers.append(first.next_number(db, kind="sale", when=DAY))
+            # El otro worker reserva mientras esta transacción retiene el contador
+            thread = threading.Thread(target=take_from_second)
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            db.commit()
+        thread.join()
+        self.assertEqual(
+            [int(number.rsplit("-", 1)[1]) for number in numbers], [1, NUMBERING_BLOCK_SIZE + 1]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
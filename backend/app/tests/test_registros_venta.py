@@ -0,0 +1,59 @@
+import unittest
+from datetime import datetime
+from uuid import uuid4
+
+from app.models.enums import MovementType
+from app.models.models import InventoryMovement
+from app.routers.router_venta import OfflineSaleCreate, SaleItemCreate, build_sale_records
+
+
+SOLD_AT = datetime(2026, 3, 10, 9, 30)
+
+
+class TestMovimientosDeVenta(unittest.TestCase):
+    """Los movimientos de salida que arma build_sale_records"""
+
+    def setUp(self):
+        self.product_id = uuid4()
+        self.cashier_id = uuid4()
+        sale = OfflineSaleCreate(sold_at=SOLD_AT, items=[
+            SaleItemCreate(product_id=self.product_id, quantity=2, unit_price=5),
+            SaleItemCreate(product_id=self.product_id, quantity=1, unit_price=5),
+        ])
+        self.running_stock = {self.product_id: 10}
+        _, _, self.movements, _ = build_sale_records(
+            sale,
+            sale_number="V-20260310-00001",
+            cashier_id=self.cashier_id,
+            cash_register_id=uuid4(),
+            session_id=uuid4(),
+            running_stock=self.running_stock,
+            product_labels={self.product_id: ("Arroz", "P-1")},
+            sold_at=SOLD_AT
+        )
+
+    def test_stock_encadenado_por_linea(self):
+        self.assertEqual(
+            [(m.previous_stock, m.new_stock, m.quantity) for m in self.movements],
+            [(10, 8, 2), (8, 7, 1)]
+        )
+        self.assertEqual(self.running_stock[self.product_id], 7)
+
+    def test_datos_de_la_venta(self):
+        for movement in self.movements:
+            self.assertEqual(movement.movement_type, MovementType.salida)
+            self.assertEqual(movement.reference_document, "Venta V-20260310-00001")
+            self.assertEqual(movement.user_id, self.cashier_id)
+            # La fecha del movimiento es la de la venta, también para las offline
+            self.assertEqual(movement.created_at, SOLD_AT)
+
+    def test_tabla_sin_columnas_de_costo(self):
+        # unit_cost, total_cost y movement_date nunca fueron columnas: el modelo
+        # los descartaba en silencio. Si se agregan, build_sale_records debe llenarlos.
+        columns = InventoryMovement.__table__.c
+        for name in ("unit_cost", "total_cost", "movement_date"):
+            self.assertNotIn(name, columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
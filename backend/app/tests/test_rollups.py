@@ -0,0 +1,213 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from uuid import uuid4
+
+from fastapi import HTTPException
+
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine, select, func
+
+from app.crud.inventario_crud import inventory as inventory_crud, product_stock
+from app.crud.sale_crud import sales_rollup, apply_sale_aggregates
+from app.models.enums import SaleStatus
+from app.models.models import (
+    Sale, SaleDetail, SalesDailyRollup, SalesHourlyRollup, ProductSalesRollup, CustomerStats,
+    CashRegisterSession, Inventory, PaymentMethod, Product, StockReservation, User
+)
+from app.routers import router_venta
+from app.routers.router_venta import SaleCreate, SaleItemCreate, register_sale
+
+
+DAY = datetime(2026, 3, 10)
+
+
+class TestSalesRollupTotals(unittest.TestCase):
+    """sales_rollup.totals() debe coincidir con sumar las ventas directamente"""
+
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        SQLModel.metadata.create_all(self.engine, tables=[
+            Sale.__table__, SaleDetail.__table__, SalesDailyRollup.__table__,
+            SalesHourlyRollup.__table__, ProductSalesRollup.__table__, CustomerStats.__table__
+        ])
+        self.db = Session(self.engine)
+        self.cashier_id = uuid4()
+        self.other_cashier_id = uuid4()
+        self.register_id = uuid4()
+        # Ventas en los bordes de hora y de día, y una antes de medianoche
+        moments = [
+            DAY - timedelta(days=1, hours=-9),
+            DAY - timedelta(minutes=1),
+            DAY,
+            DAY + timedelta(minutes=59, seconds=59),
+            DAY + timedelta(hours=1),
+            DAY + timedelta(hours=13, minutes=30),
+            DAY + timedelta(hours=23, minutes=59, seconds=59),
+            DAY + timedelta(days=1, hours=8, minutes=15),
+            DAY + timedelta(days=2, hours=18),
+        ]
+        self.sales = [
+            self.add_sale(moment, total=10.0 + index, cashier_id=(
+                self.other_cashier_id if index % 3 == 0 else self.cashier_id
+            ))
+            for index, moment in enumerate(moments)
+        ]
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def add_sale(self, moment: datetime, *, total: float, cashier_id) -> Sale:
+        sale = Sale(
+            sale_number=f"V-{moment:%Y%m%d%H%M%S}",
+            sale_date=moment,
+            cashier_id=cashier_id,
+            cash_register_id=self.register_id,
+            subtotal=total - 1,
+            discount_amount=0.5,
+            tax_amount=1.0,
+            total_amount=total,
+            status=SaleStatus.completada
+        )
+        self.db.add(sale)
+        self.db.flush()
+        apply_sale_aggregates(self.db, sales=[sale], categories={})
+        return sale
+
+    def direct_totals(self, start=None, end=None, cashier_id=None) -> tuple:
+        conditions = [Sale.status == SaleStatus.completada]
+        if start:
+            conditions.append(Sale.sale_date >= start)
+        if end:
+            conditions.append(Sale.sale_date <= end)
+        if cashier_id:
+            conditions.append(Sale.cashier_id == cashier_id)
+        count, total = self.db.exec(
+            select(func.count(Sale.id), func.coalesce(func.sum(Sale.total_amount), 0)).where(*conditions)
+        ).one()
+        return count, total
+
+    def assert_matches(self, start=None, end=None, cashier_id=None):
+        totals = sales_rollup.totals(self.db, start=start, end=end, cashier_id=cashier_id)
+        expected_count, expected_total = self.direct_totals(start, end, cashier_id)
+        self.assertEqual(totals["sales_count"], expected_count, (start, end))
+        self.assertAlmostEqual(totals["total_amount"], expected_total, places=6, msg=(start, end))
+        self.assertEqual(sum(day["sales_count"] for day in totals["by_day"].values()), expected_count)
+
+    def test_fin_inclusivo(self):
+        # La venta exacta en el fin se cuenta
+        self.assert_matches(DAY, DAY + timedelta(hours=1))
+        self.assert_matches(DAY, DAY + timedelta(hours=23, minutes=59, seconds=59))
+        self.assert_matches(DAY - timedelta(minutes=1), DAY - timedelta(minutes=1))
+
+    def test_rango_que_cruza_medianoche(self):
+        self.assert_matches(DAY - timedelta(hours=2), DAY + timedelta(hours=2))
+        self.assert_matches(DAY + timedelta(hours=20), DAY + timedelta(days=1, hours=9))
+        self.assert_matches(DAY - timedelta(minutes=30), DAY + timedelta(minutes=30))
+
+    def test_dias_completos_y_horas_parciales(self):
+        self.assert_matches(DAY - timedelta(days=1), DAY + timedelta(days=2))
+        self.assert_matches(DAY + timedelta(minutes=30), DAY + timedelta(days=1, hours=8, minutes=20))
+        self.assert_matches(DAY + timedelta(hours=1, minutes=1), DAY + timedelta(hours=13, minutes=29))
+
+    def test_extremos_abiertos(self):
+        self.assert_matches()
+        self.assert_matches(start=DAY + timedelta(hours=13))
+        self.assert_matches(end=DAY + timedelta(minutes=59, seconds=59))
+
+    def test_por_cajero(self):
+        self.assert_matches(DAY - timedelta(days=1), DAY + timedelta(days=3), cashier_id=self.cashier_id)
+        self.assert_matches(end=DAY + timedelta(hours=2), cashier_id=self.other_cashier_id)
+
+    def test_totales_tras_cancelar(self):
+        for sale in (self.sales[2], self.sales[5]):
+            # Igual que POST /sales/{id}/cancelar
+            apply_sale_aggregates(self.db, sales=[sale], sign=-1, categories={})
+            sale.status = SaleStatus.cancelada
+            self.db.add(sale)
+        self.db.commit()
+        self.assert_matches()
+        self.assert_matches(DAY, DAY + timedelta(days=1))
+        self.assert_matches(DAY + timedelta(minutes=10), DAY + timedelta(hours=14))
+
+
+
+class TestRollupsConVentasReintentadas(unittest.TestCase):
+    """Una venta que falla y se reintenta cuenta una sola vez en los rollups"""
+
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        SQLModel.metadata.create_all(self.engine)
+        self.db = Session(self.engine)
+        self.cashier_id = uuid4()
+        self.product_id = uuid4()
+        self.db.add(User(
+            id=self.cashier_id, username="cajero", email="cajero@example.com",
+            hashed_password="x", profile_id=uuid4()
+        ))
+        self.db.add(CashRegisterSession(cash_register_id=uuid4(), user_id=self.cashier_id))
+        self.db.add(PaymentMethod(name="Efectivo"))
+        self.db.add(Product(id=self.product_id, sku="P-1", name="Arroz", sale_price=5, cost_price=3))
+        self.inventory = Inventory(product_id=self.product_id, quantity=10)
+        self.db.add(self.inventory)
+        self.db.flush()
+        product_stock.ensure_rows(self.db)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def sell(self, quantity: float = 2) -> dict:
+        sale = SaleCreate(items=[SaleItemCreate(product_id=self.product_id, quantity=quantity, unit_price=5)])
+        with Session(self.engine) as db:
+            return register_sale(db, sale, self.cashier_id)
+
+    def assert_counted(self, count: int, total: float, quantity: float):
+        totals = sales_rollup.totals(self.db)
+        self.assertEqual(totals["sales_count"], count)
+        self.assertAlmostEqual(totals["total_amount"], total)
+        self.assertEqual(self.db.exec(select(func.count(Sale.id))).one(), count)
+        sold = self.db.exec(select(func.coalesce(func.sum(ProductSalesRollup.quantity), 0))).one()
+        self.assertAlmostEqual(sold, quantity)
+
+    def test_falla_despues_de_acumular(self):
+        # La venta ya sumó a los rollups cuando falla, antes del commit
+        with mock.patch.object(router_venta, "stage_idempotent_response", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.sell()
+        self.assert_counted(0, 0, 0)
+        self.sell()
+        self.assert_counted(1, 10, 2)
+
+    def test_rechazo_por_stock_y_reintento(self):
+        with self.assertRaises(HTTPException):
+            self.sell(quantity=11)
+        self.assert_counted(0, 0, 0)
+        self.sell(quantity=10)
+        self.assert_counted(1, 50, 10)
+
+    def test_reintento_tras_liberar_apartados_vencidos(self):
+        # Un carrito abandonado retiene 9 unidades: el primer descuento falla
+        self.db.add(StockReservation(
+            cart_id="abandonado", product_id=self.product_id, inventory_id=self.inventory.id,
+            quantity=9, user_id=uuid4(), expires_at=datetime.utcnow() - timedelta(minutes=1)
+        ))
+        self.inventory.reserved_quantity = 9
+        self.db.add(self.inventory)
+        self.db.commit()
+        decrement = inventory_crud.decrement_stock_atomic
+        with mock.patch.object(inventory_crud, "decrement_stock_atomic", wraps=decrement) as attempts:
+            self.sell(quantity=5)
+        self.assertEqual(attempts.call_count, 2)
+        self.assert_counted(1, 25, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Script para recalcular los rollups de ventas (diario, horario y por producto)
+
+Crea las tablas si no existen y reconstruye el rango indicado desde sales y
+sale_details. Sin fechas recalcula todo el historial. Conviene correrlo sin
+ventas en curso o sobre días ya cerrados.
+
+Uso:
+    python backfill_sales_rollups.py [--desde 2024-01-01] [--hasta 2024-12-31]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+from sqlmodel import create_engine, Session, SQLModel
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.models.models import SalesDailyRollup, SalesHourlyRollup, ProductSalesRollup
+from app.crud.sale_crud import sales_rollup
+
+def main():
+    """Ejecutar backfill"""
+    parser = argparse.ArgumentParser(description="Recalcular rollups de ventas")
+    parser.add_argument("--desde", type=date.fromisoformat, help="Primer día (YYYY-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="Último día (YYYY-MM-DD)")
+    args = parser.parse_args()
+    
+    engine = create_engine(DATABASE_URL)
+    
+    # Crear las tablas de rollups si no existen
+    SQLModel.metadata.create_all(engine, tables=[
+        SalesDailyRollup.__table__, SalesHourlyRollup.__table__, ProductSalesRollup.__table__
+    ])
+    print("✅ Tablas 'sales_rollup_daily', 'sales_rollup_hourly' y 'product_sales_rollup' listas")
+    
+    started = time.perf_counter()
+    with Session(engine) as session:
+        try:
+            rango = f"{args.desde or 'inicio'} a {args.hasta or 'hoy'}"
+            print(f"📝 Recalculando rollups de ventas ({rango})...")
+            counts = sales_rollup.rebuild(session, start_date=args.desde, end_date=args.hasta)
+            session.commit()
+        except Exception as e:
+            print(f"❌ Error recalculando rollups: {e}")
+            session.rollback()
+            sys.exit(1)
+    
+    elapsed = time.perf_counter() - started
+    print(f"✅ Rollups listos en {elapsed:.1f}s: {counts['daily']} diarios, "
+          f"{counts['hourly']} por hora, {counts['products']} por producto")
+
+if __name__ == "__main__":
+    main()
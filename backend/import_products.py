@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Script para importar productos desde un archivo CSV o XLSX (crea o actualiza por SKU)
+
+Uso:
+    python import_products.py lista_precios.csv [--batch-size 500]
+"""
+import argparse
+import os
+import sys
+import time
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.crud.import_crud import product_import, read_product_rows, IMPORT_BATCH_SIZE
+
+def main():
+    """Ejecutar importación"""
+    parser = argparse.ArgumentParser(description="Importar productos desde CSV o XLSX")
+    parser.add_argument("archivo", help="Ruta del archivo .csv o .xlsx")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Filas por lote")
+    args = parser.parse_args()
+    
+    engine = create_engine(DATABASE_URL)
+    started = time.perf_counter()
+    
+    with open(args.archivo, "rb") as stream, Session(engine) as session:
+        try:
+            rows = read_product_rows(stream, args.archivo)
+            print(f"📝 Importando productos desde {args.archivo}...")
+            summary = product_import.import_rows(session, rows=rows, batch_size=args.batch_size)
+        except Exception as e:
+            print(f"❌ Error importando productos: {e}")
+            session.rollback()
+            sys.exit(1)
+    
+    elapsed = time.perf_counter() - started
+    print(f"✅ {summary['total']} filas en {elapsed:.1f}s: "
+          f"{summary['created']} creados, {summary['updated']} actualizados, {summary['error_count']} con error")
+    for error in summary["errors"]:
+        print(f"   fila {error['row']} ({error['sku'] or 'sin SKU'}): {error['error']}")
+    if summary["error_count"] > len(summary["errors"]):
+        print(f"   ... y {summary['error_count'] - len(summary['errors'])} errores más")
+
+if __name__ == "__main__":
+    main()
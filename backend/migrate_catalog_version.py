@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (versión del catálogo para /products/changes)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.crud.numbering_crud import document_counter
+
+# Los saldos llevan su propia versión (ver migrate_stock_version.py)
+TABLES = ["products"]
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            for table in TABLES:
+                # Verificar si la columna ya existe
+                result = session.exec(
+                    text(f"SELECT column_name FROM information_schema.columns WHERE table_name='{table}' AND column_name='catalog_version'")
+                ).first()
+                
+                if result:
+                    print(f"✅ La columna 'catalog_version' ya existe en la tabla {table}")
+                    continue
+                
+                print(f"📝 Agregando columna 'catalog_version' a la tabla {table}...")
+                session.exec(text(f"ALTER TABLE {table} ADD COLUMN catalog_version INTEGER NOT NULL DEFAULT 0"))
+                session.exec(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_catalog_version ON {table} (catalog_version)"))
+                session.commit()
+                print(f"✅ Columna 'catalog_version' agregada a {table}")
+            
+            # Lo existente entra en una primera versión: since=0 devuelve todo el catálogo
+            version = document_counter.next_catalog_version(session)
+            for table in TABLES:
+                session.exec(
+                    text(f"UPDATE {table} SET catalog_version = :version WHERE catalog_version = 0"),
+                    params={"version": version}
+                )
+            session.commit()
+            print(f"✅ Catálogo actual registrado con la versión {version}")
+            
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
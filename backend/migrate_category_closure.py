@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (clausura del árbol de categorías)
+"""
+import os
+import sys
+from sqlmodel import create_engine, Session, SQLModel
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.models.models import CategoryClosure
+from app.crud.products_crud import category
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    # Crear la tabla de clausura si no existe
+    SQLModel.metadata.create_all(engine, tables=[CategoryClosure.__table__])
+    print("✅ Tabla 'category_closure' lista")
+    
+    with Session(engine) as session:
+        try:
+            print("📝 Calculando jerarquía de categorías...")
+            total = category.rebuild_closure(session)
+            session.commit()
+            print(f"✅ {total} relaciones ancestro-descendiente registradas")
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
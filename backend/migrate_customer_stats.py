@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (estadísticas de compra por cliente)
+"""
+import os
+import sys
+from sqlmodel import create_engine, Session, SQLModel
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.models.models import CustomerStats
+from app.crud.caja_crud import customer_stats
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    # Crear la tabla de estadísticas si no existe
+    SQLModel.metadata.create_all(engine, tables=[CustomerStats.__table__])
+    print("✅ Tabla 'customer_stats' lista")
+    
+    with Session(engine) as session:
+        try:
+            print("📝 Calculando compras por cliente...")
+            total = customer_stats.rebuild(session)
+            session.commit()
+            print(f"✅ Estadísticas de {total} clientes registradas")
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (índices de los dashboards por rol)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+
+# Columnas que filtran los dashboards de cajero, almacén y contador
+INDEXES = [
+    ("ix_cash_register_sessions_user_id", "cash_register_sessions", "user_id"),
+    ("ix_cash_register_sessions_closing_date", "cash_register_sessions", "closing_date"),
+    ("ix_cash_transactions_session_id", "cash_transactions", "session_id"),
+    ("ix_purchase_orders_status", "purchase_orders", "status"),
+    ("ix_product_reception_details_expiration_date", "product_reception_details", "expiration_date"),
+]
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            for index_name, table, column in INDEXES:
+                print(f"📝 Creando índice '{index_name}' en {table}({column})...")
+                session.exec(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({column})"))
+            session.commit()
+            print("✅ Índices de los dashboards listos")
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
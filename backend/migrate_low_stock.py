@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (indicador de stock bajo en product_stock)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.crud.inventario_crud import product_stock
+
+COLUMNS = [
+    ("stock_min", "DOUBLE PRECISION NOT NULL DEFAULT 0"),
+    ("is_low", "BOOLEAN NOT NULL DEFAULT FALSE"),
+]
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            for column, definition in COLUMNS:
+                # Verificar si la columna ya existe
+                result = session.exec(
+                    text(f"SELECT column_name FROM information_schema.columns WHERE table_name='product_stock' AND column_name='{column}'")
+                ).first()
+                if result:
+                    print(f"✅ La columna '{column}' ya existe en la tabla product_stock")
+                    continue
+                print(f"📝 Agregando columna '{column}' a la tabla product_stock...")
+                session.exec(text(f"ALTER TABLE product_stock ADD COLUMN {column} {definition}"))
+                session.commit()
+                print(f"✅ Columna '{column}' agregada exitosamente")
+            
+            print("📝 Creando índices de stock bajo...")
+            session.exec(text("CREATE INDEX IF NOT EXISTS ix_product_stock_quantity ON product_stock (quantity)"))
+            # Índice parcial: solo las filas en alerta, pocas aunque el catálogo crezca
+            session.exec(text("CREATE INDEX IF NOT EXISTS ix_product_stock_is_low ON product_stock (product_id) WHERE is_low"))
+            session.commit()
+            print("✅ Índices creados")
+            
+            print("📝 Creando saldos faltantes y copiando stock mínimo de los productos...")
+            product_stock.ensure_rows(session)
+            product_stock.sync_thresholds(session)
+            session.commit()
+            print("✅ Indicador de stock bajo calculado")
+            
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
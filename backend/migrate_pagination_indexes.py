@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (índices de paginación por cursor)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+
+# Columnas por las que ordenan los listados paginados con cursor
+INDEXES = [
+    ("ix_products_name", "products", "name"),
+    ("ix_customers_created_at", "customers", "created_at"),
+    ("ix_sales_sale_date", "sales", "sale_date"),
+    ("ix_inventory_movements_created_at", "inventory_movements", "created_at"),
+]
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            for index_name, table, column in INDEXES:
+                print(f"📝 Creando índice '{index_name}' en {table}({column})...")
+                session.exec(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({column})"))
+            session.commit()
+            print("✅ Índices de paginación listos")
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
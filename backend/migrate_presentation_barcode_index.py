@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (índice de códigos de barras de presentaciones)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+
+# Búsqueda del escáner por código de barras de presentaciones
+INDEXES = [
+    ("ix_product_presentations_barcode", "product_presentations", "barcode"),
+]
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            for index_name, table, column in INDEXES:
+                print(f"📝 Creando índice '{index_name}' en {table}({column})...")
+                session.exec(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({column})"))
+            session.commit()
+            print("✅ Índices del escáner listos")
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (búsqueda de productos)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.crud.products_crud import product
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            # Verificar si la columna ya existe
+            result = session.exec(
+                text("SELECT column_name FROM information_schema.columns WHERE table_name='products' AND column_name='search_text'")
+            ).first()
+            
+            if result:
+                print("✅ La columna 'search_text' ya existe en la tabla products")
+            else:
+                print("📝 Agregando columna 'search_text' a la tabla products...")
+                session.exec(text("ALTER TABLE products ADD COLUMN search_text VARCHAR"))
+                session.commit()
+                print("✅ Columna 'search_text' agregada exitosamente")
+            
+            print("📝 Calculando texto de búsqueda de los productos...")
+            total = product.refresh_search_text(session)
+            print(f"✅ {total} productos actualizados")
+            
+            # Índice de trigramas: LIKE '%texto%' deja de recorrer toda la tabla
+            print("📝 Creando índice de trigramas sobre products.search_text...")
+            session.exec(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            session.exec(text(
+                "CREATE INDEX IF NOT EXISTS ix_products_search_text_trgm "
+                "ON products USING gin (search_text gin_trgm_ops)"
+            ))
+            session.commit()
+            print("✅ Índice 'ix_products_search_text_trgm' listo")
+            
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (saldo de stock por producto)
+"""
+import os
+import sys
+from sqlmodel import create_engine, Session, SQLModel
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.models.models import ProductStock
+from app.crud.inventario_crud import product_stock
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    # Crear la tabla de saldos si no existe
+    SQLModel.metadata.create_all(engine, tables=[ProductStock.__table__])
+    print("✅ Tabla 'product_stock' lista")
+    
+    with Session(engine) as session:
+        try:
+            print("📝 Calculando saldos de stock desde la tabla inventory...")
+            total = product_stock.rebuild(session)
+            print(f"✅ Saldos calculados para {total} productos")
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (nombre y SKU del producto en sale_details)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+
+COLUMNS = ["product_name", "product_sku"]
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            for column in COLUMNS:
+                # Verificar si la columna ya existe
+                result = session.exec(
+                    text(f"SELECT column_name FROM information_schema.columns WHERE table_name='sale_details' AND column_name='{column}'")
+                ).first()
+                if result:
+                    print(f"✅ La columna '{column}' ya existe en la tabla sale_details")
+                    continue
+                print(f"📝 Agregando columna '{column}' a la tabla sale_details...")
+                session.exec(text(f"ALTER TABLE sale_details ADD COLUMN {column} VARCHAR"))
+                session.commit()
+                print(f"✅ Columna '{column}' agregada exitosamente")
+            
+            # Ventas anteriores: se copian los datos actuales del catálogo
+            print("📝 Copiando nombre y SKU a los detalles existentes...")
+            result = session.exec(text(
+                "UPDATE sale_details SET "
+                "product_name = (SELECT name FROM products WHERE products.id = sale_details.product_id), "
+                "product_sku = (SELECT sku FROM products WHERE products.id = sale_details.product_id) "
+                "WHERE product_name IS NULL"
+            ))
+            print(f"✅ {result.rowcount} detalles actualizados")
+            
+            print("📝 Creando índice 'ix_sale_details_sale_id'...")
+            session.exec(text("CREATE INDEX IF NOT EXISTS ix_sale_details_sale_id ON sale_details (sale_id)"))
+            session.commit()
+            print("✅ Índice creado")
+            
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (apartados de stock por carrito)
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session, SQLModel
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+from app.models.models import StockReservation
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            # Verificar si la columna ya existe
+            result = session.exec(
+                text("SELECT column_name FROM information_schema.columns WHERE table_name='inventory' AND column_name='reserved_quantity'")
+            ).first()
+            
+            if result:
+                print("✅ La columna 'reserved_quantity' ya existe en la tabla inventory")
+            else:
+                print("📝 Agregando columna 'reserved_quantity' a la tabla inventory...")
+                session.exec(text("ALTER TABLE inventory ADD COLUMN reserved_quantity double precision NOT NULL DEFAULT 0.0"))
+                session.commit()
+                print("✅ Columna 'reserved_quantity' agregada exitosamente")
+            
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+    
+    # Crear la tabla de apartados si no existe
+    SQLModel.metadata.create_all(engine, tables=[StockReservation.__table__])
+    print("✅ Tabla 'stock_reservations' lista")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Script para hacer migración de la base de datos (versión propia de los saldos de stock)
+
+Los saldos dejan de usar el contador del catálogo: se versionan con el id
+de la transacción que los escribe (ver product_stock.current_version).
+"""
+import os
+import sys
+from sqlalchemy import text
+from sqlmodel import create_engine, Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import DATABASE_URL
+
+def main():
+    """Ejecutar migración"""
+    engine = create_engine(DATABASE_URL)
+    
+    with Session(engine) as session:
+        try:
+            # Verificar si la columna ya existe
+            result = session.exec(
+                text("SELECT column_name FROM information_schema.columns WHERE table_name='product_stock' AND column_name='stock_version'")
+            ).first()
+            
+            if result:
+                print("✅ La columna 'stock_version' ya existe en la tabla product_stock")
+                return
+            
+            print("📝 Agregando columna 'stock_version' a la tabla product_stock...")
+            session.exec(text("ALTER TABLE product_stock ADD COLUMN stock_version BIGINT NOT NULL DEFAULT 0"))
+            session.exec(text("CREATE INDEX IF NOT EXISTS ix_product_stock_stock_version ON product_stock (stock_version)"))
+            
+            # Los saldos actuales entran con la transacción de la migración:
+            # stock_since=0 los devuelve todos
+            session.exec(text("UPDATE product_stock SET stock_version = txid_current()"))
+            session.exec(text("DROP INDEX IF EXISTS ix_product_stock_catalog_version"))
+            session.exec(text("ALTER TABLE product_stock DROP COLUMN IF EXISTS catalog_version"))
+            session.commit()
+            print("✅ Columna 'stock_version' agregada; los clientes resincronizan el stock una vez")
+            
+        except Exception as e:
+            print(f"❌ Error ejecutando migración: {e}")
+            session.rollback()
+            return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark del listado de productos: queries SQL y tiempo por tamaño de página
+
+Usa la base configurada en DATABASE_URL. Con --seed N agrega N productos de
+prueba (SKU BENCH-*) con categoría, marca y proveedor; --cleanup los borra.
+
+Run: python scripts/benchmark_catalog.py --seed 2000 --sizes 10 100 1000
+"""
+import os
+import sys
+import time
+import argparse
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, delete
+from sqlmodel import Session, select
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.db.database import engine, async_engine
+from app.models.models import Product, Category, Brand, Supplier, Inventory, ProductStock
+
+BENCH_PREFIX = "BENCH-"
+
+
+def seed(total: int) -> None:
+    """Crear productos de prueba repartidos entre pocas categorías, marcas y proveedores"""
+    with Session(engine) as session:
+        categories = [Category(name=f"{BENCH_PREFIX}Categoría {i}") for i in range(10)]
+        brands = [Brand(name=f"{BENCH_PREFIX}Marca {i}") for i in range(10)]
+        suppliers = [
+            Supplier(tax_id=f"{BENCH_PREFIX}{uuid4().hex[:10]}", business_name=f"{BENCH_PREFIX}Proveedor {i}")
+            for i in range(5)
+        ]
+        session.add_all(categories + brands + suppliers)
+        session.flush()
+        products = [
+            Product(
+                sku=f"{BENCH_PREFIX}{uuid4().hex[:12]}",
+                name=f"{BENCH_PREFIX}Producto {i:06d}",
+                category_id=categories[i % len(categories)].id,
+                brand_id=brands[i % len(brands)].id,
+                main_supplier_id=suppliers[i % len(suppliers)].id,
+                sale_price=1.0 + i % 50
+            )
+            for i in range(total)
+        ]
+        session.add_all(products)
+        session.flush()
+        session.add_all([Inventory(product_id=p.id, quantity=10) for p in products])
+        session.add_all([ProductStock(product_id=p.id, quantity=10) for p in products])
+        session.commit()
+    print(f"✅ {total} productos de prueba creados")
+
+
+def cleanup() -> None:
+    """Borrar los datos creados por --seed"""
+    with Session(engine) as session:
+        ids = session.exec(select(Product.id).where(Product.sku.startswith(BENCH_PREFIX))).all()
+        statements = [
+            delete(Category).where(Category.name.startswith(BENCH_PREFIX)),
+            delete(Brand).where(Brand.name.startswith(BENCH_PREFIX)),
+            delete(Supplier).where(Supplier.tax_id.startswith(BENCH_PREFIX)),
+        ]
+        if ids:
+            statements[:0] = [
+                delete(Inventory).where(Inventory.product_id.in_(ids)),
+                delete(ProductStock).where(ProductStock.product_id.in_(ids)),
+                delete(Product).where(Product.id.in_(ids)),
+            ]
+        for statement in statements:
+            session.exec(statement.execution_options(synchronize_session=False))
+        session.commit()
+    print(f"✅ {len(ids)} productos de prueba eliminados")
+
+
+def run(sizes: list[int], repeat: int) -> None:
+    """Medir GET /products para cada tamaño de página"""
+    statements = {"count": 0}
+
+    def count_statement(*args, **kwargs):
+        statements["count"] += 1
+
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", count_statement)
+
+    with TestClient(app) as client:
+        print(f"{'limit':>8} {'filas':>8} {'queries':>8} {'ms':>10}")
+        for size in sizes:
+            best = None
+            for _ in range(repeat):
+                statements["count"] = 0
+                start = time.perf_counter()
+                response = client.get("/products", params={"limit": size})
+                elapsed = (time.perf_counter() - start) * 1000
+                response.raise_for_status()
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{size:>8} {len(response.json()):>8} {statements['count']:>8} {best:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seed", type=int, default=0, help="Productos de prueba a crear antes de medir")
+    parser.add_argument("--cleanup", action="store_true", help="Borrar los productos de prueba al terminar")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed)
+    try:
+        run(args.sizes, args.repeat)
+    finally:
+        if args.cleanup:
+            cleanup()
+
+
+if __name__ == "__main__":
+    main()